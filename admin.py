@@ -0,0 +1,34 @@
+"""Access check for the admin endpoints of the assistant apps"""
+import functools
+import hmac
+
+from flask import jsonify, request
+
+import settings
+
+# Without ADMIN_TOKEN the admin endpoints answer these addresses only
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+def is_admin():
+    """Whether the current request carries ADMIN_TOKEN (without one set: whether it comes straight from localhost)"""
+    if not settings.ADMIN_TOKEN:
+        # Fail closed: a request relayed by a proxy on this host also arrives from localhost
+        forwarded = "X-Forwarded-For" in request.headers or "Forwarded" in request.headers
+        return request.remote_addr in LOCAL_ADDRESSES and not forwarded
+    header = request.headers.get("Authorization", "")
+    token = header[7:] if header.startswith("Bearer ") else request.args.get("token", "")
+    # Bytes: compare_digest refuses str with non-ASCII characters
+    return hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode())
+
+
+def admin_required(view):
+    """Reject the request unless it carries ADMIN_TOKEN (or, when none is set, comes from localhost)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            if not settings.ADMIN_TOKEN:
+                return jsonify({"error": "Set ADMIN_TOKEN to use the admin endpoints from another host."}), 403
+            return jsonify({"error": "Admin token required."}), 401
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,267 @@
+"""Audit log of every answered question, and the queries run on it
+
+Each traced question (see traffic.py) is recorded with its answer, status,
+stage timings, retrieved document ids and how the caches served it. Records
+go into a ``collections.deque``, whose appends are atomic and never block,
+so a request pays for the append and nothing else. A writer thread takes
+them out in batches and inserts each batch with one ``executemany``
+transaction. The target is its own WAL-mode database (``AUDIT_DB``), kept
+apart from the catalog so the log writer never competes with orders.
+
+Backpressure: once ``AUDIT_BATCH`` records are waiting, the writer is woken
+at once instead of at its next ``AUDIT_FLUSH_INTERVAL_MS``. When
+``AUDIT_QUEUE_SIZE`` are waiting, new records are dropped and counted.
+A record that cannot be turned into a row is dropped and counted as
+invalid; it never stops the writer.
+
+``top_questions``, ``slowest_stages``, ``slowest_requests`` and
+``cache_hit_ratios`` answer the usual tuning questions. They are served at
+/debug/audit/* and from the command line:
+
+    python audit_log.py top-questions --tenant sales --hours 24
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import settings
+
+# Stage columns of qa_log, from the Server-Timing names of traffic.py
+STAGES = ("retrieval", "llm_wait", "llm", "ttft", "total")
+
+
+def connect(db_path):
+    """Connection to the audit database, schema created if needed"""
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS qa_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        request_id TEXT,
+                        ts REAL,
+                        tenant TEXT,
+                        endpoint TEXT,
+                        session_id TEXT,
+                        question TEXT,
+                        normalized TEXT,
+                        answer TEXT,
+                        status INTEGER,
+                        {", ".join(f"{stage}_ms REAL" for stage in STAGES)},
+                        retrieval_cache TEXT,
+                        faq TEXT,
+                        doc_ids TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS qa_log_tenant_ts ON qa_log (tenant, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS qa_log_normalized ON qa_log (normalized)")
+    conn.commit()
+    return conn
+
+
+COLUMNS = ("request_id", "ts", "tenant", "endpoint", "session_id", "question", "normalized", "answer", "status",
+           *(f"{stage}_ms" for stage in STAGES), "retrieval_cache", "faq", "doc_ids")
+INSERT = f"INSERT INTO qa_log ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def to_row(trace, answer):
+    """qa_log values of a finished trace"""
+    # Imported here: retrieval_cache imports traffic, which records into this module
+    from retrieval_cache import normalize_question
+
+    body = trace.get("body", {})
+    stages = trace.get("stages", {})
+    question = body.get("question") or ""
+    return (
+        trace.get("request_id"), trace.get("ts"), trace.get("tenant"), trace.get("endpoint"),
+        body.get("session_id"), question, normalize_question(question), answer, trace.get("status"),
+        *(stages.get(stage) for stage in STAGES),
+        trace.get("retrieval_cache"), trace.get("faq"), json.dumps(trace.get("doc_ids") or []),
+    )
+
+
+class AuditLog:
+    """Batches question records into the audit database from a background thread"""
+
+    def __init__(self, db_path, queue_size=None, batch_size=None, flush_interval_ms=None):
+        self.db_path = db_path
+        self.queue_size = queue_size or settings.AUDIT_QUEUE_SIZE
+        self.batch_size = batch_size or settings.AUDIT_BATCH
+        self.flush_interval = (settings.AUDIT_FLUSH_INTERVAL_MS if flush_interval_ms is None
+                               else flush_interval_ms) / 1000
+        self._queue = deque()
+        self._wake = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.transactions = 0
+        self.invalid = 0
+        self.errors = 0
+        self.last_error = None
+        # Schema first, so the query endpoints work before the first flush
+        connect(db_path).close()
+        threading.Thread(target=self._run, name="audit-log", daemon=True).start()
+
+    def record(self, trace, answer=None):
+        """Queue a finished trace; never blocks"""
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._queue.append((trace, answer))
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    try:
+                        batch.append(to_row(*self._queue.popleft()))
+                    except Exception as e:
+                        self.invalid += 1
+                        self.dropped += 1
+                        self.last_error = f"invalid record: {e!r}"
+                if not batch:
+                    continue
+                try:
+                    with conn:
+                        conn.executemany(INSERT, batch)
+                    self.written += len(batch)
+                    self.transactions += 1
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    self.dropped += len(batch)
+                    self.last_error = str(e)
+
+    def stats(self):
+        return {
+            "path": self.db_path,
+            "pending": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "transactions": self.transactions,
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+_audit_log = None
+_audit_lock = threading.Lock()
+
+
+def get_audit_log():
+    """The process-wide audit log, None unless AUDIT_DB is set"""
+    global _audit_log
+    if not settings.AUDIT_DB:
+        return None
+    with _audit_lock:
+        if _audit_log is None:
+            from tenants import shared
+
+            _audit_log = shared("audit", lambda: AuditLog(settings.AUDIT_DB))
+        return _audit_log
+
+
+def _where(tenant, since):
+    clauses, params = [], []
+    if tenant:
+        clauses.append("tenant = ?")
+        params.append(tenant)
+    if since:
+        clauses.append("ts >= ?")
+        params.append(since)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def top_questions(conn, tenant=None, since=None, limit=20):
+    """Most asked questions (by normalized text) with their mean latency and FAQ hits"""
+    where, params = _where(tenant, since)
+    rows = conn.execute(f'''SELECT normalized, COUNT(*), MIN(question), AVG(total_ms),
+                                   SUM(faq = 'hit'), SUM(status >= 400)
+                            FROM qa_log{where}
+                            GROUP BY normalized ORDER BY COUNT(*) DESC LIMIT ?''', (*params, limit)).fetchall()
+    return [{"question": example, "normalized": normalized, "count": count,
+             "mean_total_ms": round(mean or 0.0, 2), "faq_hits": faq_hits or 0, "errors": errors or 0}
+            for normalized, count, example, mean, faq_hits, errors in rows]
+
+
+def slowest_stages(conn, tenant=None, since=None):
+    """Mean, p50, p95 and max milliseconds of every stage, slowest mean first"""
+    where, params = _where(tenant, since)
+    found = []
+    for stage in STAGES:
+        column = f"{stage}_ms"
+        filtered = f"{where} {'AND' if where else 'WHERE'} {column} IS NOT NULL"
+        count, mean, top = conn.execute(f"SELECT COUNT(*), AVG({column}), MAX({column}) FROM qa_log{filtered}",
+                                        params).fetchone()
+        if not count:
+            continue
+
+        def percentile(pct):
+            offset = min(count - 1, int(pct / 100 * count))
+            return conn.execute(f"SELECT {column} FROM qa_log{filtered} ORDER BY {column} LIMIT 1 OFFSET ?",
+                                (*params, offset)).fetchone()[0]
+
+        found.append({"stage": stage, "count": count, "mean_ms": round(mean, 2), "p50_ms": round(percentile(50), 2),
+                      "p95_ms": round(percentile(95), 2), "max_ms": round(top, 2)})
+    return sorted(found, key=lambda s: -s["mean_ms"])
+
+
+def slowest_requests(conn, tenant=None, since=None, limit=20):
+    """The slowest questions with their stage timings"""
+    where, params = _where(tenant, since)
+    stages = ", ".join(f"{stage}_ms" for stage in STAGES)
+    rows = conn.execute(f'''SELECT request_id, ts, tenant, question, status, {stages}
+                            FROM qa_log{where} ORDER BY total_ms DESC LIMIT ?''', (*params, limit)).fetchall()
+    return [{"request_id": row[0], "ts": row[1], "tenant": row[2], "question": row[3], "status": row[4],
+             "stages_ms": {stage: value for stage, value in zip(STAGES, row[5:]) if value is not None}}
+            for row in rows]
+
+
+def cache_hit_ratios(conn, tenant=None, since=None):
+    """Retrieval cache and FAQ outcomes per tenant"""
+    where, params = _where(tenant, since)
+    ratios = {}
+    for column in ("retrieval_cache", "faq"):
+        rows = conn.execute(f'''SELECT tenant, {column}, COUNT(*) FROM qa_log{where}
+                                GROUP BY tenant, {column}''', params).fetchall()
+        for row_tenant, outcome, count in rows:
+            entry = ratios.setdefault(row_tenant, {}).setdefault(column, {"questions": 0})
+            entry["questions"] += count
+            entry[outcome or "none"] = count
+    for entry in ratios.values():
+        for column, counts in entry.items():
+            hits = counts.get("hit", 0) + counts.get("lsh_hit", 0)
+            counts["hit_ratio"] = round(hits / counts["questions"], 4) if counts["questions"] else 0.0
+    return ratios
+
+
+QUERIES = {
+    "top-questions": top_questions,
+    "stages": slowest_stages,
+    "slowest": slowest_requests,
+    "cache": cache_hit_ratios,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the question audit log")
+    parser.add_argument("query", choices=sorted(QUERIES))
+    parser.add_argument("--db", default=settings.AUDIT_DB or "audit.db")
+    parser.add_argument("--tenant")
+    parser.add_argument("--hours", type=float, help="only the last N hours")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    since = time.time() - args.hours * 3600 if args.hours else None
+    kwargs = {"limit": args.limit} if args.query in ("top-questions", "slowest") else {}
+    print(json.dumps(QUERIES[args.query](conn, args.tenant, since, **kwargs), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
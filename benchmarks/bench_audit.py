@@ -0,0 +1,105 @@
+"""Cost of the audit log on the request path
+
+    python -m benchmarks.bench_audit
+    python -m benchmarks.bench_audit --records 100000 --threads 8 --queue-size 5000
+
+Compares what a request pays to log one question:
+
+- ``sync``: an INSERT and commit on a WAL database, as ``ask()`` would do
+  inline (synchronous=FULL, the SQLite default).
+- ``queued``: ``AuditLog.record``, with the batching writer running.
+
+It then reports how long the writer took to drain everything, its
+transactions, and the records dropped when ``--threads`` producers outrun a
+``--queue-size`` queue.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.common import summarize, write_results
+
+
+def trace(i):
+    return {
+        "request_id": uuid.uuid4().hex, "ts": time.time(), "tenant": "sales", "endpoint": "ask",
+        "body": {"question": f"ongkir ke kota {i % 50}", "session_id": "s1"},
+        "doc_ids": ["shipping_info"], "retrieval_cache": "hit" if i % 3 else "miss",
+        "stages": {"retrieval": 1.2, "llm_wait": 0.1, "llm": 850.0, "ttft": 120.0, "total": 852.0},
+        "status": 200,
+    }
+
+
+def bench_sync(path, records):
+    from audit_log import INSERT, connect, to_row
+
+    conn = connect(path)
+    conn.execute("PRAGMA synchronous=FULL")
+    samples = []
+    for i in range(records):
+        start = time.perf_counter()
+        conn.execute(INSERT, to_row(trace(i), "Shipping Fee: Rp20000"))
+        conn.commit()
+        samples.append((time.perf_counter() - start) * 1000)
+    conn.close()
+    return summarize(samples)
+
+
+def bench_queued(path, records, threads, queue_size):
+    from audit_log import AuditLog
+
+    log = AuditLog(path, queue_size=queue_size)
+    traces = [trace(i) for i in range(records)]
+    per_thread = records // threads
+    samples = [[] for _ in range(threads)]
+
+    def produce(n):
+        for t in traces[n * per_thread:(n + 1) * per_thread]:
+            start = time.perf_counter()
+            log.record(t, "Shipping Fee: Rp20000")
+            samples[n].append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=produce, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    produced = time.perf_counter() - start
+    while log.stats()["pending"] or log.written + log.dropped < per_thread * threads:
+        time.sleep(0.01)
+    drained = time.perf_counter() - start
+    result = summarize([s for thread in samples for s in thread])
+    result.update({"produce_s": round(produced, 3), "drain_s": round(drained, 3), **log.stats()})
+    result.pop("path")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--sync-records", type=int, default=2000, help="records for the synchronous baseline")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "sync": bench_sync(os.path.join(tmp, "sync.db"), args.sync_records),
+            "queued": bench_queued(os.path.join(tmp, "queued.db"), args.records, args.threads, args.queue_size),
+        }
+        count = sqlite3.connect(os.path.join(tmp, "queued.db")).execute("SELECT COUNT(*) FROM qa_log").fetchone()[0]
+    for name, result in results.items():
+        print(f"{name:7} per record p50 {result['p50_ms'] * 1000:8.1f} us  p99 {result['p99_ms'] * 1000:8.1f} us")
+    queued = results["queued"]
+    print(f"writer: {queued['written']} rows ({count} in the database) in {queued['transactions']} transactions, "
+          f"drained in {queued['drain_s']} s, dropped {queued['dropped']}")
+    print("Results written to", write_results("audit", results))
+
+
+if __name__ == "__main__":
+    main()
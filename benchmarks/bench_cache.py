@@ -0,0 +1,148 @@
+"""Cache backend throughput and catalog invalidation latency
+
+    python -m benchmarks.bench_cache
+    python -m benchmarks.bench_cache --backends sqlite,resp --ops 50000 --nodes 8
+    python -m benchmarks.bench_cache --url redis://127.0.0.1:6379/0
+
+Part one times ``get`` (hit and miss) and ``set`` on every backend of
+cache_backends.py with values the size of a retrieval context. Without
+``--url`` the Redis-protocol backend runs against stub_redis.py started
+in this process, so its numbers are a floor on the round trip, not on Redis.
+
+Part two measures how long a catalog change takes to reach the caches:
+
+- ``workers``: ``--workers`` watchers on one database (one host), no bus.
+- ``nodes``: ``--nodes`` watchers on their own database copies, each with
+  its own bus connection (one per node); the change is written to the
+  first copy only and must arrive through the bus.
+
+Each change is timed from the commit until every watcher's version token
+changed.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import settings
+from benchmarks.common import summarize, write_results
+
+VALUE = [["1", "2", "3"], "Product Name: Kemeja Flanel, Category: Pakaian, Price: Rp150000, Stock: 12. " * 16]
+
+
+def make_catalog(path):
+    from catalog_version import install_version_tracking
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS barang (id INTEGER PRIMARY KEY, nama TEXT, harga INTEGER)")
+    install_version_tracking(conn, ["barang"])
+    conn.execute("INSERT INTO barang (nama, harga) VALUES ('Kemeja Flanel', 150000)")
+    conn.commit()
+    return conn
+
+
+def bench_backend(cache, ops):
+    keys = [f"q:1:question {i}" for i in range(ops)]
+    results = {}
+    for name, fn in (("set", lambda key: cache.set(key, VALUE)),
+                     ("get_hit", cache.get),
+                     ("get_miss", lambda key: cache.get(key + " missing"))):
+        start = time.perf_counter()
+        for key in keys:
+            fn(key)
+        elapsed = time.perf_counter() - start
+        results[name] = {"ops_per_s": round(ops / elapsed), "us_per_op": round(elapsed / ops * 1e6, 2)}
+    if cache.get(keys[-1]) != VALUE:
+        raise SystemExit(f"{type(cache).__name__} returned a different value than was stored")
+    cache.clear()
+    return results
+
+
+def wait_for_change(watchers, before, timeout=5.0):
+    start = time.perf_counter()
+    pending = set(range(len(watchers)))
+    arrivals = []
+    while pending and time.perf_counter() - start < timeout:
+        for i in list(pending):
+            if watchers[i].current() != before[i]:
+                pending.discard(i)
+                arrivals.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.0002)
+    return arrivals, len(pending)
+
+
+def bench_invalidation(writer, watchers, changes):
+    """Commit-to-every-watcher latency of catalog changes"""
+    all_seen, slowest, missed = [], [], 0
+    for i in range(changes):
+        before = [watcher.current() for watcher in watchers]
+        writer.execute("UPDATE barang SET harga = ? WHERE id = 1", (150000 + i + 1,))
+        writer.commit()
+        arrivals, lost = wait_for_change(watchers, before)
+        missed += lost
+        all_seen += arrivals
+        if arrivals and not lost:
+            slowest.append(max(arrivals))
+        # Let every watcher settle before the next change
+        time.sleep(0.05)
+    return {"every_watcher": summarize(slowest), "per_watcher": summarize(all_seen), "missed": missed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="memory,sqlite,resp")
+    parser.add_argument("--url", help="Redis-protocol server to use instead of the in-process stand-in")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--changes", type=int, default=50)
+    parser.add_argument("--interval-ms", type=float, default=None, help="watcher poll interval")
+    args = parser.parse_args()
+
+    from cache_backends import RESPBus, make_cache
+    from catalog_version import CatalogWatcher
+    from stub_redis import StubRedis
+
+    stub = None
+    url = args.url
+    if not url:
+        stub = StubRedis(("127.0.0.1", 0)).start()
+        url = stub.url
+    settings.CACHE_URL = url
+
+    results = {"url": url, "backends": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.CACHE_PATH = os.path.join(tmp, "cache.db")
+        for backend in args.backends.split(","):
+            cache = make_cache("bench", backend, max_entries=args.ops)
+            results["backends"][backend] = result = bench_backend(cache, args.ops)
+            print(f"{backend:7} " + "  ".join(f"{name} {r['ops_per_s']:8} ops/s ({r['us_per_op']:7.2f} us)"
+                                              for name, r in result.items()))
+
+        db_path = os.path.join(tmp, "catalog.db")
+        writer = make_catalog(db_path)
+        watchers = [CatalogWatcher(db_path, "catalog:bench", interval_ms=args.interval_ms).start()
+                    for _ in range(args.workers)]
+        results["workers"] = bench_invalidation(writer, watchers, args.changes)
+
+        copies = [db_path] + [os.path.join(tmp, f"node{i}.db") for i in range(1, args.nodes)]
+        for path in copies[1:]:
+            make_catalog(path).close()
+        nodes = [CatalogWatcher(path, "catalog:bench", bus=RESPBus(url), interval_ms=args.interval_ms).start()
+                 for path in copies]
+        time.sleep(0.2)
+        results["nodes"] = bench_invalidation(writer, nodes, args.changes)
+        writer.close()
+
+    for name, count in (("workers", args.workers), ("nodes", args.nodes)):
+        result = results[name]
+        print(f"{count} {name:7} commit -> every watcher p50 {result['every_watcher']['p50_ms']:7.2f} ms  "
+              f"p99 {result['every_watcher']['p99_ms']:7.2f} ms  missed {result['missed']}")
+    print("Results written to", write_results("cache", results))
+    if stub is not None:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Data-layer and rendering costs of the apps at catalog scale
+
+    python -m benchmarks.bench_catalog --scales 10000,100000
+    python -m benchmarks.bench_catalog --scales 1000000 --apps inventory --repeat 3
+    python -m benchmarks.bench_catalog --baseline benchmarks/results/catalog-<stamp>.json
+
+For every scale and app, a scratch database gets the app's schema
+(``init_db``) and a synthetic catalog (benchmarks/catalog_gen.py). The
+script then times the functions a request or a start goes through:
+
+- the getters, ``search_product`` and ``check_low_stock``
+- a variant filter ("size M under Rp200.000 in stock") through the
+  barang_varian indexes (``filter_indexed``, ``variant_context``) and, for
+  comparison, by splitting the text column of every row (``filter_split``)
+- ``build_documents`` and ``format_docs``
+- the home page, rendered through the blueprint
+- the suggest index build and a prefix query
+- ``init_db`` on the filled database
+
+Each case is timed over ``--repeat`` runs. One extra run under tracemalloc
+measures its allocation peak. Nothing loads a model or reaches Ollama:
+``init()`` is never called, so the whole suite runs offline.
+``--baseline`` prints the p50 change against an earlier results file.
+"""
+import argparse
+import importlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import settings
+from benchmarks.catalog_gen import APP_TABLES, populate, scale_plan
+from benchmarks.common import summarize, timed, write_results
+
+APPS = {"store": "chatbot", "sales": "run4-penjualan-andorder", "inventory": "run5-inventoryproject"}
+
+SUGGEST_KINDS = {"store": ["barang", "kota"], "sales": ["barang", "kota"], "inventory": ["barang", "project", "instansi"]}
+
+QUESTIONS = {
+    "store": "kemeja flanel",
+    "sales": "kemeja flanel",
+    "inventory": "Project Gedung Polri 00001 pakai baut apa saja",
+}
+
+# Variant and price cap of the filter cases
+FILTERS = {
+    "store": ("M", 200000, "ada ukuran M di bawah Rp200.000?"),
+    "sales": ("M", 200000, "ada ukuran M di bawah Rp200.000?"),
+    "inventory": ("Samsung", 200000, "merk Samsung di bawah Rp200.000 apa saja?"),
+}
+
+
+def load_app(app, db_path):
+    """The app module with its database pointed at db_path (init() is not run)"""
+    module = importlib.import_module(APPS[app])
+    module.db_path = db_path
+    return module
+
+
+def split_filter(db_path, column, varian, max_harga):
+    """The variant filter as it ran before barang_varian: every row read and its text split"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(f"SELECT id, nama, harga, kategori, {column}, stok FROM barang").fetchall()
+    finally:
+        conn.close()
+    return [row for row in rows
+            if row[5] and row[2] <= max_harga and varian in [v.strip() for v in row[4].split(",")]]
+
+
+def cases(app, module, db_path):
+    """(name, callable) pairs timed for an app"""
+    from flask import Flask
+    from project_rollup import project_summaries, structured_context
+    from retrieval_cache import format_docs
+    from suggest_index import SuggestIndex
+    from variants import find_items, variant_context
+
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(module.bp)
+    client = flask_app.test_client()
+    documents = module.build_documents()
+    index = SuggestIndex(db_path, SUGGEST_KINDS[app])
+    query = QUESTIONS[app].split()[0]
+
+    def with_conn(fn, *args, **kwargs):
+        def run():
+            conn = sqlite3.connect(db_path)
+            try:
+                return fn(conn, *args, **kwargs)
+            finally:
+                conn.close()
+        return run
+
+    found = [("get_barang", module.get_barang)]
+    if app == "inventory":
+        found += [
+            ("get_project", module.get_project),
+            ("get_project_barang", module.get_project_barang),
+            ("project_summaries", with_conn(project_summaries)),
+            ("structured_context", with_conn(structured_context, QUESTIONS[app])),
+        ]
+    else:
+        found.append(("get_ongkir", module.get_ongkir))
+    if hasattr(module, "search_product"):
+        found += [("search_product", lambda: module.search_product(query)),
+                  ("check_low_stock", module.check_low_stock)]
+    column = APP_TABLES[app][0]
+    varian, max_harga, question = FILTERS[app]
+    found += [
+        ("filter_indexed", with_conn(find_items, column, varian=varian, max_harga=max_harga, in_stock=True)),
+        ("filter_split", lambda: split_filter(db_path, column, varian, max_harga)),
+        ("variant_context", with_conn(variant_context, question, column)),
+    ]
+    found += [
+        ("build_documents", module.build_documents),
+        ("format_docs", lambda: format_docs(documents)),
+        ("home_get", lambda: client.get("/").data),
+    ]
+    if hasattr(module, "search_product"):
+        found.append(("home_search", lambda: client.post("/", data={"search_query": query}).data))
+    found += [
+        ("suggest_index_build", lambda: SuggestIndex(db_path, SUGGEST_KINDS[app])),
+        ("suggest_query", lambda: index.suggest(query[:3])),
+        ("init_db", module.init_db),
+    ]
+    return found
+
+
+def peak_bytes(fn):
+    """Allocation peak of one call, from tracemalloc"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def run_scale(app, products, repeat, memory, seed, tmp):
+    db_path = os.path.join(tmp, f"{app}-{products}.db")
+    module = load_app(app, db_path)
+    module.init_db()
+    conn = sqlite3.connect(db_path)
+    plan = scale_plan(products)
+    _, populate_ms = timed(populate, conn, app, plan, seed)
+    conn.close()
+    results = {"plan": plan, "populate_ms": round(populate_ms, 1),
+               "db_bytes": os.path.getsize(db_path), "cases": {}}
+    for name, fn in cases(app, module, db_path):
+        samples = [timed(fn)[1] for _ in range(repeat)]
+        result = summarize(samples)
+        if memory:
+            result["peak_bytes"] = peak_bytes(fn)
+        results["cases"][name] = result
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    for scale, apps in results.items():
+        for app, result in apps.items():
+            before = baseline.get(scale, {}).get(app, {}).get("cases", {})
+            for name, case in result["cases"].items():
+                if name in before and before[name]["p50_ms"]:
+                    change = (case["p50_ms"] / before[name]["p50_ms"] - 1) * 100
+                    print(f"{scale:>8} {app:9} {name:20} p50 {before[name]['p50_ms']:10.2f} -> "
+                          f"{case['p50_ms']:10.2f} ms ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10000,100000", help="catalog sizes (items), comma separated")
+    parser.add_argument("--apps", default=",".join(APPS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak runs")
+    parser.add_argument("--baseline", help="earlier catalog results file to compare p50 with")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Nothing the apps derive from TENANT_DATA_DIR may land next to the real databases
+        settings.TENANT_DATA_DIR = tmp
+        # Every case is timed as one client
+        settings.RATE_LIMIT = 0
+        for scale in [int(s) for s in args.scales.split(",")]:
+            for app in args.apps.split(","):
+                start = time.perf_counter()
+                result = run_scale(app, scale, max(1, args.repeat), not args.no_memory, args.seed, tmp)
+                results.setdefault(str(scale), {})[app] = result
+                print(f"{app} with {scale} items: populated in {result['populate_ms'] / 1000:.1f} s, "
+                      f"database {result['db_bytes'] / 2**20:.1f} MB")
+                for name, case in result["cases"].items():
+                    peak = f"  peak {case['peak_bytes'] / 2**20:8.1f} MB" if "peak_bytes" in case else ""
+                    print(f"  {name:20} p50 {case['p50_ms']:10.2f} ms  p95 {case['p95_ms']:10.2f} ms{peak}")
+                print(f"  ({time.perf_counter() - start:.1f} s)")
+    print("Results written to", write_results("catalog", results))
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Concurrent checkout stress test for the order writer
+
+    python -m benchmarks.bench_checkout --threads 300 --checkouts 3000
+
+Hundreds of threads check out random carts against a scratch copy of the
+run4 schema while stock runs out; a share of the requests are retries with
+an idempotency key already used. Every mode is checked afterwards: no stock
+below zero, stock sold equals the quantities in order_items (per item and
+per size), one order per idempotency key. ``direct`` places each order on its own connection with
+``BEGIN IMMEDIATE`` for comparison and counts "database is locked" errors.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.common import summarize, write_results
+from orders import OrderError, OrderWriter, OutOfStock, connect, init_order_tables, place_order
+from variants import install_variants
+
+BARANG = [
+    ("Baju Kemeja", 100000, "Pakaian", "S,M,L,XL"),
+    ("Celana Cino", 180000, "Pakaian", "M,L,XL"),
+    ("Topi Kinz", 50000, "Aksesoris", "All Size"),
+]
+ONGKIR = [("Jakarta", 20000), ("Bandung", 15000), ("Surabaya", 25000), ("Luar Kota", 45000)]
+
+
+def make_db(path, stock):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE barang (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        nama TEXT, harga INTEGER, kategori TEXT, ukuran TEXT, stok INTEGER)''')
+    conn.execute("CREATE TABLE ongkir (id INTEGER PRIMARY KEY AUTOINCREMENT, kota TEXT, biaya INTEGER)")
+    conn.executemany("INSERT INTO barang (nama, harga, kategori, ukuran, stok) VALUES (?, ?, ?, ?, ?)",
+                     [row + (stock,) for row in BARANG])
+    conn.executemany("INSERT INTO ongkir (kota, biaya) VALUES (?, ?)", ONGKIR)
+    init_order_tables(conn)
+    # The item's stock is split over its sizes
+    install_variants(conn, "ukuran")
+    conn.commit()
+    conn.close()
+
+
+def random_cart(rng):
+    items = []
+    for nama, _, _, ukuran in rng.sample(BARANG, rng.randint(1, 2)):
+        items.append({"nama": nama, "qty": rng.randint(1, 3), "ukuran": rng.choice(ukuran.split(","))})
+    return items, rng.choice(ONGKIR)[0]
+
+
+class DirectCheckout:
+    """Every caller writes on its own connection, as a naive handler would"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.locked = 0
+
+    def checkout(self, items, kota, idempotency_key=None):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = connect(self.db_path)
+            conn.execute("PRAGMA busy_timeout=5000")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            order = place_order(conn, items, kota, idempotency_key)
+            conn.execute("COMMIT")
+            return order
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if "locked" in str(e):
+                self.locked += 1
+            raise OrderError(str(e))
+        except OrderError:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def run(checkout, threads, checkouts, retry_share, seed):
+    latencies, outcomes = [], {"placed": 0, "replayed": 0, "out_of_stock": 0, "error": 0}
+    lock = threading.Lock()
+    per_thread = checkouts // threads
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        local, counts, keys = [], dict.fromkeys(outcomes, 0), []
+        for i in range(per_thread):
+            if keys and rng.random() < retry_share:
+                key, items, kota = rng.choice(keys)
+            else:
+                items, kota = random_cart(rng)
+                key = f"{n}-{i}"
+                keys.append((key, items, kota))
+            start = time.perf_counter()
+            try:
+                order = checkout(items, kota, idempotency_key=key)
+                counts["replayed" if order["replayed"] else "placed"] += 1
+            except OutOfStock:
+                counts["out_of_stock"] += 1
+            except OrderError:
+                counts["error"] += 1
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+            for name, value in counts.items():
+                outcomes[name] += value
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"checkouts_per_sec": round(len(latencies) / elapsed, 1), **outcomes, **summarize(latencies)}
+
+
+def initial_sizes(db_path):
+    conn = sqlite3.connect(db_path)
+    sizes = {(i, v): n for i, v, n in conn.execute("SELECT barang_id, varian, stok FROM barang_varian")}
+    conn.close()
+    return sizes
+
+
+def check(db_path, stock, sizes):
+    conn = sqlite3.connect(db_path)
+    remaining = dict(conn.execute("SELECT id, stok FROM barang"))
+    sold = dict(conn.execute("SELECT barang_id, SUM(qty) FROM order_items GROUP BY barang_id"))
+    remaining_sizes = {(i, v): n for i, v, n in conn.execute("SELECT barang_id, varian, stok FROM barang_varian")}
+    sold_sizes = {(i, v): n for i, v, n in conn.execute(
+        "SELECT barang_id, ukuran, SUM(qty) FROM order_items GROUP BY barang_id, ukuran")}
+    duplicates = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT idempotency_key FROM orders GROUP BY idempotency_key HAVING COUNT(*) > 1)"
+    ).fetchone()[0]
+    conn.close()
+    consistent = all(remaining[i] >= 0 and remaining[i] + sold.get(i, 0) == stock for i in remaining)
+    consistent = consistent and all(n >= 0 and n + sold_sizes.get(k, 0) == sizes[k] for k, n in remaining_sizes.items())
+    return {"consistent": consistent and duplicates == 0, "units_sold": sum(sold.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=300)
+    parser.add_argument("--checkouts", type=int, default=3000)
+    parser.add_argument("--stock", type=int, default=2000, help="initial stock per item")
+    parser.add_argument("--retry-share", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = [("writer_batched", None), ("writer_unbatched", 1), ("direct", "direct")]
+        for name, mode in modes:
+            db_path = os.path.join(tmp, f"{name}.db")
+            make_db(db_path, args.stock)
+            sizes = initial_sizes(db_path)
+            if mode == "direct":
+                target = DirectCheckout(db_path)
+            else:
+                target = OrderWriter(db_path, max_batch=mode).start()
+            result = run(target.checkout, args.threads, args.checkouts, args.retry_share, args.seed)
+            result.update(check(db_path, args.stock, sizes))
+            if mode == "direct":
+                result["locked_errors"] = target.locked
+            else:
+                result["writer"] = target.stats()
+            results[name] = result
+            print(f"{name:17} {result['checkouts_per_sec']:>8} checkouts/s  p50 {result['p50_ms']:.2f} ms  "
+                  f"p99 {result['p99_ms']:.2f} ms  placed {result['placed']}  sold out {result['out_of_stock']}  "
+                  f"errors {result['error']}  consistent {result['consistent']}")
+    print("Results written to", write_results("checkout", results))
+
+
+if __name__ == "__main__":
+    main()
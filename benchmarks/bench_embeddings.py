@@ -0,0 +1,103 @@
+"""Embeddings/sec and latency of direct vs micro-batched query embedding
+
+    python -m benchmarks.bench_embeddings --threads 32 --requests 2000
+    python -m benchmarks.bench_embeddings --fake   # no model download
+
+``--fake`` replaces FastEmbed with a model that costs a fixed overhead per
+call plus a smaller cost per text and runs one call at a time, like an ONNX
+session that already uses every core.
+"""
+import argparse
+import threading
+import time
+from array import array
+
+from benchmarks.common import summarize, write_results
+from embedding_service import BatchingEmbedder, EmbeddingClient, EmbeddingServer
+
+QUESTIONS = [
+    "berapa ongkir ke Jakarta untuk 2 Baju Kemeja ukuran M?",
+    "barang yang tersedia",
+    "ongkos kirim ke Surabaya",
+    "apakah Topi Kinz masih ada?",
+    "total belanja 1 Celana Cino dan 3 Baju Kemeja ke Bandung",
+]
+
+
+class FakeModel:
+    def __init__(self, call_ms=8.0, text_ms=0.5, dim=1024):
+        self.call_ms, self.text_ms, self.dim = call_ms, text_ms, dim
+        self._lock = threading.Lock()
+        # Mimic FastEmbedEmbeddings, whose _model embeds lists of queries
+        self._model = self
+
+    def query_embed(self, texts):
+        with self._lock:
+            time.sleep((self.call_ms + self.text_ms * len(texts)) / 1000)
+        return [array("f", bytes(4 * self.dim)) for _ in texts]
+
+    def embed_query(self, text):
+        return self.query_embed([text])[0].tolist()
+
+    def embed_documents(self, texts):
+        return [vector.tolist() for vector in self.query_embed(texts)]
+
+
+def run(embedder, threads, requests):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker(n):
+        local = []
+        for i in range(per_thread):
+            start = time.perf_counter()
+            embedder.embed_query(QUESTIONS[(n + i) % len(QUESTIONS)])
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"embeddings_per_sec": round(len(latencies) / elapsed, 1), **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--fake", action="store_true", help="use a simulated model")
+    parser.add_argument("--socket", default="/tmp/bench-embeddings.sock")
+    args = parser.parse_args()
+
+    if args.fake:
+        base = FakeModel()
+    else:
+        from embedding_service import _fastembed
+        base = _fastembed("intfloat/multilingual-e5-large")
+    batching = BatchingEmbedder(base, max_wait_ms=args.max_wait_ms)
+    server = EmbeddingServer(args.socket, batching)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {}
+    for name, embedder in (
+        ("direct", base),
+        ("batched_in_process", batching),
+        ("batched_unix_socket", EmbeddingClient(args.socket)),
+    ):
+        results[name] = run(embedder, args.threads, args.requests)
+        print(f"{name:22} {results[name]['embeddings_per_sec']:>9} emb/s  "
+              f"p50 {results[name]['p50_ms']:.2f} ms  p99 {results[name]['p99_ms']:.2f} ms")
+    results["batcher"] = batching.stats()
+    server.shutdown()
+    print("Results written to", write_results("embeddings", results))
+
+
+if __name__ == "__main__":
+    main()
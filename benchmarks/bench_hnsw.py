@@ -0,0 +1,72 @@
+"""Recall/latency trade-off of the HNSW snapshot index for M and ef
+
+    python -m benchmarks.bench_hnsw --size 10000 --M 8 16 32 --ef 16 32 64 128
+
+For every M the index is built once (build time and snapshot load time are
+reported), then each ef_search value is measured for recall@k against exact
+search and query latency.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_quantization import clustered
+from benchmarks.common import summarize, write_results
+from hnsw_index import HNSWIndex
+
+DIM = 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--ef-construction", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    docs = clustered(args.size, max(1, args.size // 50), 0.6, rng)
+    queries = clustered(args.queries, max(1, args.size // 50), 0.6, rng)
+    truth = [set(np.argsort(-(docs @ q))[:args.k].tolist()) for q in queries]
+
+    results = {}
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-hnsw-"), "bench.hnsw")
+    for M in args.M:
+        index = HNSWIndex(DIM, M=M, ef_construction=args.ef_construction)
+        start = time.perf_counter()
+        index.add(docs)
+        build_s = time.perf_counter() - start
+        index.save(path, catalog_version=1, documents={"ids": [], "texts": [], "metadatas": []})
+        start = time.perf_counter()
+        loaded, _, _ = HNSWIndex.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        for ef in args.ef:
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = loaded.search(query, args.k, ef=ef)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(expected & {row for _, row in found})
+            row = {
+                "build_s": round(build_s, 2),
+                "snapshot_bytes": os.path.getsize(path),
+                "load_ms": round(load_ms, 3),
+                f"recall@{args.k}": round(hits / (args.k * len(queries)), 4),
+                "query": summarize(latencies),
+            }
+            results[f"M{M}-ef{ef}"] = row
+            print(f"M={M:<3} ef={ef:<4} build {build_s:7.1f} s  load {load_ms:6.2f} ms  "
+                  f"recall@{args.k} {row[f'recall@{args.k}']:.4f}  p50 {row['query']['p50_ms']:.3f} ms  "
+                  f"p99 {row['query']['p99_ms']:.3f} ms")
+    os.remove(path)
+    print("Results written to", write_results("hnsw", results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Memory and throughput of three app processes against one multi-tenant server
+
+    python -m benchmarks.bench_multitenant --clients 12 --seconds 20
+    python -m benchmarks.bench_multitenant --fake   # no model download
+
+Starts one stub Ollama per configured model, then each layout on scratch
+data directories: ``separate`` runs chatbot.py, run4 and run5 as three
+processes, ``server`` runs server.py with the three as tenants. When every
+tenant answers, clients post /ask questions round-robin over the tenants
+for ``--seconds``; the RSS of the layout's processes is summed before and
+after the load. ``--fake`` swaps FastEmbed for the simulated model of
+bench_embeddings carrying ``--fake-model-mb`` of weights.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.common import summarize, write_results
+from memory_report import rss_bytes
+from stub_ollama import StubOllama
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Layout -> processes as (module, tenant URL prefixes served)
+LAYOUTS = {
+    "separate": [("chatbot", [""]), ("run4-penjualan-andorder", [""]), ("run5-inventoryproject", [""])],
+    "server": [("server", ["/store", "/sales", "/inventory"])],
+}
+
+QUESTIONS = [
+    "berapa ongkir ke Jakarta untuk {n} Baju Kemeja ukuran M?",
+    "total belanja {n} Celana Cino dan 1 Topi Kinz ke Bandung",
+    "project apa saja yang memakai {n} barang dari instansi Dinas PU?",
+]
+
+
+def serve(module, port, fake_mb):
+    """Child process: run one app or the server on a port"""
+    if fake_mb is not None:
+        import embedding_service
+        from benchmarks.bench_embeddings import FakeModel
+
+        class WeightedFakeModel(FakeModel):
+            def __init__(self):
+                super().__init__()
+                # Written, so the pages are resident like loaded model weights
+                self.weights = b"\x01" * (fake_mb * 2 ** 20)
+
+        embedding_service._fastembed = lambda model_name: WeightedFakeModel()
+    app = importlib.import_module(module).create_app()
+    app.run(host="127.0.0.1", port=port, threaded=True)
+
+
+def start_stubs(token_latency, first_token_latency=0.0):
+    models = set()
+    for path in ("model_config.json", "model.json"):
+        with open(os.path.join(ROOT, path)) as f:
+            models.add(json.load(f)["model"])
+    return [StubOllama(("127.0.0.1", 0), model, token_latency=token_latency,
+                       first_token_latency=first_token_latency).start() for model in sorted(models)]
+
+
+def wait_ready(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(url + "/metrics", timeout=2).close()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def launch(layout, data_dir, stubs, base_port, fake_mb, timeout):
+    processes, targets = [], []
+    for i, (module, prefixes) in enumerate(LAYOUTS[layout]):
+        port = base_port + i
+        env = dict(os.environ,
+                   TENANT_DATA_DIR=os.path.join(data_dir, f"{layout}-{i}"),
+                   OLLAMA_BASE_URLS=",".join(stub.url for stub in stubs),
+                   # All the load comes from one address
+                   RATE_LIMIT="0",
+                   # Background generations would add load the runs do not control
+                   FAQ_WARMING="0",
+                   AUDIT_DB=os.path.join(data_dir, f"audit-{i}.db"))
+        command = [sys.executable, "-m", "benchmarks.bench_multitenant", "--serve", module, "--port", str(port)]
+        if fake_mb is not None:
+            command += ["--fake-model-mb", str(fake_mb)]
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(process)
+        targets += [(f"http://127.0.0.1:{port}{prefix}", process) for prefix in prefixes]
+    for url, process in targets:
+        wait_ready(url, process, timeout)
+    return processes, [url for url, _ in targets]
+
+
+def total_rss(processes):
+    sizes = [rss_bytes(p.pid) for p in processes]
+    return sum(sizes) if None not in sizes else None
+
+
+def load(urls, clients, seconds, seed):
+    latencies, counts = [], {"ok": 0, "error": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(n):
+        rng = random.Random(seed + n)
+        local, ok, errors, i = [], 0, 0, n
+        while time.monotonic() < deadline:
+            url = urls[i % len(urls)]
+            i += 1
+            question = rng.choice(QUESTIONS).format(n=rng.randint(1, 9))
+            body = json.dumps({"question": question}).encode()
+            request = urllib.request.Request(url + "/ask", data=body, headers={"Content-Type": "application/json"})
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(request, timeout=120).close()
+                ok += 1
+            except (OSError, urllib.error.HTTPError):
+                errors += 1
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+            counts["ok"] += ok
+            counts["error"] += errors
+
+    pool = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"asks_per_sec": round(counts["ok"] / elapsed, 1), **counts, **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=12)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--token-latency", type=float, default=0.005, help="stub Ollama seconds per token")
+    parser.add_argument("--port", type=int, default=6100, help="first port used by the layouts")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--fake", action="store_true", help="use a simulated embedding model")
+    parser.add_argument("--fake-model-mb", type=int, default=None, help="weights of the simulated model (default 500)")
+    parser.add_argument("--layouts", default="separate,server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    fake_mb = args.fake_model_mb if args.fake_model_mb is not None else (500 if args.fake else None)
+    if args.serve:
+        serve(args.serve, args.port, fake_mb)
+        return
+
+    stubs = start_stubs(args.token_latency)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in args.layouts.split(","):
+            processes, urls = launch(layout, tmp, stubs, args.port, fake_mb, args.startup_timeout)
+            try:
+                idle = total_rss(processes)
+                result = load(urls, args.clients, args.seconds, args.seed)
+                result.update({"processes": len(processes), "rss_idle_bytes": idle, "rss_loaded_bytes": total_rss(processes)})
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.wait()
+            results[layout] = result
+            mb = lambda size: f"{size / 2 ** 20:.0f} MB" if size else "n/a"
+            print(f"{layout:9} {result['processes']} process(es)  RSS idle {mb(result['rss_idle_bytes'])}  "
+                  f"loaded {mb(result['rss_loaded_bytes'])}  {result['asks_per_sec']} asks/s  "
+                  f"p50 {result['p50_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms  errors {result['error']}")
+    print("Results written to", write_results("multitenant", results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Memory and recall@k of float16/int8 vector storage against float32
+
+    python -m benchmarks.bench_quantization --size 50000 -k 3 10
+
+The catalog is simulated with clustered unit vectors (products of the same
+category embed close together), which is where quantization error decides
+the ranking; recall@k is measured against exact float32 search.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.common import summarize, write_results
+from flat_store import FlatVectorStore
+
+DIM = 1024
+
+
+class LookupEmbeddings(Embeddings):
+    def __init__(self, docs):
+        self.docs = docs
+
+    def embed_documents(self, texts):
+        return self.docs[[int(t) for t in texts]]
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+
+def clustered(n, clusters, spread, rng):
+    centers = rng.standard_normal((clusters, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--rescore", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    docs = clustered(args.size, max(1, args.size // 50), 0.6, rng)
+    queries = clustered(args.queries, max(1, args.size // 50), 0.6, rng)
+    texts = [str(i) for i in range(args.size)]
+    embeddings = LookupEmbeddings(docs)
+
+    variants = [("float32", 0), ("float16", 0), ("int8", 0), ("float16", args.rescore), ("int8", args.rescore)]
+    directory = tempfile.mkdtemp(prefix="bench-quantization-")
+    stores = {}
+    for dtype, rescore in variants:
+        name = dtype + (f"+rescore{rescore}" if rescore else "")
+        store = FlatVectorStore(embeddings, name, directory, dtype=dtype, rescore=rescore)
+        store.add_texts(texts, ids=texts)
+        stores[name] = store
+
+    baseline = stores["float32"]
+    results = {}
+    for name, store in stores.items():
+        latencies, recall = [], {k: 0.0 for k in args.k}
+        for query in queries:
+            for k in args.k:
+                start = time.perf_counter()
+                found = store.similarity_search_by_vector(query, k=k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                truth = {d.id for d in baseline.similarity_search_by_vector(query, k=k)}
+                recall[k] += len(truth & {d.id for d in found}) / k
+        results[name] = {
+            "memory_bytes": store.memory_usage(),
+            "memory_vs_float32": round(store.memory_usage() / baseline.memory_usage(), 3),
+            **{f"recall@{k}": round(total / len(queries), 4) for k, total in recall.items()},
+            "query": summarize(latencies),
+        }
+        row = results[name]
+        print(f"{name:18} {row['memory_bytes'] / 2**20:8.1f} MiB ({row['memory_vs_float32']:.2f}x)  "
+              + "  ".join(f"recall@{k} {row[f'recall@{k}']:.4f}" for k in args.k)
+              + f"  p50 {row['query']['p50_ms']:.2f} ms")
+    shutil.rmtree(directory, ignore_errors=True)
+    print("Results written to", write_results("quantization", results))
+
+
+if __name__ == "__main__":
+    main()
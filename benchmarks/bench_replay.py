@@ -0,0 +1,185 @@
+"""Replay recorded traffic and report latency per endpoint
+
+    python -m benchmarks.bench_replay traffic.jsonl --fake
+    python -m benchmarks.bench_replay traffic.jsonl --rate 4 --token-latency 0.03 --first-token-latency 0.3
+    python -m benchmarks.bench_replay traffic.jsonl --url http://127.0.0.1:5000
+
+Reads a file written by the traffic recorder (``TRAFFIC_LOG``, see
+traffic.py) and sends every question again, at the recorded pace times
+``--rate`` (0 sends them as fast as ``--max-in-flight`` allows). Without
+``--url`` it starts server.py on scratch data against one stub Ollama per
+model with the given token latencies. ``--fake`` replaces the embedding
+model with the simulated one of bench_embeddings. ``--layout app`` drives a
+single app started on its own (no /<tenant> prefix).
+
+For each tenant and endpoint it reports throughput, p50/p95/p99 latency,
+and time to first token and mean stage times from the ``Server-Timing``
+header. It also reports how late the requests went out
+(``lag``): a large lag means the replay client, not the server, set the
+pace.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_multitenant import launch, start_stubs
+from benchmarks.common import summarize, write_results
+
+
+def load_traffic(path, limit=None):
+    """Recorded questions in the order they arrived"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("body", {}).get("question"):
+                    records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def build_request(base_url, record, layout):
+    prefix = f"/{record['tenant']}" if layout == "server" else ""
+    url = base_url.rstrip("/") + prefix + record["route"]
+    body = record["body"]
+    if record["endpoint"] == "ask":
+        return urllib.request.Request(url, data=json.dumps(body).encode(),
+                                      headers={"Content-Type": "application/json"})
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    if body.get("session_id"):
+        headers["Cookie"] = f"session_id={body['session_id']}"
+    return urllib.request.Request(url, data=urllib.parse.urlencode({"question": body["question"]}).encode(),
+                                  headers=headers)
+
+
+def parse_server_timing(header):
+    """{"ttft": 12.5, ...} from "ttft;dur=12.5, ..." """
+    timings = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.startswith("dur="):
+            timings[name] = float(params[4:])
+    return timings
+
+
+def send(request, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status, header = response.status, response.headers.get("Server-Timing")
+    except urllib.error.HTTPError as e:
+        status, header = e.code, e.headers.get("Server-Timing")
+    except OSError:
+        status, header = None, None
+    return status, (time.perf_counter() - start) * 1000, parse_server_timing(header)
+
+
+def replay(records, base_url, layout, rate, max_in_flight, timeout):
+    results = {}
+    lock = threading.Lock()
+    lags = []
+
+    def run(record, due):
+        lag = max(0.0, time.perf_counter() - due) * 1000
+        status, latency, timings = send(build_request(base_url, record, layout), timeout)
+        with lock:
+            lags.append(lag)
+            result = results.setdefault(f"{record['tenant']}:{record['endpoint']}",
+                                        {"latencies": [], "timings": [], "errors": 0})
+            if status is None or status >= 500:
+                result["errors"] += 1
+            result["latencies"].append(latency)
+            result["timings"].append(timings)
+
+    first_ts = records[0]["ts"] if records else 0.0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for record in records:
+            due = start + ((record["ts"] - first_ts) / rate if rate > 0 else 0.0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, record, due)
+    elapsed = time.perf_counter() - start
+    return results, lags, elapsed
+
+
+def report(results, lags, elapsed):
+    summary = {"seconds": round(elapsed, 2), "lag": summarize(lags), "endpoints": {}}
+    for key, result in sorted(results.items()):
+        entry = {"requests": len(result["latencies"]), "errors": result["errors"],
+                 "throughput_rps": round(len(result["latencies"]) / elapsed, 2) if elapsed else 0.0,
+                 **summarize(result["latencies"])}
+        ttfts = [t["ttft"] for t in result["timings"] if "ttft" in t]
+        if ttfts:
+            entry["ttft"] = summarize(ttfts)
+        stages = {}
+        for timings in result["timings"]:
+            for name, ms in timings.items():
+                stages.setdefault(name, []).append(ms)
+        entry["stage_mean_ms"] = {name: round(sum(v) / len(v), 3) for name, v in stages.items()}
+        summary["endpoints"][key] = entry
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("traffic", help="JSONL file written with TRAFFIC_LOG")
+    parser.add_argument("--url", help="running server to drive (default: start server.py against stubs)")
+    parser.add_argument("--layout", choices=("server", "app"), default="server",
+                        help="server: paths under /<tenant>; app: a single app at /")
+    parser.add_argument("--rate", type=float, default=1.0, help="speed-up of the recorded pace, 0 = no pauses")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N questions")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--token-latency", type=float, default=0.02, help="stub Ollama seconds per token")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="stub Ollama seconds to the first token")
+    parser.add_argument("--port", type=int, default=6200)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--fake", action="store_true", help="use a simulated embedding model")
+    args = parser.parse_args()
+
+    records = load_traffic(args.traffic, args.limit)
+    if not records:
+        parser.exit(1, f"{args.traffic} holds no recorded questions\n")
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if args.url:
+                base_url = args.url
+            else:
+                # The replayed server must not record the replay
+                os.environ.pop("TRAFFIC_LOG", None)
+                stubs = start_stubs(args.token_latency, args.first_token_latency)
+                processes, urls = launch("server", tmp, stubs, args.port, 0 if args.fake else None, args.startup_timeout)
+                base_url = urls[0].rsplit("/", 1)[0]
+            results, lags, elapsed = replay(records, base_url, args.layout, args.rate, args.max_in_flight, args.timeout)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    summary = report(results, lags, elapsed)
+    summary.update({"traffic": os.path.abspath(args.traffic), "rate": args.rate,
+                    "token_latency": args.token_latency, "first_token_latency": args.first_token_latency})
+    print(f"{len(records)} questions in {summary['seconds']} s, send lag p99 {summary['lag']['p99_ms']:.1f} ms")
+    for key, entry in summary["endpoints"].items():
+        ttft = f"  TTFT p50 {entry['ttft']['p50_ms']:.1f} ms p99 {entry['ttft']['p99_ms']:.1f} ms" if "ttft" in entry else ""
+        print(f"{key:16} {entry['requests']:5} req  {entry['throughput_rps']:6.2f} req/s  "
+              f"p50 {entry['p50_ms']:8.1f}  p95 {entry['p95_ms']:8.1f}  p99 {entry['p99_ms']:8.1f} ms"
+              f"{ttft}  errors {entry['errors']}")
+    print("Results written to", write_results("replay", summary))
+
+
+if __name__ == "__main__":
+    main()
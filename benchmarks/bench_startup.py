@@ -0,0 +1,115 @@
+"""Startup-time regression guard for the apps
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --full --fake   # also time create_app()
+
+Every measurement runs in a fresh interpreter: importing each app module,
+``python <app>.py --help``, and with ``--full`` the whole ``create_app()``
+(``--fake`` swaps FastEmbed for the simulated model of bench_embeddings).
+Importing an app must not pull in the heavy libraries (LangChain, Chroma,
+FastEmbed, numpy), and its median import time must stay under
+``--max-import-ms``; otherwise the script exits with status 1.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = ["chatbot", "run4-penjualan-andorder", "run5-inventoryproject", "server", "run3"]
+
+# Packages an app import must leave for init()
+HEAVY = ["langchain_core", "langchain_community", "langchain_chroma", "langchain_ollama",
+         "chromadb", "fastembed", "numpy"]
+
+IMPORT_CODE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"ms": elapsed * 1000, "heavy": heavy}}))
+"""
+
+CREATE_CODE = """
+import importlib, json, time
+if {fake!r}:
+    import embedding_service
+    from benchmarks.bench_embeddings import FakeModel
+    embedding_service._fastembed = lambda model_name: FakeModel()
+start = time.perf_counter()
+importlib.import_module({module!r}).create_app()
+print(json.dumps({{"ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+
+def run_child(args, env):
+    proc = subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+    return proc.stdout
+
+
+def measure(module, runs, full, fake, data_dir):
+    env = dict(os.environ, TENANT_DATA_DIR=os.path.join(data_dir, module), OLLAMA_BASE_URLS="http://127.0.0.1:9")
+    imports, heavy, helps, creates = [], set(), [], []
+    for _ in range(runs):
+        out = json.loads(run_child([sys.executable, "-c", IMPORT_CODE.format(module=module, heavy=HEAVY)], env)
+                         .splitlines()[-1])
+        imports.append(out["ms"])
+        heavy.update(out["heavy"])
+        if module != "run3":
+            start = time.perf_counter()
+            run_child([sys.executable, f"{module}.py", "--help"], env)
+            helps.append((time.perf_counter() - start) * 1000)
+    result = {"import_ms": round(statistics.median(imports), 1), "heavy_imported": sorted(heavy)}
+    if helps:
+        result["help_ms"] = round(statistics.median(helps), 1)
+    if full and module != "run3":
+        for _ in range(runs):
+            out = run_child([sys.executable, "-c", CREATE_CODE.format(module=module, fake=fake)], env)
+            creates.append(json.loads(out.splitlines()[-1])["ms"])
+        result["create_app_ms"] = round(statistics.median(creates), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--full", action="store_true", help="also time create_app() (loads the models)")
+    parser.add_argument("--fake", action="store_true", help="simulated embedding model for --full")
+    parser.add_argument("--max-import-ms", type=float, default=500.0)
+    parser.add_argument("--apps", default=",".join(APPS))
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    with tempfile.TemporaryDirectory() as tmp:
+        for module in args.apps.split(","):
+            result = measure(module, args.runs, args.full, args.fake, tmp)
+            results[module] = result
+            line = f"{module:25} import {result['import_ms']:7.1f} ms"
+            if "help_ms" in result:
+                line += f"  --help {result['help_ms']:7.1f} ms"
+            if "create_app_ms" in result:
+                line += f"  create_app {result['create_app_ms']:8.1f} ms"
+            print(line)
+            if result["heavy_imported"]:
+                failures.append(f"{module} imports {', '.join(result['heavy_imported'])} at import time")
+            if result["import_ms"] > args.max_import_ms:
+                failures.append(f"{module} import takes {result['import_ms']} ms (limit {args.max_import_ms} ms)")
+    results["failures"] = failures
+    print("Results written to", write_results("startup", results))
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Generated tokens per answer: free-text template vs structured JSON
+
+    python -m benchmarks.bench_structured --questions 30          # against Ollama
+    python -m benchmarks.bench_structured --offline               # no model needed
+
+Random carts from the run4 catalog are asked both ways with the same
+context. Against Ollama (``OLLAMA_BASE_URLS``, model from model.json) the
+generated tokens are Ollama's ``eval_count``; the structured answers are
+also checked to parse into the asked cart (items, quantities, sizes and
+city; the server prices it). ``--offline`` compares the length of the reference
+answers instead: the text a perfect text-mode answer would contain versus
+the JSON object, in estimated tokens (about 4 characters each).
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from benchmarks.bench_checkout import BARANG, ONGKIR
+from benchmarks.common import summarize, write_results
+from conversation_memory import estimate_tokens
+from structured_output import STRUCTURED_TEMPLATE, StructuredOutputError, model_kwargs, parse_cart
+
+# run4's template, without the conversation history
+TEXT_TEMPLATE = """You are an assistant to calculate the total cost of items in the shopping cart including shipping costs.
+Here is a list of available items, prices, categories, sizes, stock status, and shipping costs:
+{context}
+
+Conversation so far (empty for a new conversation):
+{history}
+
+The user has provided the following information:
+{question}
+
+If the input contains item details, calculate the total price and return it in this format:
+- Details: [item1 (quantity x price) (size), item2 (quantity x price) (size), ...]
+- Shipping Cost: RpXXX (destination: city_name)
+- Stock Info: [item1: In Stock, item2: Out of Stock, ...]
+- Total Shopping: ([item1 (quantity x price), ...]\\n) + RpXXX (city_name) = RpXXX
+
+If the input only contains city_name, answer with "Shipping Cost: RpXXX (destination: city_name)".
+
+If the currency number is Rp, use a comma for the digits
+"""
+
+STOCK = {"Topi Kinz": 0}
+
+CONTEXT = "Barang yang tersedia:\n" + "\n".join(
+    f"{nama} (Kategori: {kategori}, Harga: Rp{harga}, Ukuran: {ukuran}, "
+    f"Stok: {'Habis' if STOCK.get(nama) == 0 else 'Tersedia'})"
+    for nama, harga, kategori, ukuran in BARANG
+) + "\n\nOngkos kirim: " + ", ".join(f"{kota} (Rp{biaya})" for kota, biaya in ONGKIR)
+
+
+def random_cart(rng):
+    """(question, reference cart) for a random cart"""
+    items = []
+    for nama, harga, _, ukuran in rng.sample(BARANG, rng.randint(1, 3)):
+        items.append({"name": nama, "qty": rng.randint(1, 4), "price": harga,
+                      "size": rng.choice(ukuran.split(",")), "in_stock": STOCK.get(nama) != 0})
+    city, fee = rng.choice(ONGKIR)
+    wanted = " dan ".join(f"{i['qty']} {i['name']} ukuran {i['size']}" for i in items)
+    question = f"Saya mau beli {wanted}, dikirim ke {city}. Berapa totalnya?"
+    cart = {"items": items, "city": city, "shipping": fee}
+    cart["subtotal"] = sum(i["qty"] * i["price"] for i in items)
+    cart["total"] = cart["subtotal"] + fee
+    return question, cart
+
+
+def reference_text(cart):
+    """The answer TEXT_TEMPLATE asks for, without any extra words"""
+    lines = [f"{i['name']} ({i['qty']} x Rp{i['price']:,}) ({i['size']})" for i in cart["items"]]
+    stock = ", ".join(f"{i['name']}: {'In Stock' if i['in_stock'] else 'Out of Stock'}" for i in cart["items"])
+    return (f"- Details: [{', '.join(lines)}]\n"
+            f"- Shipping Cost: Rp{cart['shipping']:,} (destination: {cart['city']})\n"
+            f"- Stock Info: [{stock}]\n"
+            f"- Total Shopping: ([{', '.join(line.rsplit(' (', 1)[0] for line in lines)}]\n) "
+            f"+ Rp{cart['shipping']:,} ({cart['city']}) = Rp{cart['total']:,}")
+
+
+def reference_json(cart):
+    """The object STRUCTURED_TEMPLATE asks for"""
+    return {"items": [{"name": i["name"], "qty": i["qty"], "size": i["size"]} for i in cart["items"]],
+            "city": cart["city"]}
+
+
+def offline(carts):
+    results = {}
+    text = [estimate_tokens(reference_text(cart)) for _, cart in carts]
+    compact = [estimate_tokens(json.dumps(reference_json(cart), separators=(",", ":"))) for _, cart in carts]
+    results["text"] = {"mean_tokens_estimated": round(statistics.fmean(text), 1)}
+    results["structured"] = {"mean_tokens_estimated": round(statistics.fmean(compact), 1)}
+    return results
+
+
+def live(carts, max_tokens):
+    from langchain_core.prompts import PromptTemplate
+
+    from tenants import load_llm
+
+    llm = load_llm("./model.json", {"model": "hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest",
+                                     "temperature": 0})
+    modes = {
+        "text": (TEXT_TEMPLATE, {"num_predict": max_tokens}),
+        "structured": (STRUCTURED_TEMPLATE, model_kwargs()),
+    }
+    results = {}
+    for mode, (template, kwargs) in modes.items():
+        prompt = PromptTemplate.from_template(template)
+        tokens, latencies, correct, invalid = [], [], 0, 0
+        for question, expected in carts:
+            message = prompt.format(context=CONTEXT, history="", question=question)
+            start = time.perf_counter()
+            response = llm.invoke(message, model_kwargs=kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            tokens.append(response.response_metadata.get("eval_count") or estimate_tokens(response.content))
+            if mode == "structured":
+                try:
+                    correct += parse_cart(response.content) == parse_cart(json.dumps(reference_json(expected)))
+                except StructuredOutputError:
+                    invalid += 1
+        results[mode] = {"mean_tokens": round(statistics.fmean(tokens), 1), "max_tokens": max(tokens), **summarize(latencies)}
+        if mode == "structured":
+            results[mode].update({"correct_carts": correct, "invalid_json": invalid})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--offline", action="store_true", help="compare reference answers, no model calls")
+    parser.add_argument("--text-num-predict", type=int, default=512, help="cap for the free-text answers")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    carts = [random_cart(rng) for _ in range(args.questions)]
+    results = offline(carts) if args.offline else live(carts, args.text_num_predict)
+    key = "mean_tokens_estimated" if args.offline else "mean_tokens"
+    text, structured = results["text"][key], results["structured"][key]
+    for mode, result in results.items():
+        print(f"{mode:10} {result[key]:>7} generated tokens per answer"
+              + (f"  p50 {result['p50_ms']:.0f} ms" if "p50_ms" in result else ""))
+    results["token_reduction"] = round(1 - structured / text, 3) if text else 0.0
+    print(f"structured answers use {results['token_reduction']:.0%} fewer generated tokens")
+    print("Results written to", write_results("structured" + ("-offline" if args.offline else ""), results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Load time and query latency of FlatVectorStore vs Chroma
+
+    python -m benchmarks.bench_vector_store --sizes 1000 10000 50000
+
+Vectors are random unit vectors handed out by a lookup "embedding", so only
+the vector store itself is measured.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.common import summarize, write_results
+from vector_backends import make_vector_store
+
+DIM = 1024
+
+
+class LookupEmbeddings(Embeddings):
+    """Returns precomputed vectors for "doc-<n>" / "query-<n>" texts"""
+
+    def __init__(self, docs, queries):
+        self.docs, self.queries = docs, queries
+
+    def embed_documents(self, texts):
+        return [self.docs[int(t.split("-")[1])].tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.queries[int(text.split("-")[1])].tolist()
+
+
+def random_unit(n, rng):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_backend(backend, size, embeddings, queries, k, batch=5000):
+    directory = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+    try:
+        store = make_vector_store(embeddings, "bench", directory, backend=backend)
+        texts = [f"doc-{i}" for i in range(size)]
+        start = time.perf_counter()
+        for i in range(0, size, batch):
+            store.add_texts(texts[i:i + batch], ids=texts[i:i + batch])
+        build_s = time.perf_counter() - start
+        del store
+
+        start = time.perf_counter()
+        store = make_vector_store(embeddings, "bench", directory, backend=backend)
+        store.similarity_search(f"query-0", k=k)  # first query pays lazy loading
+        load_ms = (time.perf_counter() - start) * 1000
+
+        latencies = []
+        for i in range(len(queries)):
+            start = time.perf_counter()
+            store.similarity_search(f"query-{i}", k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return {"build_s": round(build_s, 3), "load_ms": round(load_ms, 3), "query": summarize(latencies)}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=["flat", "chroma"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = random_unit(args.queries, rng)
+    results = {}
+    for size in args.sizes:
+        embeddings = LookupEmbeddings(random_unit(size, rng), queries)
+        for backend in args.backends:
+            result = bench_backend(backend, size, embeddings, queries, args.k)
+            results[f"{backend}-{size}"] = result
+            print(f"{backend:7} n={size:<7} load {result['load_ms']:9.2f} ms  "
+                  f"query p50 {result['query']['p50_ms']:.3f} ms  p99 {result['query']['p99_ms']:.3f} ms")
+    print("Results written to", write_results("vector_store", results))
+
+
+if __name__ == "__main__":
+    main()
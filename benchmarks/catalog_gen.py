@@ -0,0 +1,126 @@
+"""Deterministic synthetic catalogs for the benchmarks
+
+    python -m benchmarks.catalog_gen sales 100000 --out /tmp/store.db
+
+``populate`` fills the tables an app's ``init_db()`` created with
+``products`` items, and cities, projects and project lines scaled from it
+(``scale_plan``). The same seed always gives the same rows. Names are
+unique, as the catalog import expects, and read like the seed data
+("Kemeja Flanel Kinz 004211", "Project Gedung Polri 0042").
+"""
+import argparse
+import random
+import sqlite3
+
+CATEGORIES = {
+    "Pakaian": ["Kemeja", "Celana", "Kaos", "Jaket", "Rok", "Sweater", "Hoodie", "Batik"],
+    "Aksesoris": ["Topi", "Tas", "Dompet", "Ikat Pinggang", "Kacamata", "Jam Tangan"],
+    "Sepatu": ["Sneakers", "Sandal", "Sepatu Kulit", "Sepatu Lari"],
+    "Tools": ["Baut", "Mur", "Obeng", "Kunci Pas", "Vanbelt", "Bor", "Gergaji"],
+    "Electronic": ["Hp", "Laptop", "Router", "Kabel LAN", "Proyektor", "Printer"],
+}
+STYLES = ["Flanel", "Cino", "Polos", "Slim", "Oversize", "Premium", "Basic", "Sport", "Classic", "Pro"]
+BRANDS = ["Kinz", "Samsung", "Eiger", "Bata", "Polo", "Makita", "Bosch", "Asus", "Tp-Link", "Epson"]
+SIZES = ["S", "M", "L", "XL", "XXL"]
+CITIES = [
+    "Jakarta", "Bandung", "Surabaya", "Bogor", "Depok", "Bekasi", "Tangerang", "Semarang", "Yogyakarta",
+    "Solo", "Malang", "Medan", "Palembang", "Makassar", "Denpasar", "Balikpapan", "Pontianak", "Manado",
+]
+AGENCIES = ["Kejagung", "Polri", "Kemhan", "Unhan", "Kemenkes", "Kemendikbud", "Basarnas", "BMKG", "Bappenas",
+            "Kemenhub", "KPU", "BPS", "Kominfo", "Pemprov DKI", "Pemkot Bandung"]
+PROJECT_KINDS = ["Gedung", "Jaringan", "Smart Class", "Renovasi", "Pengadaan", "Data Center", "CCTV"]
+STATUSES = ["Finish", "Progress", "Pending", "Cancel"]
+
+# Columns of barang that differ between the apps
+APP_TABLES = {
+    "store": ("ukuran", "flag"),
+    "sales": ("ukuran", "count"),
+    "inventory": ("merk", "count"),
+}
+
+
+def scale_plan(products):
+    """Row counts of every table for a catalog of the given number of items"""
+    return {
+        "products": products,
+        "cities": max(4, min(products // 100, 5000)),
+        "projects": max(4, products // 20),
+        "lines_per_project": 5,
+    }
+
+
+def _products(rng, count, detail_column, stock_kind):
+    categories = list(CATEGORIES)
+    for i in range(count):
+        kategori = rng.choice(categories)
+        nama = f"{rng.choice(CATEGORIES[kategori])} {rng.choice(STYLES)} {rng.choice(BRANDS)} {i:06d}"
+        harga = rng.randrange(5, 2000) * 1000
+        if detail_column == "merk":
+            detail = rng.choice(BRANDS)
+        elif kategori in ("Pakaian", "Sepatu"):
+            detail = ",".join(SIZES[:rng.randint(2, len(SIZES))])
+        else:
+            detail = "All Size"
+        stok = rng.random() > 0.1 if stock_kind == "flag" else rng.randrange(0, 200)
+        yield nama, harga, kategori, detail, int(stok)
+
+
+def _cities(rng, count):
+    for i in range(count):
+        kota = CITIES[i] if i < len(CITIES) else f"Kabupaten {rng.choice(CITIES)} {i:04d}"
+        yield kota, rng.randrange(10, 80) * 1000
+
+
+def _projects(rng, count):
+    for i in range(count):
+        instansi = rng.choice(AGENCIES)
+        yield rng.choice(CITIES), instansi, f"Project {rng.choice(PROJECT_KINDS)} {instansi} {i:05d}", rng.choice(STATUSES)
+
+
+def _project_lines(rng, projects, products, lines):
+    for project_id in range(1, projects + 1):
+        for barang_id in rng.sample(range(1, products + 1), min(lines, products)):
+            yield project_id, barang_id, rng.randint(1, 50)
+
+
+def populate(conn, app, plan, seed=0):
+    """Replace the catalog of an app database (schema from its init_db) with synthetic rows"""
+    detail_column, stock_kind = APP_TABLES[app]
+    rng = random.Random(seed)
+    c = conn.cursor()
+    tables = ["barang", "project_barang", "project"] if app == "inventory" else ["barang", "ongkir"]
+    for table in tables:
+        c.execute(f"DELETE FROM {table}")
+        c.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+    c.executemany(f"INSERT INTO barang (nama, harga, kategori, {detail_column}, stok) VALUES (?, ?, ?, ?, ?)",
+                  _products(rng, plan["products"], detail_column, stock_kind))
+    if app == "inventory":
+        c.executemany("INSERT INTO project (kota, instansi, nama, status) VALUES (?, ?, ?, ?)",
+                      _projects(rng, plan["projects"]))
+        c.executemany("INSERT INTO project_barang (project_id, barang_id, jumlah) VALUES (?, ?, ?)",
+                      _project_lines(rng, plan["projects"], plan["products"], plan["lines_per_project"]))
+    else:
+        c.executemany("INSERT INTO ongkir (kota, biaya) VALUES (?, ?)", _cities(rng, plan["cities"]))
+    conn.commit()
+
+
+def main():
+    from benchmarks.bench_catalog import load_app
+
+    parser = argparse.ArgumentParser(description="Write an app database with a synthetic catalog")
+    parser.add_argument("app", choices=sorted(APP_TABLES))
+    parser.add_argument("products", type=int)
+    parser.add_argument("--out", required=True, help="database file to create or overwrite the catalog of")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    module = load_app(args.app, args.out)
+    module.init_db()
+    conn = sqlite3.connect(args.out)
+    populate(conn, args.app, scale_plan(args.products), args.seed)
+    conn.close()
+    print(f"{args.out}: {args.app} catalog with {scale_plan(args.products)}")
+
+
+if __name__ == "__main__":
+    main()
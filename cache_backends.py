@@ -0,0 +1,346 @@
+"""Pluggable cache storage and the catalog-version bus
+
+``CACHE_BACKEND`` picks where caches such as ``RetrievalCache`` keep their
+entries:
+
+- ``memory``: an in-process LRU (``LRUCache``), private to each worker.
+- ``sqlite``: one file shared by the workers of a host (``SQLiteCache``,
+  WAL and memory-mapped reads, ``CACHE_PATH``).
+- ``resp``: a Redis-protocol server shared by every node (``RESPCache``,
+  ``CACHE_URL``). stub_redis.py stands in for Redis in tests.
+
+Values must be JSON-serializable. Cache errors never fail a request: a broken backend reads
+as a miss, and the failure is counted in ``stats()``.
+
+``RESPBus`` carries catalog-version bumps between nodes over Redis pub/sub
+(``CATALOG_BUS_URL``, see catalog_version.CatalogWatcher).
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import settings
+
+# Rows written to the SQLite cache between evictions of the oldest
+SQLITE_EVICT_EVERY = 256
+
+
+class LRUCache:
+    """In-process least-recently-used cache"""
+
+    shared = False
+
+    def __init__(self, namespace, max_entries=None):
+        self.namespace = namespace
+        self.max_entries = max_entries or settings.RETRIEVAL_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.errors = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries)}
+
+
+class SQLiteCache:
+    """Cache table in a SQLite file shared by the workers of one host"""
+
+    shared = True
+
+    def __init__(self, namespace, path=None, max_entries=None):
+        self.namespace = namespace
+        self.path = path or settings.CACHE_PATH
+        self.max_entries = max_entries or settings.RETRIEVAL_CACHE_SIZE
+        self._local = threading.local()
+        self._writes = 0
+        self.errors = 0
+        conn = self._conn()
+        conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries (
+                            namespace TEXT,
+                            key TEXT,
+                            value TEXT,
+                            stored_at REAL,
+                            PRIMARY KEY (namespace, key))''')
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_age ON cache_entries (namespace, stored_at)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Reads come straight from the mapped file instead of through read() calls
+            conn.execute(f"PRAGMA mmap_size={settings.CACHE_MMAP_BYTES}")
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._conn().execute("SELECT value FROM cache_entries WHERE namespace = ? AND key = ?",
+                                       (self.namespace, key)).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        conn = self._conn()
+        try:
+            conn.execute("INSERT OR REPLACE INTO cache_entries (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                         (self.namespace, key, json.dumps(value), time.time()))
+            self._writes += 1
+            if self._writes % SQLITE_EVICT_EVERY == 0:
+                # Oldest first; a hit does not refresh an entry, to keep reads read-only
+                conn.execute('''DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                                    SELECT key FROM cache_entries WHERE namespace = ?
+                                    ORDER BY stored_at DESC LIMIT -1 OFFSET ?)''',
+                             (self.namespace, self.namespace, self.max_entries))
+            conn.commit()
+        except sqlite3.Error:
+            self.errors += 1
+            conn.rollback()
+
+    def clear(self):
+        conn = self._conn()
+        try:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            conn.commit()
+        except sqlite3.Error:
+            self.errors += 1
+
+    def __len__(self):
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?",
+                                        (self.namespace,)).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self):
+        return {"backend": "sqlite", "path": self.path, "entries": len(self), "errors": self.errors}
+
+
+class RESPError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RESPConnection:
+    """Minimal blocking RESP2 client: one socket, one command at a time"""
+
+    def __init__(self, url, timeout=None):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.strip("/") or 0)
+        self.password = parsed.password
+        self.timeout = settings.CACHE_TIMEOUT if timeout is None else timeout
+        self._sock = None
+        self._file = None
+
+    def connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self.command("AUTH", self.password)
+        if self.db:
+            self.command("SELECT", self.db)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._file = None
+
+    def send(self, *args):
+        if self._sock is None:
+            self.connect()
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+
+    def read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RESPError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = self._file.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self.read() for _ in range(count)]
+        raise ConnectionError(f"unexpected reply {line!r}")
+
+    def command(self, *args):
+        try:
+            self.send(*args)
+            return self.read()
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+
+class RESPCache:
+    """Cache in a Redis-protocol server shared by every node"""
+
+    shared = True
+
+    def __init__(self, namespace, url=None, ttl=None):
+        self.namespace = namespace
+        self.url = url or settings.CACHE_URL
+        self.ttl = settings.CACHE_TTL if ttl is None else ttl
+        self._local = threading.local()
+        self.errors = 0
+
+    def _command(self, *args):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = RESPConnection(self.url)
+        return conn.command(*args)
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        try:
+            value = self._command("GET", self._key(key))
+        except (OSError, ConnectionError, RESPError):
+            self.errors += 1
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        args = ["SET", self._key(key), json.dumps(value)]
+        if self.ttl:
+            args += ["EX", int(self.ttl)]
+        try:
+            self._command(*args)
+        except (OSError, ConnectionError, RESPError):
+            self.errors += 1
+
+    def clear(self):
+        try:
+            cursor = "0"
+            while True:
+                cursor, keys = self._command("SCAN", cursor, "MATCH", f"{self.namespace}:*", "COUNT", 1000)
+                cursor = cursor.decode() if isinstance(cursor, bytes) else str(cursor)
+                if keys:
+                    self._command("DEL", *keys)
+                if cursor == "0":
+                    break
+        except (OSError, ConnectionError, RESPError):
+            self.errors += 1
+
+    def stats(self):
+        return {"backend": "resp", "url": self.url, "errors": self.errors}
+
+
+class RESPBus:
+    """Publish/subscribe over a Redis-protocol server; one listener thread per channel"""
+
+    def __init__(self, url=None):
+        self.url = url or settings.CATALOG_BUS_URL
+        self._publisher = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def command(self, *args):
+        """Run a command on the publishing connection; None if the server is unreachable"""
+        with self._lock:
+            try:
+                if self._publisher is None:
+                    self._publisher = RESPConnection(self.url)
+                return self._publisher.command(*args)
+            except (OSError, ConnectionError, RESPError):
+                self.errors += 1
+                return None
+
+    def publish(self, channel, message):
+        if self.command("PUBLISH", channel, message) is not None:
+            self.published += 1
+
+    def subscribe(self, channel, callback):
+        """Call callback(message) for every message on the channel, reconnecting as needed"""
+        def listen():
+            while True:
+                conn = RESPConnection(self.url)
+                try:
+                    conn.connect()
+                    # Messages may be hours apart
+                    conn._sock.settimeout(None)
+                    conn.send("SUBSCRIBE", channel)
+                    while True:
+                        reply = conn.read()
+                        if isinstance(reply, list) and reply[0] == b"message":
+                            self.received += 1
+                            callback(reply[2].decode())
+                except (OSError, ConnectionError, RESPError):
+                    self.errors += 1
+                    conn.close()
+                    time.sleep(1.0)
+
+        threading.Thread(target=listen, name=f"bus-{channel}", daemon=True).start()
+
+    def stats(self):
+        return {"url": self.url, "published": self.published, "received": self.received, "errors": self.errors}
+
+
+def make_cache(namespace, backend=None, max_entries=None):
+    """The configured cache backend for one namespace"""
+    backend = backend or settings.CACHE_BACKEND
+    if backend == "memory":
+        return LRUCache(namespace, max_entries)
+    if backend == "sqlite":
+        directory = os.path.dirname(settings.CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteCache(namespace, max_entries=max_entries)
+    if backend == "resp":
+        return RESPCache(namespace)
+    raise ValueError(f"Unknown cache backend '{backend}'")
+
+
+def get_bus():
+    """The process-wide catalog-version bus, None without CATALOG_BUS_URL"""
+    if not settings.CATALOG_BUS_URL:
+        return None
+    from tenants import shared
+
+    return shared("catalog_bus", RESPBus)
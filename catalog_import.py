@@ -0,0 +1,285 @@
+"""Bulk import of catalog tables from CSV or JSONL
+
+    python catalog_import.py barang products.csv --db store.db
+    python catalog_import.py project_barang mapping.jsonl --db inventory.db
+    python catalog_import.py barang_varian sizes.csv --db store.db
+
+Files are read as a stream and written in chunks of ``IMPORT_CHUNK_SIZE``
+rows, one ``executemany`` upsert and one transaction per chunk, so memory
+stays bounded and the apps keep reading (WAL) between chunks. Rows are
+matched on their natural key (``barang.nama``, ``ongkir.kota``,
+``project.nama``, ``project_barang`` project and item, ``barang_varian``
+item and variant); rows whose values did not change are left alone.
+Inserted and changed rows are queued in ``embedding_queue`` for the apps
+to embed in the background.
+
+``project_barang`` rows may name the project and item (``project``,
+``barang``) instead of giving their ids, ``barang_varian`` rows the item.
+
+An empty value (a blank CSV field, JSON ``null`` or ``""``) stores NULL in
+a column that allows it; key and NOT NULL columns reject it. A column left
+out of a JSONL row is an error rather than NULL, so a partial row never
+clears values.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import settings
+from embedding_queue import init_embedding_queue
+
+# Natural key of every importable table
+TABLES = {
+    "barang": ("nama",),
+    "ongkir": ("kota",),
+    "project": ("nama",),
+    "project_barang": ("project_id", "barang_id"),
+    "barang_varian": ("barang_id", "varian"),
+}
+
+# Invalid rows reported back in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class CatalogImportError(Exception):
+    """Raised when a file cannot be imported into the given table"""
+
+
+def ensure_unique_keys(conn, tables=TABLES):
+    """Unique indexes on the natural keys, needed for upserts"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, key in tables.items():
+        if table not in existing:
+            continue
+        try:
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_natural_key ON {table} ({', '.join(key)})")
+        except sqlite3.IntegrityError:
+            raise CatalogImportError(f"{table} has duplicate {', '.join(key)} values, remove them before importing")
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) from a text stream of CSV or JSONL"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, e
+                    continue
+                yield line_no, row if isinstance(row, dict) else ValueError("not a JSON object")
+    else:
+        raise CatalogImportError(f"Unknown format '{fmt}', use csv or jsonl")
+
+
+def detect_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+# Column absent from a JSONL row
+_ABSENT = object()
+
+
+def _convert(value, sql_type, required=True):
+    if value is _ABSENT:
+        raise ValueError("missing value")
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ValueError("missing value" if value is None else "empty value")
+        return None
+    if isinstance(value, list):
+        value = ",".join(str(v).strip() for v in value)
+    if sql_type == "INTEGER":
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            return int(value.strip())
+        raise ValueError(f"expected an integer, got {value!r}")
+    value = str(value).strip()
+    if not value:
+        raise ValueError("empty value")
+    return value
+
+
+class CatalogImporter:
+    """Streams rows into one catalog table with chunked upserts"""
+
+    def __init__(self, db_path, chunk_size=None, queue_embeddings=True):
+        self.db_path = db_path
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.queue_embeddings = queue_embeddings
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _columns(self, conn, table):
+        """(column: SQL type, NOT NULL columns) of a table"""
+        info = list(conn.execute(f"PRAGMA table_info({table})"))
+        if not info:
+            raise CatalogImportError(f"Table {table} does not exist in {self.db_path}")
+        columns = {row[1]: (row[2] or "TEXT").upper() for row in info}
+        # Ids are assigned by SQLite, rows are matched on their natural key
+        columns.pop("id", None)
+        return columns, {row[1] for row in info if row[3]}
+
+    def _upsert_sql(self, table, columns, key):
+        updates = [c for c in columns if c not in key]
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+               f"ON CONFLICT ({', '.join(key)}) DO ")
+        if not updates:
+            return sql + "NOTHING"
+        return (sql + "UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in updates)
+                + " WHERE " + " OR ".join(f"{c} IS NOT excluded.{c}" for c in updates))
+
+    def _resolve_names(self, conn, rows):
+        # project_barang and barang_varian rows may reference project and barang by name
+        for column in ("project", "barang"):
+            pending = []
+            for i, (line_no, row) in enumerate(rows):
+                if not isinstance(row, dict) or row.get(f"{column}_id") not in (None, "") or column not in row:
+                    continue
+                if isinstance(row[column], str) and row[column].strip():
+                    row[column] = row[column].strip()
+                    pending.append(i)
+                else:
+                    rows[i] = (line_no, ValueError(f"{column} must be a name, got {row[column]!r}"))
+            if not pending:
+                continue
+            names = list({rows[i][1][column] for i in pending})
+            ids = dict(conn.execute(f"SELECT nama, id FROM {column} WHERE nama IN ({','.join('?' * len(names))})", names))
+            for i in pending:
+                line_no, row = rows[i]
+                if row[column] in ids:
+                    row[f"{column}_id"] = ids[row[column]]
+                else:
+                    rows[i] = (line_no, ValueError(f"unknown {column} {row[column]!r}"))
+
+    def import_rows(self, table, rows):
+        """Import an iterable of (line number, dict) rows; returns a report"""
+        if table not in TABLES:
+            raise CatalogImportError(f"Cannot import into '{table}', use one of {', '.join(TABLES)}")
+        key = TABLES[table]
+        start = time.perf_counter()
+        report = {"table": table, "read": 0, "changed": 0, "unchanged": 0, "invalid": 0, "errors": []}
+        conn = self._connect()
+        try:
+            ensure_unique_keys(conn, {table: key})
+            init_embedding_queue(conn)
+            columns, not_null = self._columns(conn, table)
+            required = set(key) | not_null
+            # Temporary triggers, seen by this connection only, collect the ids it changed
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_changed (row_id INTEGER PRIMARY KEY)")
+            for event in ("INSERT", "UPDATE"):
+                conn.execute(f'''CREATE TEMP TRIGGER IF NOT EXISTS import_{table}_{event.lower()}
+                                 AFTER {event} ON main.{table}
+                                 BEGIN INSERT OR IGNORE INTO import_changed VALUES (NEW.id); END''')
+
+            fields = None
+            rows = iter(rows)
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                if table in ("project_barang", "barang_varian"):
+                    self._resolve_names(conn, chunk)
+                if fields is None:
+                    first = next((row for _, row in chunk if isinstance(row, dict)), {})
+                    fields = [c for c in columns if c in first]
+                    missing = [c for c in key if c not in fields]
+                    if missing:
+                        raise CatalogImportError(f"The file has no {', '.join(missing)} column for {table}")
+                values = []
+                for line_no, row in chunk:
+                    report["read"] += 1
+                    try:
+                        if isinstance(row, Exception):
+                            raise row
+                        values.append(tuple(_convert(row.get(c, _ABSENT), columns[c], c in required)
+                                            for c in fields))
+                    except (ValueError, AttributeError) as e:
+                        report["invalid"] += 1
+                        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                            report["errors"].append({"line": line_no, "error": str(e)})
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(self._upsert_sql(table, fields, key), values)
+                    changed = conn.execute("SELECT COUNT(*) FROM import_changed").fetchone()[0]
+                    if self.queue_embeddings:
+                        conn.execute(
+                            '''INSERT INTO embedding_queue (table_name, row_id, queued_at)
+                               SELECT ?, row_id, ? FROM import_changed WHERE true
+                               ON CONFLICT (table_name, row_id) DO UPDATE SET queued_at = excluded.queued_at''',
+                            (table, time.time()),
+                        )
+                    conn.execute("DELETE FROM import_changed")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                report["changed"] += changed
+                report["unchanged"] += len(values) - changed
+        finally:
+            for event in ("insert", "update"):
+                conn.execute(f"DROP TRIGGER IF EXISTS temp.import_{table}_{event}")
+            conn.close()
+        elapsed = time.perf_counter() - start
+        report["seconds"] = round(elapsed, 3)
+        report["rows_per_sec"] = round(report["read"] / elapsed, 1) if elapsed else 0.0
+        return report
+
+    def import_stream(self, table, stream, fmt):
+        """Import a text stream of CSV or JSONL"""
+        return self.import_rows(table, read_rows(stream, fmt))
+
+    def import_file(self, table, path, fmt=None):
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.import_stream(table, f, fmt or detect_format(path))
+
+
+def text_stream(binary):
+    """Decode an uploaded binary stream as UTF-8 text without reading it all"""
+    return io.TextIOWrapper(binary, encoding="utf-8", newline="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import catalog rows from CSV or JSONL")
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path", help="CSV or JSONL file, - for stdin")
+    parser.add_argument("--db", default="store.db", help="SQLite database (store.db for run4, inventory.db for run5)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--no-embed", action="store_true", help="do not queue changed rows for embedding")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist, start the app once to create it")
+    importer = CatalogImporter(args.db, chunk_size=args.chunk_size, queue_embeddings=not args.no_embed)
+    try:
+        if args.path == "-":
+            report = importer.import_stream(args.table, text_stream(sys.stdin.buffer), args.format or "csv")
+        else:
+            report = importer.import_file(args.table, args.path, args.format)
+    except CatalogImportError as e:
+        parser.exit(1, f"Import failed: {e}\n")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
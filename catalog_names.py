@@ -0,0 +1,40 @@
+"""Catalog names named in a question, for the structured prompt contexts
+
+``phrases`` lists every run of up to ``MAX_NAME_WORDS`` words of a question,
+the candidates for item, variant, project, agency and city names.
+``matching`` looks them up through an indexed column, at most
+``MAX_VARIABLES`` phrases per query so a long question stays under SQLite's
+limit on host parameters.
+"""
+import re
+
+# Longest item, variant or project name, in words, looked up in a question
+MAX_NAME_WORDS = 4
+
+# Phrases bound per lookup query (SQLite before 3.32 allows 999 parameters)
+MAX_VARIABLES = 500
+
+_WORDS = re.compile(r"\w+")
+
+
+def rp(value):
+    return f"Rp{value or 0:,}"
+
+
+def phrases(question):
+    """Every lowercase run of 1 to MAX_NAME_WORDS words of the question"""
+    words = _WORDS.findall(question.lower())
+    return list({" ".join(words[i:i + n]) for n in range(1, MAX_NAME_WORDS + 1) for i in range(len(words) - n + 1)})
+
+
+def matching(conn, query, phrases):
+    """Distinct first-column values of query for the phrases, in first-seen order
+
+    query has one ``IN ({marks})`` list, filled with a chunk of the phrases.
+    """
+    found = {}
+    for start in range(0, len(phrases), MAX_VARIABLES):
+        chunk = phrases[start:start + MAX_VARIABLES]
+        for row in conn.execute(query.format(marks=",".join("?" * len(chunk))), chunk):
+            found.setdefault(row[0], None)
+    return list(found)
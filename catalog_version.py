@@ -0,0 +1,183 @@
+"""Catalog version counter maintained by SQLite triggers
+
+Every insert, update or delete on a catalog table bumps
+``catalog_meta.version`` inside the same transaction, so anything derived
+from the catalog (vector index snapshots, caches) can tell whether it is
+stale with a single indexed read.
+
+Stock counts change with every order; for those columns only a change of
+availability (in stock / sold out) bumps the version.
+
+``CatalogWatcher`` pushes version changes to the caches of every worker
+and, through a Redis-protocol bus, of every node.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import settings
+
+_BUMP = "UPDATE catalog_meta SET value = value + 1 WHERE key = 'version';"
+
+
+def install_version_tracking(conn, tables, stock_columns=None):
+    """Create catalog_meta and the version triggers for the given tables
+
+    ``stock_columns`` maps a table to its stock count column.
+    """
+    stock_columns = stock_columns or {}
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS catalog_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER)''')
+    c.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 1)")
+    for table in tables:
+        for event in ("INSERT", "DELETE"):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+                          AFTER {event} ON {table}
+                          BEGIN {_BUMP} END''')
+        stock = stock_columns.get(table)
+        if stock is None:
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_update_version
+                          AFTER UPDATE ON {table}
+                          BEGIN {_BUMP} END''')
+            continue
+        # Recreated so databases tracked before stock columns existed switch over
+        columns = [row[1] for row in c.execute(f"PRAGMA table_info({table})") if row[1] != stock]
+        c.execute(f"DROP TRIGGER IF EXISTS {table}_update_version")
+        c.execute(f'''CREATE TRIGGER {table}_update_version
+                      AFTER UPDATE OF {", ".join(columns)} ON {table}
+                      BEGIN {_BUMP} END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{stock}_version
+                      AFTER UPDATE OF {stock} ON {table}
+                      WHEN (OLD.{stock} > 0) != (NEW.{stock} > 0)
+                      BEGIN {_BUMP} END''')
+
+
+def get_catalog_version(db_path):
+    """Current catalog version of the database"""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+
+class CatalogWatcher:
+    """Catalog version of a database, noticed by every worker and node within milliseconds
+
+    A thread polls ``PRAGMA data_version``, which changes whenever another
+    connection commits to the file (any worker of the host, an import, an
+    admin edit), and re-reads the version when it does. Without a bus,
+    ``current()`` is that version.
+
+    With a bus (cache_backends.RESPBus) the version is a cluster-wide epoch
+    kept in the Redis-protocol server: the first worker of a host to see a
+    change claims it, increments the epoch and publishes the new value on
+    ``channel``; every subscribed node adopts it as it arrives. If the bus
+    cannot be reached, the local version is folded into ``current()`` so this
+    node still invalidates.
+    """
+
+    def __init__(self, db_path, channel, bus=None, interval_ms=None):
+        self.db_path = db_path
+        self.channel = channel
+        self.bus = bus
+        self.interval = (settings.CATALOG_WATCH_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self.local_version = get_catalog_version(db_path)
+        self.epoch = 0
+        self.degraded = False
+        self.changes = 0
+        self.published = 0
+        self.received = 0
+        self.changed_at = None
+        self._lock = threading.Lock()
+        self._claim = f"{channel}:claim:{socket.gethostname()}:{os.path.abspath(db_path)}"
+
+    def start(self):
+        """Subscribe to the bus and start polling; returns self"""
+        if self.bus is not None:
+            self.bus.subscribe(self.channel, self._received)
+            epoch = self.bus.command("GET", f"{self.channel}:epoch")
+            if epoch is not None:
+                self._adopt(int(epoch))
+        threading.Thread(target=self._watch, name=f"catalog-watch-{self.channel}", daemon=True).start()
+        return self
+
+    def current(self):
+        """Version token for cache keys; changes whenever the catalog does"""
+        if self.bus is None:
+            return str(self.local_version)
+        if self.degraded:
+            return f"{self.epoch}.{self.local_version}"
+        return str(self.epoch)
+
+    def _adopt(self, epoch):
+        with self._lock:
+            if epoch <= self.epoch:
+                return False
+            self.epoch = epoch
+            self.changed_at = time.time()
+            return True
+
+    def _received(self, message):
+        if self._adopt(int(message)):
+            self.received += 1
+
+    def _publish(self, version):
+        errors = self.bus.errors
+        claimed = self.bus.command("SET", f"{self._claim}:{version}", 1, "NX", "EX", 60)
+        if self.bus.errors > errors:
+            self.degraded = True
+            return
+        if claimed != "OK":
+            return
+        epoch = self.bus.command("INCR", f"{self.channel}:epoch")
+        if epoch is None:
+            self.degraded = True
+            return
+        if epoch <= self.epoch:
+            # The bus server restarted and lost the epoch: carry on from ours
+            epoch = self.epoch + 1
+            self.bus.command("SET", f"{self.channel}:epoch", epoch)
+        self.degraded = False
+        self._adopt(epoch)
+        self.bus.publish(self.channel, epoch)
+        self.published += 1
+
+    def _watch(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        data_version = None
+        while True:
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != data_version:
+                    data_version = current
+                    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()
+                    version = row[0] if row else 0
+                    if version != self.local_version:
+                        self.local_version = version
+                        self.changes += 1
+                        self.changed_at = time.time()
+                        if self.bus is not None:
+                            self._publish(version)
+            except sqlite3.Error:
+                pass
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "version": self.current(),
+            "local_version": self.local_version,
+            "epoch": self.epoch if self.bus is not None else None,
+            "degraded": self.degraded,
+            "changes": self.changes,
+            "published": self.published,
+            "received": self.received,
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
@@ -1,25 +1,38 @@
-from flask import Flask, request, jsonify, render_template_string
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from langchain_chroma import Chroma
+from flask import Blueprint, Flask, make_response, request, jsonify, render_template_string
 from uuid import uuid4
-from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_ollama import ChatOllama
-import os
-import json
+from operator import itemgetter
 import sqlite3
 
-app = Flask(__name__)
+import settings
+from startup import StartupTimer, run_cli
+from profiling import debug_bp, profiled
+from traffic import note, traced
+from ratelimit import rate_limited
+from memory_report import register_components
+from cache_backends import get_bus
+from catalog_version import CatalogWatcher, get_catalog_version, install_version_tracking
+from vector_backends import make_vector_store, sync_documents
+from llm_scheduler import SchedulerTimeout, use_priority
+from retrieval_cache import RetrievalCache, format_docs
+from faq_warmer import FAQWarmer
+from tenants import collection_name, data_path, get_scheduler, load_llm, load_prompt, vector_directory
+from conversation_memory import ConversationMemory, llm_summarizer
+from structured_output import STRUCTURED_TEMPLATE, StructuredOutputError, parse_cart, price_cart
+from structured_output import model_kwargs as structured_model_kwargs
+from suggest_index import SUGGEST_SCRIPT, SuggestIndex, install_suggest_log
+from variants import find_items, install_variants, item_filters, migrate_stock_flags, variant_context
+
+# Routes live on a blueprint: at / when the app runs on its own, under /store in server.py
+TENANT = "store"
+bp = Blueprint(TENANT, __name__)
 
 # File paths for persistent storage
-db_path = "store.db"
+db_path = data_path(TENANT, "store.db")
+snapshot_path = data_path(TENANT, "store.hnsw")
 model_config_path = "./model_config.json"
 
 # Ensure the persistence directory exists
-persist_directory = "./chroma_langchain_db"
-os.makedirs(persist_directory, exist_ok=True)
+persist_directory = vector_directory("./chroma_langchain_db")
 
 def init_db():
     """Initialize SQLite database with initial data"""
@@ -41,15 +54,18 @@ def init_db():
                     kota TEXT,
                     biaya INTEGER)''')
     
+    barang = [
+        ("Baju Kemeja", 100000, "Pakaian", "S,M,L,XL", 50),
+        ("Celana Cino", 180000, "Pakaian", "M,L,XL", 30),
+        ("Topi Kinz", 50000, "Aksesoris", "All Size", 0)
+    ]
     # Check if barang table is empty and insert initial data
     c.execute("SELECT COUNT(*) FROM barang")
     if c.fetchone()[0] == 0:
-        barang = [
-            ("Baju Kemeja", 100000, "Pakaian", "S,M,L,XL", 1),
-            ("Celana Cino", 180000, "Pakaian", "M,L,XL", 1),
-            ("Topi Kinz", 50000, "Aksesoris", "All Size", 0)
-        ]
         c.executemany("INSERT INTO barang (nama, harga, kategori, ukuran, stok) VALUES (?, ?, ?, ?, ?)", barang)
+    # Older databases used stok as an in-stock flag (1 or 0): the seeded items
+    # get the seed counts, once (shared with the sales app on store.db)
+    migrate_stock_flags(conn, "ukuran", {row[0]: row[4] for row in barang})
     
     # Check if ongkir table is empty and insert initial data
     c.execute("SELECT COUNT(*) FROM ongkir")
@@ -62,97 +78,35 @@ def init_db():
         ]
         c.executemany("INSERT INTO ongkir (kota, biaya) VALUES (?, ?)", ongkir)
     
+    # Log name changes for the type-ahead index
+    install_suggest_log(conn, ["barang", "kota"])
+
+    # Sizes as barang_varian rows with their own stock (migrated from barang.ukuran once)
+    install_variants(conn, "ukuran")
+
+    # Bump the catalog version on every change to the catalog tables
+    install_version_tracking(conn, ["barang", "ongkir", "barang_varian"])
+
     conn.commit()
     conn.close()
 
-# Ensure database is initialized before anything else
-init_db()
-
-def get_barang():
-    """Retrieve products from the database"""
+def get_barang(**filters):
+    """Retrieve products from the database, filtered as in variants.find_items"""
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT nama, harga, kategori, ukuran, stok FROM barang")
-    data = [{"nama": row[0], "harga": row[1], "kategori": row[2], "ukuran": row[3].split(','), "stok": bool(row[4])} for row in c.fetchall()]
-    conn.close()
-    return data
+    try:
+        return find_items(conn, "ukuran", **filters)
+    finally:
+        conn.close()
 
-def get_ongkir():
-    """Retrieve shipping rates from the database"""
+def get_ongkir(limit=None):
+    """Retrieve shipping rates from the database (the first limit of them, if given)"""
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    c.execute("SELECT kota, biaya FROM ongkir")
+    c.execute("SELECT kota, biaya FROM ongkir ORDER BY id LIMIT ?", (-1 if limit is None else limit,))
     data = {row[0]: row[1] for row in c.fetchall()}
     conn.close()
     return data
 
-# Initialize or load the LLM
-if os.path.exists(model_config_path):
-    with open(model_config_path, "r") as f:
-        config = json.load(f)
-    llm = ChatOllama(**config)
-    print("Model initialized from configuration file.")
-else:
-    llm = ChatOllama(
-        model="modellexnew:latest",
-        temperature=0,
-    )
-    config = {"model": "modellexnew:latest", "temperature": 0}
-    with open(model_config_path, "w") as f:
-        json.dump(config, f)
-    print("Model initialized and configuration saved.")
-
-# Initialize the embeddings
-embeddings = FastEmbedEmbeddings(
-    model_name="intfloat/multilingual-e5-large"
-)
-
-# Initialize the vector store
-vector_store = Chroma(
-    collection_name="example_collection",
-    embedding_function=embeddings,
-    persist_directory=persist_directory,
-)
-print("Vector store initialized.")
-
-# Retrieve current barang and ongkir data
-barang = get_barang()
-ongkir = get_ongkir()
-
-# Membuat string daftar barang untuk dokumen
-barang_text = "\n".join([
-    f"{item['nama']} (Kategori: {item['kategori']}, Harga: Rp{item['harga']}, "
-    f"Ukuran: {', '.join(item['ukuran'])}, Stok: {'Tersedia' if item['stok'] else 'Habis'})"
-    for item in barang
-])
-ongkir_text = ", ".join([f"{k} (Rp{v})" for k, v in ongkir.items()])
-
-# Membuat dokumen
-documents = [
-    Document(
-        page_content=f"Barang yang tersedia:\n{barang_text}.",
-        metadata={"source": "product_info"},
-    ),
-    Document(
-        page_content=f"Ongkos kirim: {ongkir_text}.",
-        metadata={"source": "shipping_info"},
-    ),
-    Document(
-        page_content="Setelah memilih warna, ukuran, dan alamat, silakan lakukan transfer sesuai total biaya.",
-        metadata={"source": "cart"},
-    ),
-]
-
-# Tambahkan dokumen ke vector store jika belum ada data
-if not os.listdir(persist_directory):
-    vector_store.add_documents(documents)
-    print("Documents added to vector store and persisted.")
-
-# Set up retriever
-retriever = vector_store.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 3}
-)
 
 # Define prompt template
 template = """
@@ -160,6 +114,9 @@ You are an assistant for calculating the total cost of items in a shopping cart
 Here is the list of available items, their prices, categories, sizes, stock status, and shipping fees:
 {context}
 
+Conversation so far (empty for a new conversation):
+{history}
+
 The user has provided the following information:
 {question}
 
@@ -174,20 +131,180 @@ If the input contains only a city_name, respond with "Shipping Fee: RpXXX (desti
 If the city_name is not listed, respond with "Area pengiriman diluar JABODETABEK kami akan kenakan cas Rp.10.000 biaya tambahan pengiriman".
 """
 
-# Initialize the prompt template
-rag_prompt = PromptTemplate.from_template(template)
+def answer_question(question, session_id, answer_format):
+    """The answer text, and in structured mode the quote it was rendered from"""
+    history = memory.history(session_id)
+    inputs = {"question": question, "history": history}
+    cart = None
+    if answer_format == "structured":
+        cart, answer = priced_cart(structured_chain.invoke(inputs))
+    else:
+        # Warm answers were made without a conversation, so only a first question can use one
+        answer = None if history else faq_warmer.lookup(question)
+        if answer is None:
+            answer = rag_chain.invoke(inputs)
+    memory.append(session_id, question, answer)
+    note(answer=answer)
+    return answer, cart
+
+# The structured model only reads the cart; prices, stock and shipping come from the database (no discount here)
+def priced_cart(cart):
+    conn = sqlite3.connect(db_path)
+    try:
+        return price_cart(conn, cart, discount=False)
+    finally:
+        conn.close()
 
-# Function to format the documents into a string
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+# Sizes, prices and items named in the question, read through the variant indexes
+def build_context(question):
+    conn = sqlite3.connect(db_path)
+    try:
+        facts = variant_context(conn, question, "ukuran")
+    finally:
+        conn.close()
+    context = retrieval_cache.context(question)
+    return f"{facts}\n\n{context}" if facts else context
+
+def build_documents():
+    """The catalog as the documents indexed in the vector store"""
+    from langchain_core.documents import Document
+
+    # Retrieve current barang and ongkir data; past CATALOG_DOC_ROWS rows are
+    # found through their own documents (embedding_queue.py)
+    barang = get_barang(limit=settings.CATALOG_DOC_ROWS)
+    ongkir = get_ongkir(limit=settings.CATALOG_DOC_ROWS)
+
+    # Membuat string daftar barang untuk dokumen
+    barang_text = "\n".join([
+        f"{item['nama']} (Kategori: {item['kategori']}, Harga: Rp{item['harga']}, "
+        f"Ukuran: {', '.join(item['ukuran'])}, Stok: {'Tersedia' if item['stok'] else 'Habis'})"
+        for item in barang
+    ])
+    ongkir_text = ", ".join([f"{k} (Rp{v})" for k, v in ongkir.items()])
+
+    # Membuat dokumen
+    documents = [
+        Document(
+            page_content=f"Barang yang tersedia:\n{barang_text}.",
+            metadata={"source": "product_info"},
+        ),
+        Document(
+            page_content=f"Ongkos kirim: {ongkir_text}.",
+            metadata={"source": "shipping_info"},
+        ),
+        Document(
+            page_content="Setelah memilih warna, ukuran, dan alamat, silakan lakukan transfer sesuai total biaya.",
+            metadata={"source": "cart"},
+        ),
+    ]
+    return documents
+
+_ready = False
+
+def init():
+    """Open the database, load the models and build the chains, once
+
+    LangChain, Chroma and FastEmbed are imported here rather than at the
+    top, so importing the app stays cheap until it is served.
+    """
+    global _ready, llm, embeddings, catalog_watcher, retrieval_cache, faq_warmer, suggest_index, scheduler, memory, rag_chain, structured_chain
+    if _ready:
+        return
+    from embedding_service import get_embeddings
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableLambda
+
+    timer = StartupTimer(TENANT)
+    init_db()
+    timer.lap("init_db")
+
+    # Initialize or load the LLM (one pool per model, shared by the tenants of a server)
+    llm = load_llm(model_config_path, {"model": "modellexnew:latest", "temperature": 0})
+    timer.lap("llm")
+
+    # Initialize the embeddings (shared with the other apps through the embedding service)
+    embeddings = get_embeddings("intfloat/multilingual-e5-large")
+    timer.lap("embeddings")
+
+    # Initialize the vector store
+    vector_store = make_vector_store(
+        embeddings,
+        collection_name=collection_name(TENANT, "example_collection"),
+        persist_directory=persist_directory,
+        snapshot_path=snapshot_path,
+    )
+    print("Vector store initialized.")
+
+    documents = build_documents()
+
+    # Tambahkan dokumen ke vector store jika belum ada data (snapshot HNSW yang basi dibangun ulang di background)
+    if sync_documents(vector_store, documents, get_catalog_version(db_path)):
+        print("Documents added to vector store and persisted.")
+    timer.lap("vector_store")
+
+    # Set up retriever
+    retriever = vector_store.as_retriever(
+        search_type="similarity",
+        search_kwargs={"k": 3}
+    )
+
+    # Initialize the prompt template
+    rag_prompt = PromptTemplate.from_template(load_prompt(TENANT, template))
+
+    # Catalog changes made by any worker or node reach the cache within milliseconds
+    catalog_watcher = CatalogWatcher(db_path, f"catalog:{TENANT}", bus=get_bus()).start()
+
+    # Retrieved context is reused until the catalog changes (stored in CACHE_BACKEND)
+    retrieval_cache = RetrievalCache(retriever, format_docs, catalog_watcher.current, version_ttl=0,
+                                     namespace=f"retrieval:{TENANT}")
+
+    # Type-ahead index over catalog names, kept current from suggest_log
+    suggest_index = SuggestIndex(db_path, ["barang", "kota"])
+
+    # Every generation waits for a slot in the priority scheduler (one per process)
+    scheduler = get_scheduler()
+
+    # Conversations keep their recent turns, older ones are summarized at batch priority
+    memory = ConversationMemory(db_path, summarize=llm_summarizer(scheduler, llm))
+
+    # Chain input: {"question": ..., "history": memory.history(session_id)}
+    chain_inputs = {
+        "context": itemgetter("question") | RunnableLambda(build_context),
+        "question": itemgetter("question"),
+        "history": itemgetter("history"),
+    }
+
+    # Create the RAG chain
+    rag_chain = (
+        chain_inputs
+        | rag_prompt
+        | scheduler.wrap(llm)
+        | StrOutputParser()
+    )
+
+    # Structured mode: a compact JSON cart (constrained decoding, capped length), priced and rendered on the server
+    structured_chain = (
+        chain_inputs
+        | PromptTemplate.from_template(load_prompt(f"{TENANT}_structured", STRUCTURED_TEMPLATE))
+        | scheduler.wrap(llm, model_kwargs=structured_model_kwargs())
+        | StrOutputParser()
+        | parse_cart
+    )
+    timer.lap("chains")
+
+    # Answers to the frequent questions are generated ahead of time while the LLM is idle
+    faq_warmer = FAQWarmer(db_path, lambda q: rag_chain.invoke({"question": q, "history": ""}), build_context,
+                           catalog_watcher.current, scheduler, namespace=f"faq:{TENANT}")
+    if settings.FAQ_WARMING:
+        faq_warmer.start()
+    timer.lap("background")
+
+    # Sizes and entry counts in /debug/memory
+    register_components(TENANT, vector_store=vector_store, retrieval_cache=retrieval_cache, faq=faq_warmer,
+                        suggest_index=suggest_index, memory=memory)
+    _ready = True
 
-# Create the RAG chain
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | rag_prompt
-    | llm
-    | StrOutputParser()
-)
 
 # HTML template (unchanged from previous version)
 HTML_TEMPLATE = """
@@ -306,7 +423,7 @@ HTML_TEMPLATE = """
         <form method="POST">
             <h2>Ask a Question:</h2>
             <p class="example">Example: "What is the shipping cost to Jakarta for 2 Baju Kemeja size M?"</p>
-            <input type="text" name="question" placeholder="Enter your question here" required>
+            <input type="text" name="question" data-suggest="barang,kota" placeholder="Enter your question here" required>
             <input type="submit" value="Ask">
         </form>
 
@@ -317,54 +434,120 @@ HTML_TEMPLATE = """
         </div>
         {% endif %}
     </div>
+    {{ suggest_script | safe }}
 </body>
 </html>
 """
 
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
+@rate_limited("form")
+@profiled
+@traced("form")
 def home():
     answer = None
+    session_id = request.cookies.get("session_id") or uuid4().hex
     available_items = get_barang()
     shipping_rates = get_ongkir()
 
     if request.method == "POST":
         question = request.form.get("question")
         if question:
-            # Retrieve documents
-            retrieved_docs = retriever.invoke({"input": question})
-            formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
-            
             # Get the answer from the chain
-            answer = rag_chain.invoke(question)
+            with use_priority("interactive"):
+                answer, _ = answer_question(question, session_id, settings.ANSWER_FORMAT)
     
-    return render_template_string(
+    response = make_response(render_template_string(
         HTML_TEMPLATE,
         available_items=available_items,
         shipping_rates=shipping_rates,
-        answer=answer
-    )
+        answer=answer,
+        suggest_script=SUGGEST_SCRIPT
+    ))
+    response.set_cookie("session_id", session_id, httponly=True, samesite="Lax")
+    return response
 
 # Keep the favicon route
-@app.route('/favicon.ico')
+@bp.route('/favicon.ico')
 def favicon():
     return '', 204
 
 # Keep the /ask endpoint for API access
-@app.route("/ask", methods=["POST"])
+@bp.route("/ask", methods=["POST"])
+@rate_limited("ask")
+@profiled
+@traced("ask")
 def ask():
     try:
         data = request.get_json()
         question = data.get("question")
         if not question:
             return jsonify({"error": "Question field is required."}), 400
-
-        retrieved_docs = retriever.invoke({"input": question})
-        formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
-        answer = rag_chain.invoke(question)
-        return jsonify({"question": question, "answer": answer})
-
+        if not isinstance(question, str):
+            return jsonify({"error": "Question must be text."}), 400
+
+        answer_format = data.get("format", settings.ANSWER_FORMAT)
+        if answer_format not in ("text", "structured"):
+            return jsonify({"error": "format must be text or structured."}), 400
+
+        session_id = data.get("session_id") or uuid4().hex
+        with use_priority("api"):
+            answer, cart = answer_question(question, session_id, answer_format)
+        response = {"question": question, "answer": answer, "session_id": session_id}
+        if cart is not None:
+            response["cart"] = cart
+        return jsonify(response)
+
+    except SchedulerTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except StructuredOutputError as e:
+        return jsonify({"error": str(e)}), 502
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@bp.route("/items")
+@rate_limited("page")
+def items():
+    """Items by size, price range and stock: /items?ukuran=M&max_harga=200000&in_stock=1"""
+    return jsonify(get_barang(**item_filters(request.args, "ukuran")))
+
+@bp.route("/suggest")
+@rate_limited("page")
+def suggest():
+    """Catalog names starting with q, for the type-ahead of the input fields"""
+    kinds = [k for k in request.args.get("kinds", "").split(",") if k]
+    limit = min(request.args.get("limit", 8, type=int), 20)
+    return jsonify(suggest_index.suggest(request.args.get("q", ""), limit=limit, kinds=kinds))
+
+@bp.route("/metrics")
+def metrics():
+    return jsonify({
+        "scheduler": scheduler.stats(),
+        "llm_backends": llm.stats(),
+        "embeddings": embeddings.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "catalog_watcher": catalog_watcher.stats(),
+        "faq": faq_warmer.stats(),
+        "memory": memory.stats(),
+        "suggest_index": suggest_index.stats(),
+    })
+
+_app = None
+
+def create_app():
+    """The app on its own, blueprint at /"""
+    global _app
+    if _app is None:
+        init()
+        _app = Flask(__name__)
+        _app.register_blueprint(bp)
+        _app.register_blueprint(debug_bp)
+    return _app
+
+def __getattr__(name):
+    # "chatbot:app" (gunicorn, flask run) builds the app on first access
+    if name == "app":
+        return create_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", debug=True)
+    run_cli(__file__, create_app, "Shopping assistant", host="0.0.0.0", debug=True)
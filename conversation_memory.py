@@ -0,0 +1,221 @@
+"""Session memory for the chat endpoints
+
+Turns are stored per session in SQLite. The prompt gets the newest turns
+that fit in ``MEMORY_WINDOW_TOKENS`` plus a running summary of everything
+older, so its size stays the same however long the conversation gets.
+Turns that fall out of the window are folded into the summary by a
+background thread (an LLM call at batch priority); the summary keeps the
+cart, the destination city and open questions. Every query reads a bounded
+number of turns, also when summaries fall behind: the window never holds
+more than ``window_tokens // 2 + 1`` turns (each counts at least 2 tokens),
+and old turns are folded one window's worth at a time.
+"""
+import queue
+import sqlite3
+import threading
+
+import settings
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a customer and a shop assistant.
+Keep the cart (items, sizes, quantities), the destination city, the project or agency asked about,
+and open questions. Drop greetings and anything already answered. Answer with the summary only,
+in at most {words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+"""
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def _clip(text, tokens):
+    limit = tokens * 4
+    return text if len(text) <= limit else "..." + text[-limit:]
+
+
+def init_memory_tables(conn):
+    """Create the chat_sessions and chat_turns tables"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS chat_sessions (
+                        id TEXT PRIMARY KEY,
+                        summary TEXT DEFAULT '',
+                        summarized_upto INTEGER DEFAULT 0,
+                        updated_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS chat_turns (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT,
+                        question TEXT,
+                        answer TEXT,
+                        tokens INTEGER)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS chat_turns_session ON chat_turns (session_id, id)")
+
+
+class ConversationMemory:
+    """Token-bounded history per session with a rolling summary"""
+
+    def __init__(self, db_path, summarize=None, window_tokens=None, summary_tokens=None):
+        self.db_path = db_path
+        # summarize(prompt) -> text; without it old turns are clipped instead
+        self.summarize = summarize
+        self.window_tokens = window_tokens or settings.MEMORY_WINDOW_TOKENS
+        self.summary_tokens = summary_tokens or settings.MEMORY_SUMMARY_TOKENS
+        self._pending = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self.summaries = 0
+        self.summary_errors = 0
+        conn = sqlite3.connect(db_path)
+        init_memory_tables(conn)
+        conn.commit()
+        conn.close()
+        threading.Thread(target=self._worker, name="memory-summarizer", daemon=True).start()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _state(self, conn, session_id):
+        row = conn.execute(
+            "SELECT summary, summarized_upto FROM chat_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        return row or ("", 0)
+
+    def _max_turns(self):
+        # Every turn counts at least 2 tokens, so no window holds more
+        return self.window_tokens // 2 + 1
+
+    def _within_budget(self, rows):
+        window, used = [], 0
+        for row in rows:
+            if window and used + row[3] > self.window_tokens:
+                break
+            window.append(row)
+            used += row[3]
+        return window
+
+    def _window(self, conn, session_id, summarized_upto):
+        """Newest unsummarized turns within the token budget, oldest first, and
+        the id of the newest turn left out of it (0 when none is)"""
+        rows = conn.execute(
+            """SELECT id, question, answer, tokens FROM chat_turns WHERE session_id = ? AND id > ?
+               ORDER BY id DESC LIMIT ?""",
+            (session_id, summarized_upto, self._max_turns() + 1),
+        ).fetchall()
+        window = self._within_budget(rows)
+        return window[::-1], rows[len(window)][0] if len(rows) > len(window) else 0
+
+    def _overflow(self, conn, session_id, summarized_upto, last):
+        """Oldest unsummarized turns up to id last, one window's worth"""
+        rows = conn.execute(
+            """SELECT id, question, answer, tokens FROM chat_turns WHERE session_id = ? AND id > ? AND id <= ?
+               ORDER BY id LIMIT ?""",
+            (session_id, summarized_upto, last, self._max_turns()),
+        ).fetchall()
+        return self._within_budget(rows)
+
+    def history(self, session_id):
+        """Summary and recent turns of a session, formatted for the prompt"""
+        if not session_id:
+            return ""
+        conn = self._connect()
+        try:
+            summary, summarized_upto = self._state(conn, session_id)
+            window, _ = self._window(conn, session_id, summarized_upto)
+        finally:
+            conn.close()
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier messages: {summary}")
+        for _, question, answer, _ in window:
+            parts.append(f"Customer: {question}\nAssistant: {answer}")
+        return "\n".join(parts)
+
+    def append(self, session_id, question, answer):
+        """Store a turn and schedule compaction when the window overflows"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO chat_turns (session_id, question, answer, tokens) VALUES (?, ?, ?, ?)",
+                (session_id, question, answer, estimate_tokens(question) + estimate_tokens(answer)),
+            )
+            conn.execute(
+                '''INSERT INTO chat_sessions (id) VALUES (?)
+                   ON CONFLICT (id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP''', (session_id,)
+            )
+            conn.commit()
+            _, summarized_upto = self._state(conn, session_id)
+            _, left_out = self._window(conn, session_id, summarized_upto)
+        finally:
+            conn.close()
+        if left_out:
+            with self._lock:
+                if session_id in self._queued:
+                    return
+                self._queued.add(session_id)
+            self._pending.put(session_id)
+
+    def compact(self, session_id):
+        """Fold the turns that left the window into the summary"""
+        conn = self._connect()
+        try:
+            summary, summarized_upto = self._state(conn, session_id)
+            _, left_out = self._window(conn, session_id, summarized_upto)
+            while summarized_upto < left_out:
+                overflow = self._overflow(conn, session_id, summarized_upto, left_out)
+                if not overflow:
+                    break
+                summary = self._fold(conn, session_id, summary, overflow)
+                summarized_upto = overflow[-1][0]
+        finally:
+            conn.close()
+
+    def _fold(self, conn, session_id, summary, overflow):
+        """Fold the overflow turns into the summary; returns the new summary"""
+        turns = "\n".join(f"Customer: {q}\nAssistant: {a}" for _, q, a, _ in overflow)
+        new_summary = None
+        if self.summarize is not None:
+            try:
+                new_summary = self.summarize(SUMMARY_PROMPT.format(
+                    words=self.summary_tokens * 3 // 4, summary=summary or "-", turns=turns))
+                self.summaries += 1
+            except Exception:
+                self.summary_errors += 1
+        if not new_summary:
+            new_summary = f"{summary}\n{turns}".strip()
+        new_summary = _clip(new_summary.strip(), self.summary_tokens)
+        conn.execute(
+            "UPDATE chat_sessions SET summary = ?, summarized_upto = ? WHERE id = ?",
+            (new_summary, overflow[-1][0], session_id),
+        )
+        conn.commit()
+        return new_summary
+
+    def _worker(self):
+        while True:
+            session_id = self._pending.get()
+            with self._lock:
+                self._queued.discard(session_id)
+            try:
+                self.compact(session_id)
+            except sqlite3.Error:
+                self.summary_errors += 1
+
+    def stats(self):
+        return {
+            "pending_compactions": self._pending.qsize(),
+            "summaries": self.summaries,
+            "summary_errors": self.summary_errors,
+        }
+
+
+def llm_summarizer(scheduler, llm):
+    """summarize(prompt) running the chat model at batch priority"""
+    def summarize(prompt):
+        message = scheduler.run("batch", llm.invoke, prompt,
+                                model_kwargs={"num_predict": settings.MEMORY_SUMMARY_TOKENS * 2})
+        return getattr(message, "content", message)
+    return summarize
@@ -0,0 +1,245 @@
+"""Background embedding of catalog rows changed by imports
+
+``catalog_import`` records every inserted or updated row in the
+``embedding_queue`` table. ``EmbeddingQueue`` drains it in batches from a
+thread of the app: each row becomes its own document (id ``<table>:<row id>``)
+that is upserted into the vector store, so a large import only costs
+embeddings for the rows it changed and the app keeps answering meanwhile.
+The rows that got a document are kept in ``embedded_rows``: a store built
+from scratch (``row_documents``) gets them back, and a store that keeps
+changes in memory (HNSW) is snapshotted whenever the queue goes idle.
+
+Given the app's ``documents_fn``, the queue also refreshes the aggregate
+catalog documents (the product list, shipping rates) whenever it is idle
+and the catalog version moved on, e.g. after orders changed the stock.
+Those list at most ``CATALOG_DOC_ROWS`` rows of each table, so a refresh
+costs the same on a catalog of a million rows; past that, rows are found
+through their own documents.
+"""
+import sqlite3
+import threading
+
+import settings
+from catalog_names import MAX_VARIABLES
+from catalog_version import get_catalog_version
+from vector_backends import refresh_documents
+
+
+def init_embedding_queue(conn):
+    """Create the embedding_queue table"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS embedding_queue (
+                        table_name TEXT,
+                        row_id INTEGER,
+                        queued_at REAL,
+                        PRIMARY KEY (table_name, row_id)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS embedded_rows (
+                        table_name TEXT,
+                        row_id INTEGER,
+                        PRIMARY KEY (table_name, row_id)) WITHOUT ROWID''')
+
+
+def _stock(value):
+    return "Tersedia" if value else "Habis"
+
+
+def _load_rows(conn, table, row_ids):
+    marks = ",".join("?" * len(row_ids))
+    if table == "project_barang":
+        cur = conn.execute(
+            f"""SELECT pb.id, p.nama AS project, b.nama AS barang, pb.jumlah
+                FROM project_barang pb
+                JOIN project p ON pb.project_id = p.id
+                JOIN barang b ON pb.barang_id = b.id
+                WHERE pb.id IN ({marks})""", row_ids)
+    elif table == "barang_varian":
+        cur = conn.execute(
+            f"""SELECT v.id, b.nama AS barang, v.varian, v.stok
+                FROM barang_varian v
+                JOIN barang b ON v.barang_id = b.id
+                WHERE v.id IN ({marks})""", row_ids)
+    else:
+        cur = conn.execute(f"SELECT * FROM {table} WHERE id IN ({marks})", row_ids)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def row_text(table, row):
+    """Text of the document for one catalog row"""
+    if table == "barang":
+        details = [f"Kategori: {row.get('kategori')}", f"Harga: Rp{row.get('harga')}"]
+        for column, label in (("ukuran", "Ukuran"), ("merk", "merk")):
+            if row.get(column):
+                details.append(f"{label}: {row[column]}")
+        details.append(f"Stok: {_stock(row.get('stok'))}")
+        return f"{row['nama']} ({', '.join(details)})"
+    if table == "ongkir":
+        return f"Ongkos kirim {row['kota'].lower()} (Rp{row['biaya']})"
+    if table == "project":
+        return f"Project {row['nama']}: kota {row['kota']}, instansi {row['instansi']}, status {row['status']}"
+    if table == "project_barang":
+        return f"{row['project']}: {row['barang']} ({row['jumlah']} pcs)"
+    if table == "barang_varian":
+        return f"{row['barang']} {row['varian']} (Stok: {_stock(row['stok'])})"
+    raise ValueError(f"No document format for table '{table}'")
+
+
+def _documents(conn, table, row_ids):
+    """(ids, texts, metadatas) of the documents of some rows of a table"""
+    ids, texts, metadatas = [], [], []
+    for row in _load_rows(conn, table, row_ids):
+        ids.append(f"{table}:{row['id']}")
+        texts.append(row_text(table, row))
+        metadatas.append({"source": f"{table}_row", "table": table, "row_id": row["id"]})
+    return ids, texts, metadatas
+
+
+def row_documents(db_path):
+    """The documents of every row the queue embedded, for a store built from scratch"""
+    from langchain_core.documents import Document
+
+    conn = sqlite3.connect(db_path)
+    try:
+        try:
+            embedded = conn.execute("SELECT table_name, row_id FROM embedded_rows ORDER BY table_name, row_id").fetchall()
+        except sqlite3.OperationalError:
+            return []
+        by_table = {}
+        for table, row_id in embedded:
+            by_table.setdefault(table, []).append(row_id)
+        documents = []
+        for table, row_ids in by_table.items():
+            for start in range(0, len(row_ids), MAX_VARIABLES):
+                ids, texts, metadatas = _documents(conn, table, row_ids[start:start + MAX_VARIABLES])
+                documents += [Document(page_content=t, metadata=m, id=i) for i, t, m in zip(ids, texts, metadatas)]
+        return documents
+    finally:
+        conn.close()
+
+
+class EmbeddingQueue:
+    """Drains embedding_queue into a vector store from a background thread"""
+
+    def __init__(self, db_path, vector_store, batch_size=None, poll_interval=None, on_batch=None,
+                 documents_fn=None, documents_version=None):
+        self.db_path = db_path
+        self.vector_store = vector_store
+        self.batch_size = batch_size or settings.EMBED_QUEUE_BATCH
+        self.poll_interval = poll_interval or settings.EMBED_QUEUE_POLL_INTERVAL
+        self.on_batch = on_batch
+        # Builds the aggregate documents; documents_version is the catalog version they were built at
+        self.documents_fn = documents_fn
+        self.documents_version = documents_version
+        self.refreshes = 0
+        self.snapshots = 0
+        # Changes not in the store's snapshot yet
+        self._unsaved = False
+        self._thread = None
+        self._stop = threading.Event()
+        self.embedded = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        init_embedding_queue(conn)
+        conn.commit()
+        while not self._stop.is_set():
+            # A rebuild swaps in an index built without what we would add now
+            if getattr(self.vector_store, "rebuilding", False):
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                done = self.drain_once(conn) or self.refresh_once() or self.save_once()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                done = 0
+            if not done:
+                self._stop.wait(self.poll_interval)
+
+    def drain_once(self, conn):
+        """Embed one batch of queued rows; returns the number of rows taken"""
+        queued = conn.execute(
+            "SELECT table_name, row_id, queued_at FROM embedding_queue ORDER BY queued_at LIMIT ?",
+            (self.batch_size,),
+        ).fetchall()
+        if not queued:
+            return 0
+        by_table = {}
+        for table, row_id, _ in queued:
+            by_table.setdefault(table, []).append(row_id)
+        ids, texts, metadatas = [], [], []
+        for table, row_ids in by_table.items():
+            table_ids, table_texts, table_metadatas = _documents(conn, table, row_ids)
+            ids += table_ids
+            texts += table_texts
+            metadatas += table_metadatas
+        if texts:
+            self.vector_store.add_texts(texts, metadatas=metadatas, ids=ids)
+            self._unsaved = True
+        # Rows queued again while we were embedding stay in the queue
+        conn.executemany(
+            "DELETE FROM embedding_queue WHERE table_name = ? AND row_id = ? AND queued_at = ?", queued
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO embedded_rows (table_name, row_id) VALUES (?, ?)",
+            [(table, row_id) for table, row_id, _ in queued],
+        )
+        conn.commit()
+        self.embedded += len(texts)
+        self.batches += 1
+        if self.on_batch is not None:
+            self.on_batch()
+        return len(queued)
+
+    def refresh_once(self):
+        """Rebuild the aggregate documents if the catalog changed; returns True when it did"""
+        if self.documents_fn is None:
+            return False
+        version = get_catalog_version(self.db_path)
+        if version == self.documents_version:
+            return False
+        refresh_documents(self.vector_store, self.documents_fn())
+        self.documents_version = version
+        self.refreshes += 1
+        self._unsaved = True
+        if self.on_batch is not None:
+            self.on_batch()
+        return True
+
+    def save_once(self):
+        """Snapshot a store that keeps its changes in memory, once the queue is idle; True when it did"""
+        if not self._unsaved or not hasattr(self.vector_store, "save_snapshot"):
+            return False
+        self.vector_store.save_snapshot(self.documents_version)
+        self._unsaved = False
+        self.snapshots += 1
+        return True
+
+    def stats(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            pending = conn.execute("SELECT COUNT(*) FROM embedding_queue").fetchone()[0]
+        except sqlite3.OperationalError:
+            pending = 0
+        finally:
+            conn.close()
+        return {
+            "pending": pending,
+            "embedded": self.embedded,
+            "batches": self.batches,
+            "refreshes": self.refreshes,
+            "snapshots": self.snapshots,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
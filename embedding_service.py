@@ -0,0 +1,270 @@
+"""Shared, micro-batching embedding service
+
+``BatchingEmbedder`` wraps a LangChain embedding model: concurrent
+``embed_query``/``embed_documents`` calls are collected for a few
+milliseconds and sent to the model as one batch, which is what the ONNX
+runtime behind FastEmbed is fast at.
+
+The same batcher can be served over a Unix socket so that every worker of
+every app shares a single copy of the model:
+
+    python embedding_service.py --socket /tmp/embeddings.sock
+
+and the apps pick it up through ``EMBEDDING_SOCKET`` (see ``get_embeddings``).
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+import settings
+from memory_report import measure_load
+
+_HEADER = struct.Struct("!I")
+_SHAPE = struct.Struct("!II")
+
+
+class _Request:
+    __slots__ = ("kind", "texts", "event", "vectors", "error")
+
+    def __init__(self, kind, texts):
+        self.kind = kind
+        self.texts = texts
+        self.event = threading.Event()
+        self.vectors = None
+        self.error = None
+
+
+class BatchingEmbedder(Embeddings):
+    """Embeddings that merge concurrent calls into batched model calls"""
+
+    def __init__(self, base, max_batch=None, max_wait_ms=None):
+        self.base = base
+        self.max_batch = max_batch or settings.EMBEDDING_MAX_BATCH
+        self.max_wait = (settings.EMBEDDING_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._pending = []
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._worker, name="embed-batcher", daemon=True).start()
+
+    def _submit(self, kind, texts):
+        request = _Request(kind, list(texts))
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        request.event.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def embed_query(self, text):
+        return self._submit("query", [text])[0]
+
+    def embed_documents(self, texts):
+        return self._submit("passage", texts) if texts else []
+
+    def embed_queries(self, texts):
+        """Embed several queries as part of the next batch"""
+        return self._submit("query", texts) if texts else []
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Wait a little for other callers to join the batch
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(r.texts) for r in self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0].texts) <= self.max_batch):
+                request = self._pending.pop(0)
+                batch.append(request)
+                size += len(request.texts)
+            return batch
+
+    def _embed(self, kind, texts):
+        if kind == "passage":
+            return self.base.embed_documents(texts)
+        model = getattr(self.base, "_model", None)
+        if model is not None and hasattr(model, "query_embed"):
+            # FastEmbed embeds a list of queries in one ONNX run
+            return [vector.tolist() for vector in model.query_embed(texts)]
+        return [self.base.embed_query(text) for text in texts]
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            for kind in ("query", "passage"):
+                requests = [r for r in batch if r.kind == kind]
+                if not requests:
+                    continue
+                texts = [text for r in requests for text in r.texts]
+                try:
+                    vectors = self._embed(kind, texts)
+                except Exception as e:
+                    for r in requests:
+                        r.error = e
+                        r.event.set()
+                    continue
+                self.batches += 1
+                self.texts += len(texts)
+                offset = 0
+                for r in requests:
+                    r.vectors = vectors[offset:offset + len(r.texts)]
+                    offset += len(r.texts)
+                    r.event.set()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0,
+        }
+
+
+# Wire format: a length-prefixed JSON request {"kind", "texts"} answered by
+# (count, dim) followed by count * dim float32 values, or by count 0 and a
+# length-prefixed JSON error
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                (length,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+            except ConnectionError:
+                return
+            request = json.loads(_recv_exactly(sock, length))
+            try:
+                if request["kind"] == "query":
+                    vectors = self.server.embedder.embed_queries(request["texts"])
+                else:
+                    vectors = self.server.embedder.embed_documents(request["texts"])
+            except Exception as e:
+                error = json.dumps({"error": str(e)}).encode()
+                sock.sendall(_SHAPE.pack(0, 0) + _HEADER.pack(len(error)) + error)
+                continue
+            dim = len(vectors[0]) if vectors else 0
+            payload = array("f", (value for vector in vectors for value in vector))
+            sock.sendall(_SHAPE.pack(len(vectors), dim) + payload.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, embedder):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.embedder = embedder
+
+
+class EmbeddingClient(Embeddings):
+    """Embeddings served by an ``EmbeddingServer`` over a Unix socket"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _call(self, kind, texts):
+        body = json.dumps({"kind": kind, "texts": texts}).encode()
+        sock = self._connection()
+        try:
+            sock.sendall(_HEADER.pack(len(body)) + body)
+            count, dim = _SHAPE.unpack(_recv_exactly(sock, _SHAPE.size))
+            if count == 0 and dim == 0 and texts:
+                (length,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+                raise RuntimeError(json.loads(_recv_exactly(sock, length))["error"])
+            values = array("f")
+            values.frombytes(_recv_exactly(sock, count * dim * values.itemsize))
+        except OSError:
+            self._local.sock = None
+            sock.close()
+            raise
+        return [values[i * dim:(i + 1) * dim].tolist() for i in range(count)]
+
+    def embed_query(self, text):
+        return self._call("query", [text])[0]
+
+    def embed_documents(self, texts):
+        return self._call("passage", list(texts)) if texts else []
+
+    def stats(self):
+        return {"socket": self.path}
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _fastembed(model_name):
+    from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+
+    return FastEmbedEmbeddings(model_name=model_name)
+
+
+def get_embeddings(model_name=None):
+    """Embeddings shared by everything in this process
+
+    Uses the sidecar when ``EMBEDDING_SOCKET`` points at a running one,
+    otherwise loads the model once and batches calls in-process.
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL
+    with _shared_lock:
+        if model_name not in _shared:
+            if settings.EMBEDDING_SOCKET and os.path.exists(settings.EMBEDDING_SOCKET):
+                _shared[model_name] = EmbeddingClient(settings.EMBEDDING_SOCKET)
+            else:
+                model = measure_load(f"embeddings:{model_name}", lambda: _fastembed(model_name))
+                _shared[model_name] = BatchingEmbedder(model)
+        return _shared[model_name]
+
+
+def loaded_embeddings():
+    """The embeddings get_embeddings created so far, by model name"""
+    with _shared_lock:
+        return dict(_shared)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a batching embedding model over a Unix socket")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SOCKET or "/tmp/embeddings.sock")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    args = parser.parse_args()
+    server = EmbeddingServer(args.socket, BatchingEmbedder(_fastembed(args.model)))
+    print(f"Embedding service for {args.model} listening on {args.socket}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
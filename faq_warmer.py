@@ -0,0 +1,211 @@
+"""Precomputed answers to the questions most traffic asks
+
+Most questions are one of a few shapes about one catalog row: the shipping
+fee to a city (``ongkir``), the status of a project (``project``),
+whether an item is in stock (``barang``), or one of its sizes or brands
+(``barang_varian``). ``FAQWarmer`` enumerates those canonical questions
+from the catalog (``canonical_questions``) and answers them ahead of time
+through the app's chain. It runs at batch priority and only while the LLM
+scheduler is idle. Answers go to a cache backend
+(cache_backends.make_cache), so the workers of a host or a cluster can
+share them.
+
+An answer belongs to the catalog version it was checked against and is
+only served while that version is current. After a change, the warmer
+rebuilds each question's context (a retrieval-cache lookup, no LLM). It
+regenerates only the answers whose context changed; the others are just
+re-stamped with the new version.
+
+A question is served from the store when it normalizes (retrieval_cache.
+normalize_question) to a canonical question or one of its aliases.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+
+import settings
+from cache_backends import make_cache
+from llm_scheduler import use_priority
+from retrieval_cache import normalize_question
+from traffic import note
+
+# kind: (names of the catalog rows, question templates); the first template is
+# the one answered, the others are served the same answer. Kinds are warmed in
+# this order, cheapest (fewest rows) first
+FAQ_KINDS = {
+    "ongkir": ("SELECT kota FROM ongkir ORDER BY id",
+               ("ongkir ke {}", "berapa ongkir ke {}", "ongkos kirim ke {}", "biaya kirim ke {}")),
+    "project": ("SELECT nama FROM project ORDER BY id",
+                ("status {}", "status project {}", "bagaimana status {}")),
+    "barang": ("SELECT nama FROM barang ORDER BY id",
+               ("stok {}", "apakah {} tersedia", "apakah {} ada", "{} ready")),
+    "barang_varian": ('''SELECT b.nama || ' ' || v.varian FROM barang_varian v
+                         JOIN barang b ON b.id = v.barang_id ORDER BY v.id''',
+                      ("stok {}", "apakah {} tersedia", "apakah {} ada", "ada {}")),
+}
+
+
+def canonical_questions(conn, limit=None):
+    """(kind, question, aliases) for every catalog row of the kinds the database has"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    found = []
+    for kind, (query, templates) in FAQ_KINDS.items():
+        if kind not in tables:
+            continue
+        for (name,) in conn.execute(query):
+            if not name:
+                continue
+            if limit and len(found) >= limit:
+                return found
+            found.append((kind, templates[0].format(name), [t.format(name) for t in templates[1:]]))
+    return found
+
+
+def _context_hash(context):
+    return hashlib.sha1(context.encode()).hexdigest()
+
+
+class FAQWarmer:
+    """Keeps the answers to the canonical questions current from a background thread
+
+    ``answer_fn(question)`` runs the chain for a question without history,
+    ``context_fn(question)`` returns the context it would be given, and
+    ``version_fn()`` the current catalog version.
+    """
+
+    def __init__(self, db_path, answer_fn, context_fn, version_fn, scheduler, namespace="faq",
+                 max_questions=None, poll_interval=None, idle_poll=None):
+        self.db_path = db_path
+        self.answer_fn = answer_fn
+        self.context_fn = context_fn
+        self.version_fn = version_fn
+        self.scheduler = scheduler
+        self.max_questions = settings.FAQ_MAX_QUESTIONS if max_questions is None else max_questions
+        self.poll_interval = poll_interval or settings.FAQ_POLL_INTERVAL
+        self.idle_poll = idle_poll or settings.FAQ_IDLE_POLL
+        self.store = make_cache(namespace, max_entries=max(1, self.max_questions))
+        # Normalized question or alias -> normalized canonical question
+        self._canonical = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self.questions = 0
+        self.warm = 0
+        self._warming_version = None
+        self.warmed_version = None
+        self.generated = 0
+        self.restamped = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_run_s = None
+        self.hits = 0
+        self.stale = 0
+        self.other = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="faq-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def lookup(self, question):
+        """The precomputed answer to a question, None unless it is a warm FAQ"""
+        key = self._canonical.get(normalize_question(question))
+        if key is None:
+            self.other += 1
+            return None
+        entry = self.store.get("a:" + key)
+        if entry is None or entry["version"] != self.version_fn():
+            self.stale += 1
+            note(faq="stale")
+            return None
+        self.hits += 1
+        note(faq="hit")
+        return entry["answer"]
+
+    def _run(self):
+        while not self._stop.is_set():
+            version = self.version_fn()
+            if version != self.warmed_version:
+                try:
+                    self.warm_all(version)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+            self._stop.wait(self.poll_interval)
+
+    def _wait_idle(self):
+        # Anything queued or generating goes first
+        while not self.scheduler.idle() and not self._stop.is_set():
+            self._stop.wait(self.idle_poll)
+
+    def warm_all(self, version):
+        """Bring every canonical question up to version; stops early if the catalog changes again"""
+        start = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            questions = canonical_questions(conn, self.max_questions)
+        finally:
+            conn.close()
+        canonical = {}
+        for _, question, aliases in questions:
+            key = normalize_question(question)
+            canonical[key] = key
+            for alias in aliases:
+                canonical.setdefault(normalize_question(alias), key)
+        self._canonical = canonical
+        self.questions = len(questions)
+        self.warm = 0
+        self._warming_version = version
+
+        for kind, question, _ in questions:
+            if self._stop.is_set() or self.version_fn() != version:
+                return
+            key = "a:" + normalize_question(question)
+            try:
+                context_hash = _context_hash(self.context_fn(question))
+                entry = self.store.get(key)
+                if entry is not None and entry["context_hash"] == context_hash:
+                    if entry["version"] != version:
+                        entry["version"] = version
+                        self.store.set(key, entry)
+                        self.restamped += 1
+                else:
+                    self._wait_idle()
+                    with use_priority("batch"):
+                        answer = self.answer_fn(question)
+                    self.store.set(key, {"kind": kind, "version": version, "context_hash": context_hash,
+                                         "answer": answer, "generated_at": time.time()})
+                    self.generated += 1
+                self.warm += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+        self.warmed_version = version
+        self.last_run_s = round(time.perf_counter() - start, 3)
+
+    def stats(self):
+        version = self.version_fn()
+        # Answers warmed for an older version are not served
+        warm = self.warm if self._warming_version == version else 0
+        faq_lookups = self.hits + self.stale
+        lookups = faq_lookups + self.other
+        return {
+            "questions": self.questions,
+            "warm": warm,
+            "coverage": round(warm / self.questions, 4) if self.questions else 0.0,
+            "catalog_version": version,
+            "warmed_version": self.warmed_version,
+            "generated": self.generated,
+            "restamped": self.restamped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_run_s": self.last_run_s,
+            "hits": self.hits,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "faq_hit_ratio": round(self.hits / faq_lookups, 4) if faq_lookups else 0.0,
+        }
@@ -0,0 +1,369 @@
+"""Exact vector search over a memory-mapped NumPy matrix
+
+For catalogs of a few hundred to a few tens of thousands of rows a brute
+force inner product over the whole matrix is faster than an ANN index and
+needs no database: ``FlatVectorStore`` keeps L2-normalised embeddings in one
+``.npy`` file that is memory-mapped on load, and the texts/metadata next to
+it in a JSON file. It implements the LangChain ``VectorStore`` interface, so
+``as_retriever()`` works as with Chroma.
+
+Vectors can be stored as float32, float16 (half the memory) or int8 with a
+per-vector scale (a quarter). Quantized stores can keep the float32 vectors
+in a separate file that is only memory-mapped, never scanned: the best
+``rescore * k`` candidates of the quantized search are re-scored with them.
+
+Adding texts embeds only those texts. New rows are written at the end of the
+``.npy`` files (numpy leaves room in the header for a longer first
+dimension) and replaced rows in place. Their documents go to an append-only
+``docs.log`` that is folded into the JSON file once it is as long as the
+store, so a stream of small batches costs time in proportion to the batches,
+not to the store.
+"""
+import io
+import json
+import os
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Rows scored per NumPy call, bounds the float32 temporaries of quantized stores
+SCORE_CHUNK = 4096
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _append_rows(array, buffers, name, rows):
+    """array with rows appended, inside a buffer of spare capacity kept in buffers[name]"""
+    buffer = buffers.get(name)
+    size = len(array) + len(rows)
+    if buffer is None or array.base is not buffer or len(buffer) < size:
+        buffer = np.empty((max(size, 2 * len(array), 64),) + rows.shape[1:], dtype=rows.dtype)
+        buffer[:len(array)] = array
+        buffers[name] = buffer
+    buffer[len(array):size] = rows
+    return buffer[:size]
+
+
+def _write_npy_rows(path, start, rows):
+    """Write rows into an .npy file from row start on, which becomes its end
+
+    The header numpy writes has room for a longer first dimension and is
+    rewritten in place. Returns False when the file does not allow that (the
+    caller then writes the whole file).
+    """
+    fmt = np.lib.format
+    with open(path, "r+b") as f:
+        version = fmt.read_magic(f)
+        if version not in ((1, 0), (2, 0)):
+            return False
+        read, write = ((fmt.read_array_header_1_0, fmt.write_array_header_1_0) if version == (1, 0)
+                       else (fmt.read_array_header_2_0, fmt.write_array_header_2_0))
+        shape, fortran_order, dtype = read(f)
+        data_start = f.tell()
+        if fortran_order or dtype != rows.dtype or tuple(shape[1:]) != rows.shape[1:] or start > shape[0]:
+            return False
+        header = io.BytesIO()
+        write(header, {"descr": fmt.dtype_to_descr(dtype), "fortran_order": False,
+                       "shape": (start + len(rows),) + tuple(shape[1:])})
+        if header.tell() != data_start:
+            return False
+        f.seek(0)
+        f.write(header.getvalue())
+        f.seek(data_start + start * dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64)))
+        f.write(np.ascontiguousarray(rows).tobytes())
+        f.truncate()
+    return True
+
+
+def quantize_int8(vectors):
+    """Symmetric int8 scalar quantization with one scale per vector"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class FlatVectorStore(VectorStore):
+    """Brute-force cosine similarity search on a NumPy matrix"""
+
+    def __init__(self, embedding, collection_name="default", persist_directory=None,
+                 dtype="float32", rescore=0):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, not '{dtype}'")
+        self._embedding = embedding
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.dtype = dtype
+        self.rescore = rescore if dtype != "float32" else 0
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        # Row of each id
+        self._position = {}
+        # "vectors" in the storage dtype, plus "scales" for int8 and the
+        # float32 "full" vectors when re-scoring is enabled
+        self._arrays = {}
+        # Spare capacity of the arrays of a store kept in memory
+        self._buffers = {}
+        # docs.log lines written since docs.json; lines of an older generation are ignored
+        self._generation = 0
+        self._logged = 0
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+            self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def _array_names(self):
+        names = ["vectors"]
+        if self.dtype == "int8":
+            names.append("scales")
+        if self.rescore:
+            names.append("full")
+        return names
+
+    def _path(self, name):
+        return os.path.join(self.persist_directory, f"{self.collection_name}.{name}")
+
+    def _load(self):
+        docs_path = self._path("docs.json")
+        if not os.path.exists(docs_path):
+            return
+        with open(docs_path) as f:
+            docs = json.load(f)
+        if docs.get("dtype", "float32") != self.dtype or bool(docs.get("rescore")) != bool(self.rescore):
+            # Stored with other settings: start over, the caller re-adds the documents
+            return
+        self._ids, self._texts, self._metadatas = docs["ids"], docs["texts"], docs["metadatas"]
+        self._generation = docs.get("generation", 0)
+        self._replay_log()
+        self._position = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._map_arrays(self._array_names())
+
+    def _replay_log(self):
+        if not os.path.exists(self._path("docs.log")):
+            return
+        with open(self._path("docs.log")) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Cut short by a crash: its rows were never committed
+                    break
+                if entry["generation"] != self._generation:
+                    continue
+                row = entry["row"]
+                if row < len(self._ids):
+                    self._ids[row], self._texts[row], self._metadatas[row] = entry["id"], entry["text"], entry["metadata"]
+                elif row == len(self._ids):
+                    self._ids.append(entry["id"])
+                    self._texts.append(entry["text"])
+                    self._metadatas.append(entry["metadata"])
+                self._logged += 1
+
+    def _map_arrays(self, names):
+        # Rows past the documents were written by an add that did not finish
+        self._arrays = {name: np.load(self._path(f"{name}.npy"), mmap_mode="r")[:len(self._ids)] for name in names}
+
+    def _persist(self):
+        if not self.persist_directory:
+            return
+        # Write next to the targets and rename so readers never see half a file
+        for name, array in self._arrays.items():
+            with open(self._path(f"{name}.npy.tmp"), "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+        self._generation += 1
+        with open(self._path("docs.json.tmp"), "w") as f:
+            json.dump({
+                "dtype": self.dtype,
+                "rescore": bool(self.rescore),
+                "generation": self._generation,
+                "ids": self._ids,
+                "texts": self._texts,
+                "metadatas": self._metadatas,
+            }, f)
+        for name in self._arrays:
+            os.replace(self._path(f"{name}.npy.tmp"), self._path(f"{name}.npy"))
+        os.replace(self._path("docs.json.tmp"), self._path("docs.json"))
+        if os.path.exists(self._path("docs.log")):
+            os.remove(self._path("docs.log"))
+        self._logged = 0
+        self._map_arrays(list(self._arrays))
+
+    def _persist_rows(self, rows, encoded, positions):
+        """Write the given rows (encoded[name][positions[i]] for row rows[i]) and log their documents"""
+        appended = [i for i, row in enumerate(rows) if row >= len(self._arrays["vectors"])]
+        replaced = [i for i, row in enumerate(rows) if row < len(self._arrays["vectors"])]
+        for name, value in encoded.items():
+            path = self._path(f"{name}.npy")
+            if replaced:
+                array = np.load(path, mmap_mode="r+")
+                array[[rows[i] for i in replaced]] = value[[positions[i] for i in replaced]]
+                array.flush()
+                del array
+            if appended and not _write_npy_rows(path, rows[appended[0]], value[[positions[i] for i in appended]]):
+                return False
+        # The log line is the commit point of the rows written above
+        with open(self._path("docs.log"), "a") as f:
+            for row in rows:
+                f.write(json.dumps({"generation": self._generation, "row": row, "id": self._ids[row],
+                                    "text": self._texts[row], "metadata": self._metadatas[row]}) + "\n")
+        self._logged += len(rows)
+        self._map_arrays(list(encoded))
+        return True
+
+    def _encode(self, vectors):
+        arrays = {}
+        if self.dtype == "int8":
+            arrays["vectors"], arrays["scales"] = quantize_int8(vectors)
+        else:
+            arrays["vectors"] = vectors.astype(self.dtype)
+        if self.rescore:
+            arrays["full"] = vectors
+        return arrays
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        """Embed and add texts; existing ids are replaced"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = [i or str(uuid.uuid4()) for i in ids] if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        encoded = self._encode(_normalize(self._embedding.embed_documents(texts)))
+
+        # Row -> index into texts of its (last) new value; new rows come in order
+        written = {}
+        for i, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            row = self._position.get(doc_id)
+            if row is None:
+                row = self._position[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+            else:
+                self._texts[row], self._metadatas[row] = text, metadata
+            written[row] = i
+        rows, positions = list(written), list(written.values())
+        if (self.persist_directory and self._arrays and self._logged + len(rows) < len(self._ids)
+                and self._persist_rows(rows, encoded, positions)):
+            return ids
+        self._arrays = self._updated_arrays(rows, encoded, positions)
+        self._persist()
+        return ids
+
+    def _updated_arrays(self, rows, encoded, positions):
+        count = len(self._arrays["vectors"]) if self._arrays else 0
+        replaced = [(row, i) for row, i in zip(rows, positions) if row < count]
+        appended = [i for row, i in zip(rows, positions) if row >= count]
+        arrays = {}
+        for name, value in encoded.items():
+            array = self._arrays.get(name, value[:0])
+            if replaced:
+                if not array.flags.writeable:
+                    array = np.array(array)
+                array[[row for row, _ in replaced]] = value[[i for _, i in replaced]]
+            if appended:
+                array = _append_rows(array, self._buffers, name, value[appended])
+            arrays[name] = array
+        return arrays
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        drop = set(ids)
+        keep = [row for row, doc_id in enumerate(self._ids) if doc_id not in drop]
+        self._arrays = {name: np.array(array)[keep] for name, array in self._arrays.items()}
+        self._ids = [self._ids[row] for row in keep]
+        self._texts = [self._texts[row] for row in keep]
+        self._metadatas = [self._metadatas[row] for row in keep]
+        self._position = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._buffers = {}
+        self._persist()
+        return True
+
+    def ids_with_sources(self, sources):
+        """Ids of the documents whose metadata "source" is one of sources"""
+        sources = set(sources)
+        return [doc_id for doc_id, metadata in zip(self._ids, self._metadatas) if metadata.get("source") in sources]
+
+    def get_by_ids(self, ids):
+        return [self._document(self._position[i]) for i in ids if i in self._position]
+
+    def _document(self, row):
+        return Document(page_content=self._texts[row], metadata=self._metadatas[row], id=self._ids[row])
+
+    def _scores(self, query):
+        matrix = self._arrays["vectors"]
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_CHUNK):
+            chunk = matrix[start:start + SCORE_CHUNK]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        if "scales" in self._arrays:
+            scores *= self._arrays["scales"]
+        return scores
+
+    def _top_k(self, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        if not self._ids:
+            return []
+        query = _normalize(embedding)
+        scores = self._scores(query)
+        if not self.rescore:
+            return [(self._document(row), float(scores[row])) for row in self._top_k(scores, k)]
+        # Exact float32 scores for the best quantized candidates only
+        candidates = np.sort(self._top_k(scores, k * self.rescore))
+        exact = self._arrays["full"][candidates] @ query
+        order = np.argsort(-exact)[:k]
+        return [(self._document(int(candidates[i])), float(exact[i])) for i in order]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] mapped to [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def memory_usage(self):
+        """Bytes of vector data kept resident
+
+        A persisted full-precision copy is left out: it is memory-mapped and
+        only the pages of re-scored candidates are ever read.
+        """
+        return int(sum(
+            array.nbytes for name, array in self._arrays.items()
+            if not (name == "full" and isinstance(array, np.memmap))
+        ))
@@ -0,0 +1,471 @@
+"""HNSW approximate nearest neighbour index with single-file snapshots
+
+``HNSWIndex`` is a NumPy implementation of Hierarchical Navigable Small
+World graphs (Malkov & Yashunin) over L2-normalised vectors, scored by inner
+product. A built index is written with ``save`` to one snapshot file::
+
+    b"HNSWSNAP" | header length | JSON header | padding | arrays | documents
+
+The header records the snapshot format version and the catalog version the
+index was built from; ``load`` memory-maps the arrays in place, so opening a
+snapshot costs milliseconds whatever the catalog size.
+
+``HNSWVectorStore`` wraps an index and its documents as a LangChain vector
+store that can rebuild itself in the background when the catalog moved on.
+Texts added or deleted in between are applied to the live graph: only the
+new texts are embedded and inserted, replaced and deleted rows are left out
+of results until enough of them pile up to rebuild the graph from the
+vectors already there. ``save_snapshot`` writes them out (the embedding
+queue calls it whenever it goes idle), with the replaced and deleted rows
+listed in the documents, so a restart finds them again.
+"""
+import heapq
+import json
+import math
+import os
+import struct
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+MAGIC = b"HNSWSNAP"
+FORMAT_VERSION = 1
+ALIGN = 64
+# Deleted rows a store carries before it rebuilds its graph without them:
+# at least this many, and a quarter of the rows
+COMPACT_MIN = 64
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HNSWIndex:
+    """Inner-product HNSW graph over a float32 matrix"""
+
+    def __init__(self, dim, M=16, ef_construction=100, ef_search=64, seed=0):
+        self.dim = dim
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.levels = np.zeros(0, dtype=np.int32)
+        self.entry_point = -1
+        self.max_level = -1
+        # level 0: (count, 2M) int32 rows padded with -1; upper levels: dicts
+        self.level0 = np.zeros((0, 2 * M), dtype=np.int32)
+        self.upper = []
+        # Arrays with spare capacity behind the growing ones above
+        self._buffers = {}
+        self._rng = np.random.default_rng(seed)
+        self._ml = 1.0 / math.log(M)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    # Graph access
+
+    def _neighbors(self, node, level):
+        if level == 0:
+            row = self.level0[node]
+            return row[row >= 0]
+        return self.upper[level - 1].get(node, ())
+
+    def _search_layer(self, query, entry_points, ef, level):
+        visited = set(entry_points)
+        sims = self.vectors[entry_points] @ query
+        candidates = [(-s, n) for s, n in zip(sims.tolist(), entry_points)]
+        heapq.heapify(candidates)
+        best = [(s, n) for s, n in zip(sims.tolist(), entry_points)]
+        heapq.heapify(best)
+        while len(best) > ef:
+            heapq.heappop(best)
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < best[0][0] and len(best) >= ef:
+                break
+            fresh = [n for n in np.asarray(self._neighbors(node, level)).tolist() if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for sim, n in zip((self.vectors[fresh] @ query).tolist(), fresh):
+                if len(best) < ef or sim > best[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(best, (sim, n))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+        return sorted(best, reverse=True)
+
+    def _select(self, candidates, limit):
+        """Neighbour selection heuristic: keep candidates that are closer to
+        the new node than to any neighbour already kept"""
+        if len(candidates) <= limit:
+            return [n for _, n in candidates]
+        nodes = [n for _, n in candidates]
+        sims = [s for s, _ in candidates]
+        pairwise = self.vectors[nodes] @ self.vectors[nodes].T
+        # closest[i]: highest similarity of candidate i to any kept neighbour
+        closest = np.full(len(nodes), -np.inf, dtype=np.float32)
+        kept = []
+        for i in range(len(nodes)):
+            if len(kept) == limit:
+                break
+            if closest[i] < sims[i]:
+                kept.append(i)
+                np.maximum(closest, pairwise[i], out=closest)
+        if len(kept) < limit:
+            chosen = set(kept)
+            kept += [i for i in range(len(nodes)) if i not in chosen][:limit - len(kept)]
+        return [nodes[i] for i in kept]
+
+    def _set_neighbors(self, node, level, neighbors):
+        if level == 0:
+            self.level0[node] = -1
+            self.level0[node, :len(neighbors)] = neighbors
+        else:
+            self.upper[level - 1][node] = list(neighbors)
+
+    def _connect(self, node, neighbor, level):
+        limit = 2 * self.M if level == 0 else self.M
+        current = np.asarray(self._neighbors(neighbor, level)).tolist()
+        if len(current) < limit:
+            self._set_neighbors(neighbor, level, current + [node])
+            return
+        pool = current + [node]
+        sims = (self.vectors[pool] @ self.vectors[neighbor]).tolist()
+        ranked = sorted(zip(sims, pool), reverse=True)
+        self._set_neighbors(neighbor, level, self._select(ranked, limit))
+
+    # Building and searching
+
+    def add(self, vectors):
+        """Insert vectors; returns their row numbers"""
+        vectors = _normalize(vectors)
+        start = len(self.vectors)
+        count = len(vectors)
+        levels = np.floor(-np.log(1.0 - self._rng.random(count)) * self._ml).astype(np.int32)
+        self._append("vectors", vectors)
+        self._append("levels", levels)
+        self._append("level0", np.full((count, 2 * self.M), -1, np.int32))
+        for node in range(start, start + count):
+            self._insert(node, int(self.levels[node]))
+        return list(range(start, start + count))
+
+    def _append(self, name, rows):
+        # Grow geometrically so adding in small batches stays linear overall;
+        # a memory-mapped snapshot array is copied once, on the first add
+        array = getattr(self, name)
+        buffer = self._buffers.get(name)
+        size = len(array) + len(rows)
+        if buffer is None or array.base is not buffer or len(buffer) < size:
+            buffer = np.empty((max(size, 2 * len(array), 64),) + rows.shape[1:], dtype=rows.dtype)
+            buffer[:len(array)] = array
+            self._buffers[name] = buffer
+        buffer[len(array):size] = rows
+        setattr(self, name, buffer[:size])
+
+    def _insert(self, node, level):
+        while len(self.upper) < level:
+            self.upper.append({})
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+        query = self.vectors[node]
+        entry = [self.entry_point]
+        for lc in range(self.max_level, level, -1):
+            entry = [self._search_layer(query, entry, 1, lc)[0][1]]
+        for lc in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(query, entry, self.ef_construction, lc)
+            neighbors = self._select(found, 2 * self.M if lc == 0 else self.M)
+            self._set_neighbors(node, lc, neighbors)
+            for neighbor in neighbors:
+                self._connect(node, neighbor, lc)
+            entry = [n for _, n in found]
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def search(self, query, k, ef=None):
+        """Best k (similarity, row) pairs for a query vector"""
+        if self.entry_point < 0:
+            return []
+        query = _normalize(query)
+        entry = [self.entry_point]
+        for lc in range(self.max_level, 0, -1):
+            entry = [self._search_layer(query, entry, 1, lc)[0][1]]
+        found = self._search_layer(query, entry, max(ef or self.ef_search, k), 0)
+        return found[:k]
+
+    # Snapshots
+
+    def _arrays(self):
+        upper_nodes, upper_neighbors, upper_counts = [], [], []
+        for graph in self.upper:
+            upper_counts.append(len(graph))
+            for node, neighbors in graph.items():
+                upper_nodes.append(node)
+                upper_neighbors.append(list(neighbors) + [-1] * (self.M - len(neighbors)))
+        return {
+            "vectors": np.ascontiguousarray(self.vectors, dtype=np.float32),
+            "levels": np.ascontiguousarray(self.levels, dtype=np.int32),
+            "level0": np.ascontiguousarray(self.level0, dtype=np.int32),
+            "upper_nodes": np.asarray(upper_nodes, dtype=np.int32),
+            "upper_neighbors": np.asarray(upper_neighbors, dtype=np.int32).reshape(-1, self.M),
+            "upper_counts": np.asarray(upper_counts, dtype=np.int32),
+        }
+
+    def save(self, path, catalog_version, documents):
+        """Write the index and its documents to one snapshot file, atomically"""
+        arrays = self._arrays()
+        blob = json.dumps(documents).encode()
+        header = {
+            "format_version": FORMAT_VERSION,
+            "catalog_version": catalog_version,
+            "dim": self.dim,
+            "count": len(self),
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "entry_point": self.entry_point,
+            "max_level": self.max_level,
+            "arrays": {},
+        }
+        # Offsets depend on the header size, so lay out until it is stable
+        encoded = b""
+        while True:
+            offset = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGN) * ALIGN
+            for name, array in arrays.items():
+                header["arrays"][name] = {"offset": offset, "dtype": str(array.dtype), "shape": list(array.shape)}
+                offset = -(-(offset + array.nbytes) // ALIGN) * ALIGN
+            header["documents"] = {"offset": offset, "length": len(blob)}
+            laid_out = json.dumps(header).encode()
+            if laid_out == encoded:
+                break
+            encoded = laid_out
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for name, array in arrays.items():
+                f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+            f.write(b"\0" * (header["documents"]["offset"] - f.tell()))
+            f.write(blob)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a snapshot; returns (index, header, documents)"""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an HNSW snapshot")
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+            if header["format_version"] != FORMAT_VERSION:
+                raise ValueError(f"Unsupported snapshot format {header['format_version']}")
+            f.seek(header["documents"]["offset"])
+            documents = json.loads(f.read(header["documents"]["length"]))
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            else:
+                arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+        index = cls(header["dim"], header["M"], header["ef_construction"], header["ef_search"])
+        index.vectors = arrays["vectors"]
+        index.levels = arrays["levels"]
+        index.level0 = arrays["level0"]
+        index.entry_point = header["entry_point"]
+        index.max_level = header["max_level"]
+        start = 0
+        for count in arrays["upper_counts"].tolist():
+            nodes = arrays["upper_nodes"][start:start + count].tolist()
+            rows = arrays["upper_neighbors"][start:start + count]
+            index.upper.append({node: row[row >= 0].tolist() for node, row in zip(nodes, rows)})
+            start += count
+        return index, header, documents
+
+
+class HNSWVectorStore(VectorStore):
+    """LangChain vector store backed by an ``HNSWIndex`` snapshot file"""
+
+    def __init__(self, embedding, snapshot_path, M=16, ef_construction=100, ef_search=64):
+        self._embedding = embedding
+        self.snapshot_path = snapshot_path
+        self.M, self.ef_construction, self.ef_search = M, ef_construction, ef_search
+        self.catalog_version = None
+        self._index = None
+        self._docs = {"ids": [], "texts": [], "metadatas": []}
+        # Rows of replaced or deleted documents, skipped by searches
+        self._deleted = set()
+        self._rows = {}
+        self._lock = threading.Lock()
+        # Serializes changes to the live index; searches only take _lock
+        self._write_lock = threading.Lock()
+        self._rebuilding = None
+        if os.path.exists(snapshot_path):
+            try:
+                self._index, header, self._docs = HNSWIndex.load(snapshot_path)
+                self.catalog_version = header["catalog_version"]
+                self._deleted = set(self._docs.pop("deleted", []))
+                self._rows = {doc_id: row for row, doc_id in enumerate(self._docs["ids"])
+                              if row not in self._deleted}
+            except (ValueError, KeyError, OSError) as e:
+                print(f"Ignoring unreadable snapshot {snapshot_path}: {e}")
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return len(self._docs["ids"]) - len(self._deleted)
+
+    def is_stale(self, catalog_version):
+        return self.catalog_version != catalog_version
+
+    def build(self, documents, catalog_version):
+        """Embed documents, build a new index, snapshot it and swap it in"""
+        texts = [doc.page_content for doc in documents]
+        docs = {
+            "ids": [doc.id or str(uuid.uuid4()) for doc in documents],
+            "texts": texts,
+            "metadatas": [doc.metadata for doc in documents],
+        }
+        vectors = self._embedding.embed_documents(texts)
+        index = HNSWIndex(len(vectors[0]) if vectors else 0, self.M, self.ef_construction, self.ef_search)
+        if vectors:
+            index.add(vectors)
+        index.save(self.snapshot_path, catalog_version, docs)
+        with self._write_lock, self._lock:
+            self._index, self._docs, self.catalog_version = index, docs, catalog_version
+            self._deleted = set()
+            self._rows = {doc_id: row for row, doc_id in enumerate(docs["ids"])}
+
+    def save_snapshot(self, catalog_version=None):
+        """Write the live index and documents to the snapshot, for catalog_version if given"""
+        with self._write_lock:
+            if self._index is None:
+                return
+            if catalog_version is not None:
+                self.catalog_version = catalog_version
+            docs = dict(self._docs, deleted=sorted(self._deleted))
+            self._index.save(self.snapshot_path, self.catalog_version, docs)
+
+    @property
+    def rebuilding(self):
+        """True while a background rebuild runs (texts added meanwhile would be lost by its swap)"""
+        return self._rebuilding is not None and self._rebuilding.is_alive()
+
+    def rebuild_in_background(self, documents_fn, catalog_version):
+        """Rebuild from documents_fn() in a thread, keep serving the old index meanwhile"""
+        if self.rebuilding:
+            return self._rebuilding
+
+        def run():
+            try:
+                self.build(documents_fn(), catalog_version)
+                print(f"HNSW snapshot {self.snapshot_path} rebuilt for catalog version {catalog_version}")
+            except Exception as e:
+                print(f"HNSW rebuild failed: {e}")
+
+        self._rebuilding = threading.Thread(target=run, name="hnsw-rebuild", daemon=True)
+        self._rebuilding.start()
+        return self._rebuilding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        """Embed texts and insert them into the index; existing ids are replaced"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = [i or str(uuid.uuid4()) for i in ids] if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        if self._index is None or not len(self._index):
+            documents = [Document(page_content=t, metadata=m, id=i) for t, m, i in zip(texts, metadatas, ids)]
+            self.build(documents, self.catalog_version or 0)
+            return ids
+        vectors = self._embedding.embed_documents(texts)
+        with self._write_lock:
+            docs = self._docs
+            # Documents first: a search may find the new rows as soon as they are in the graph
+            start = len(docs["ids"])
+            docs["ids"].extend(ids)
+            docs["texts"].extend(texts)
+            docs["metadatas"].extend(metadatas)
+            for row, doc_id in enumerate(ids, start):
+                if doc_id in self._rows:
+                    self._deleted.add(self._rows[doc_id])
+                self._rows[doc_id] = row
+            self._index.add(vectors)
+            self._compact_if_needed()
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self._write_lock:
+            for doc_id in ids:
+                if doc_id in self._rows:
+                    self._deleted.add(self._rows.pop(doc_id))
+            self._compact_if_needed()
+        return True
+
+    def ids_with_sources(self, sources):
+        """Ids of the documents whose metadata "source" is one of sources"""
+        sources = set(sources)
+        with self._lock:
+            docs, rows = self._docs, dict(self._rows)
+        return [doc_id for doc_id, row in rows.items() if docs["metadatas"][row].get("source") in sources]
+
+    def _compact_if_needed(self):
+        # Caller holds _write_lock
+        if len(self._deleted) < max(COMPACT_MIN, len(self._docs["ids"]) // 4):
+            return
+        live = sorted(self._rows.values())
+        docs = {key: [values[row] for row in live] for key, values in self._docs.items()}
+        index = HNSWIndex(self._index.dim, self.M, self.ef_construction, self.ef_search)
+        if live:
+            index.add(np.asarray(self._index.vectors)[live])
+        with self._lock:
+            self._index, self._docs, self._deleted = index, docs, set()
+            self._rows = {doc_id: row for row, doc_id in enumerate(docs["ids"])}
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        with self._lock:
+            index, docs, deleted = self._index, self._docs, self._deleted
+        if index is None or not len(index):
+            return []
+        found = [(sim, row) for sim, row in index.search(embedding, k + len(deleted), kwargs.get("ef"))
+                 if row not in deleted]
+        return [
+            (Document(page_content=docs["texts"][row], metadata=docs["metadatas"][row], id=docs["ids"][row]), sim)
+            for sim, row in found[:k]
+        ]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def memory_usage(self):
+        index = self._index
+        if index is None:
+            return 0
+        return int(index.vectors.nbytes + index.level0.nbytes)
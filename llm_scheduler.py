@@ -0,0 +1,210 @@
+"""Priority scheduler in front of the Ollama backend
+
+Every generation goes through an ``LLMScheduler`` slot. Callers are grouped
+into priority classes (web form, API integrations, offline batch jobs); free
+slots are handed out by weighted fair queuing (stride scheduling) between the
+classes, each class can be capped to a number of concurrent generations, and a
+waiter that has been queued longer than its class ``max_wait`` is served first
+so no class starves.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import settings
+from traffic import stage, token_timer
+
+# Upper bounds (seconds) of the queue wait histogram buckets
+WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# weight: share of free slots, limit: max concurrent generations (None = no cap),
+# max_wait: queued longer than this (seconds) and the waiter jumps the queue
+DEFAULT_CLASSES = {
+    "interactive": {"weight": 8, "limit": None, "max_wait": 2.0},
+    "api": {"weight": 4, "limit": None, "max_wait": 10.0},
+    "batch": {"weight": 1, "limit": settings.LLM_BATCH_LIMIT, "max_wait": 300.0},
+}
+
+# Priority class of the request being served in the current thread/context
+current_priority = ContextVar("llm_priority", default="api")
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waited longer than its timeout for an LLM slot"""
+
+
+@contextmanager
+def use_priority(name):
+    """Run the enclosed LLM calls in the given priority class"""
+    token = current_priority.set(name)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("enqueued", "event", "granted")
+
+    def __init__(self):
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class _PriorityClass:
+    def __init__(self, name, weight, limit, max_wait):
+        self.name = name
+        self.stride = 1.0 / weight
+        self.limit = limit
+        self.max_wait = max_wait
+        self.pass_value = 0.0
+        self.queue = deque()
+        self.active = 0
+        self.served = 0
+        self.timeouts = 0
+        self.boosted = 0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+
+    def eligible(self):
+        return self.queue and (self.limit is None or self.active < self.limit)
+
+    def observe(self, waited):
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.wait_sum += waited
+        self.served += 1
+
+
+class LLMScheduler:
+    """Hands out a fixed number of LLM slots to weighted priority classes"""
+
+    def __init__(self, max_concurrency=None, classes=None, timeout=None):
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.timeout = settings.LLM_QUEUE_TIMEOUT if timeout is None else timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._classes = {
+            name: _PriorityClass(name, **opts)
+            for name, opts in (classes or DEFAULT_CLASSES).items()
+        }
+
+    def _pick(self, now):
+        candidates = [c for c in self._classes.values() if c.eligible()]
+        if not candidates:
+            return None
+        # Starvation protection: anyone past its class max_wait goes first
+        overdue = [c for c in candidates if now - c.queue[0].enqueued >= c.max_wait]
+        if overdue:
+            chosen = min(overdue, key=lambda c: c.queue[0].enqueued)
+            chosen.boosted += 1
+            return chosen
+        return min(candidates, key=lambda c: c.pass_value)
+
+    def _dispatch(self):
+        # Caller holds self._lock
+        now = time.monotonic()
+        while self._in_flight < self.max_concurrency:
+            chosen = self._pick(now)
+            if chosen is None:
+                return
+            waiter = chosen.queue.popleft()
+            chosen.pass_value += chosen.stride
+            chosen.active += 1
+            chosen.observe(now - waiter.enqueued)
+            self._in_flight += 1
+            waiter.granted = True
+            waiter.event.set()
+
+    def acquire(self, priority, timeout=None):
+        """Block until a slot is free for ``priority``"""
+        cls = self._classes.get(priority) or self._classes["api"]
+        waiter = _Waiter()
+        with self._lock:
+            if not cls.queue:
+                # A class coming back from idle must not cash in the credit it
+                # did not use, so it restarts at the current minimum pass value
+                busy = [c.pass_value for c in self._classes.values() if c.queue]
+                if busy:
+                    cls.pass_value = max(cls.pass_value, min(busy))
+            cls.queue.append(waiter)
+            self._dispatch()
+        timeout = self.timeout if timeout is None else timeout
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    cls.queue.remove(waiter)
+                    cls.timeouts += 1
+                    raise SchedulerTimeout(f"No LLM slot for '{cls.name}' within {timeout}s")
+        return cls.name
+
+    def release(self, priority):
+        """Give a slot back and wake the next waiter"""
+        cls = self._classes.get(priority) or self._classes["api"]
+        with self._lock:
+            cls.active -= 1
+            self._in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority=None, timeout=None):
+        """Hold one LLM slot for the enclosed block"""
+        name = self.acquire(priority or current_priority.get(), timeout)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def run(self, priority, fn, *args, **kwargs):
+        """Call ``fn`` while holding a slot of the given priority class"""
+        with self.slot(priority):
+            return fn(*args, **kwargs)
+
+    def wrap(self, llm, **kwargs):
+        """Chain step that invokes ``llm`` (with kwargs) under the caller's priority class"""
+        def scheduled_llm(prompt, config):
+            with stage("llm_wait"):
+                name = self.acquire(current_priority.get())
+            try:
+                with stage("llm"):
+                    return llm.invoke(prompt, token_timer(config), **kwargs)
+            finally:
+                self.release(name)
+        return scheduled_llm
+
+    def idle(self):
+        """Whether no generation is running or waiting"""
+        with self._lock:
+            return self._in_flight == 0 and not any(c.queue for c in self._classes.values())
+
+    def stats(self):
+        """Queue lengths, in-flight counts and wait histograms per class"""
+        with self._lock:
+            classes = {}
+            for c in self._classes.values():
+                cumulative, histogram = 0, {}
+                for bound, count in zip(WAIT_BUCKETS + ("+Inf",), c.buckets):
+                    cumulative += count
+                    histogram[str(bound)] = cumulative
+                classes[c.name] = {
+                    "queued": len(c.queue),
+                    "active": c.active,
+                    "limit": c.limit,
+                    "served": c.served,
+                    "timeouts": c.timeouts,
+                    "starvation_boosts": c.boosted,
+                    "wait_seconds_sum": round(c.wait_sum, 6),
+                    "wait_seconds_buckets": histogram,
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "classes": classes,
+            }
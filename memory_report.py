@@ -0,0 +1,224 @@
+"""Memory accounting for /debug/memory
+
+Three views of where the process memory goes:
+
+- Process RSS and its peak, from /proc.
+- Per component: the Python objects it holds (``deep_size``, stopping at
+  other components so nothing is counted twice) and, for the embedding
+  model and vector stores, the RSS growth measured while they loaded
+  (``measure_load``). The ONNX session and Chroma's native client are
+  invisible to Python, so only that growth shows them. The first Chroma
+  store of a process includes the client.
+- tracemalloc: started on demand, it diffs the current allocations against
+  a baseline snapshot, top N by growth, to find what keeps growing under
+  load.
+"""
+import collections
+import gc
+import mmap
+import sys
+import threading
+import tracemalloc
+import types
+
+import settings
+
+# Objects never walked into: code, classes, modules, threads and locks
+_OPAQUE = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+           types.CodeType, types.FrameType, threading.Thread, type(threading.Lock()), type(threading.RLock()))
+
+_registry = {}
+# id(component) -> (name, bytes the RSS grew while it loaded)
+_load_rss = {}
+_lock = threading.Lock()
+_baseline = None
+
+
+def rss_bytes(pid="self", field="VmRSS"):
+    """Resident set size (or VmHWM, its peak) of a process from /proc (Linux), None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def measure_load(name, factory):
+    """Call factory() and record how much the RSS grew meanwhile under name"""
+    before = rss_bytes()
+    component = factory()
+    after = rss_bytes()
+    if before is not None and after is not None:
+        with _lock:
+            _load_rss[id(component)] = (name, max(0, after - before))
+    return component
+
+
+def register_components(tenant, **components):
+    """Make a tenant's components show up in the memory report"""
+    with _lock:
+        for name, component in components.items():
+            _registry[f"{tenant}:{name}"] = component
+
+
+def deep_size(obj, exclude=(), limit=None):
+    """Bytes of the Python objects reachable from obj; returns (bytes, mapped bytes, truncated)
+
+    Memory-mapped files (np.load mmap_mode) are counted apart, they are page
+    cache rather than private memory. Stops after ``limit`` objects.
+    """
+    limit = limit or settings.MEMORY_REPORT_MAX_OBJECTS
+    seen = {id(o) for o in exclude}
+    stack = [obj]
+    total = mapped = count = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _OPAQUE):
+            continue
+        seen.add(id(o))
+        count += 1
+        if count > limit:
+            return total, mapped, True
+        if isinstance(o, mmap.mmap):
+            mapped += len(o)
+            continue
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(o)
+        elif isinstance(o, (str, bytes, bytearray, int, float)):
+            continue
+        else:
+            # A NumPy view's getsizeof leaves out the data; its base holds it
+            base = getattr(o, "base", None)
+            if base is not None and hasattr(o, "nbytes"):
+                stack.append(base)
+            if hasattr(o, "__dict__"):
+                stack.append(o.__dict__)
+            for slot in getattr(type(o), "__slots__", ()):
+                if isinstance(slot, str) and hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total, mapped, False
+
+
+def _entries(component):
+    from vector_backends import document_count
+
+    if hasattr(component, "similarity_search"):
+        return document_count(component)
+    stats = component.stats() if hasattr(component, "stats") else {}
+    if "entries" in stats:
+        return stats["entries"]
+    return len(component) if hasattr(component, "__len__") else None
+
+
+def all_components():
+    """Every component in the report: the tenants', the shared ones and the embedding models"""
+    from tenants import components as shared_components
+
+    found = {f"shared:{name}": component for name, component in shared_components().items()}
+    embedding_service = sys.modules.get("embedding_service")
+    if embedding_service is not None:
+        found.update({f"embeddings:{name}": c for name, c in embedding_service.loaded_embeddings().items()})
+    with _lock:
+        found.update(_registry)
+    return found
+
+
+def component_report():
+    """Python bytes, entry counts and RSS growth while loading, per component"""
+    found = all_components()
+    with _lock:
+        load_rss = dict(_load_rss)
+    report = {}
+    for name, component in found.items():
+        others = [c for other, c in found.items() if other != name]
+        python_bytes, mapped, truncated = deep_size(component, exclude=others)
+        entry = {"python_bytes": python_bytes}
+        if mapped:
+            entry["mapped_bytes"] = mapped
+        if truncated:
+            entry["truncated"] = True
+        entries = _entries(component)
+        if entries is not None:
+            entry["entries"] = entries
+        if id(component) in load_rss:
+            entry["load_rss_bytes"] = load_rss.pop(id(component))[1]
+        report[name] = entry
+    # Loads wrapped by a registered component (the model inside BatchingEmbedder)
+    for name, grown in load_rss.values():
+        report.setdefault(name, {})["load_rss_bytes"] = grown
+    return report
+
+
+def memory_report(components=True):
+    report = {
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": rss_bytes(field="VmHWM"),
+        "gc": {"tracked_objects": len(gc.get_objects()), "generations": gc.get_count()},
+        "tracemalloc": tracing_stats(),
+    }
+    if components:
+        report["components"] = component_report()
+    return report
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ])
+
+
+def start_tracing(frames=None):
+    """Start tracemalloc (when needed) and take the baseline snapshot"""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or settings.MEMORY_TRACE_FRAMES)
+    _baseline = _snapshot()
+
+
+def stop_tracing():
+    global _baseline
+    _baseline = None
+    tracemalloc.stop()
+
+
+def tracing_stats():
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {"tracing": True, "traced_bytes": current, "traced_peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory()}
+
+
+def allocation_diff(top=20, key_type="lineno", rebase=False):
+    """Top allocation sites by growth since the baseline, or None when not tracing"""
+    global _baseline
+    if _baseline is None or not tracemalloc.is_tracing():
+        return None
+    current = _snapshot()
+    stats = current.compare_to(_baseline, key_type)
+    if rebase:
+        _baseline = current
+    rows = []
+    for stat in stats[:top]:
+        frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        rows.append({
+            "location": frames[0] if key_type != "traceback" else frames,
+            "size_diff_bytes": stat.size_diff,
+            "size_bytes": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        })
+    return {"total_diff_bytes": sum(stat.size_diff for stat in stats), "top": rows}
@@ -0,0 +1,240 @@
+"""Load-balanced pool of Ollama backends
+
+``OllamaPool`` behaves like a ``ChatOllama`` (it has ``invoke``) but spreads
+the calls over several Ollama servers:
+
+- least outstanding requests among the backends that can take the call,
+- model affinity: a model sticks to the backends that already have it loaded
+  (or, before the first probe, to the same backend via rendezvous hashing) so
+  every server keeps its model resident instead of swapping,
+- active probes of ``/api/tags`` and ``/api/ps`` for readiness (model pulled)
+  and residency (model loaded),
+- a circuit breaker per backend that ejects it after repeated failures and
+  lets a single trial request through once the cooldown is over.
+"""
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+
+import settings
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Extra outstanding requests tolerated on an affine backend before the
+# request spills over to a less busy one
+AFFINITY_SPILL = 2
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every Ollama backend is down or ejected"""
+
+
+def _chat_ollama(base_url, config, model_kwargs):
+    from langchain_ollama import ChatOllama
+
+    return ChatOllama(base_url=base_url, **{**config, **model_kwargs})
+
+
+class Backend:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.outstanding = 0
+        self.state = CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.reachable = True
+        self.available_models = None
+        self.loaded_models = set()
+        self.last_probe = None
+        self.served = 0
+        self.errors = 0
+        self.clients = {}
+
+    def ready_for(self, model):
+        if not self.reachable:
+            return False
+        # Before the first successful probe we do not know the tags yet
+        return self.available_models is None or model in self.available_models
+
+
+class OllamaPool:
+    """Chat model that balances requests over a list of Ollama endpoints"""
+
+    def __init__(self, base_urls=None, config=None, probe_interval=None,
+                 failure_threshold=None, cooldown=None, client_factory=_chat_ollama):
+        self.config = dict(config or {})
+        self.model = self.config.get("model", "")
+        self.backends = [Backend(url) for url in (base_urls or settings.OLLAMA_BASE_URLS)]
+        self.probe_interval = probe_interval or settings.OLLAMA_PROBE_INTERVAL
+        self.failure_threshold = failure_threshold or settings.OLLAMA_FAILURE_THRESHOLD
+        self.cooldown = settings.OLLAMA_COOLDOWN if cooldown is None else cooldown
+        self.client_factory = client_factory
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober = None
+
+    # Health checks
+
+    def _get_json(self, url, timeout=2.0):
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read() or b"{}")
+
+    def probe(self, backend):
+        """Refresh reachability, pulled models and loaded models of a backend"""
+        try:
+            tags = self._get_json(f"{backend.base_url}/api/tags")
+            ps = self._get_json(f"{backend.base_url}/api/ps")
+        except (OSError, ValueError):
+            with self._lock:
+                backend.reachable = False
+                backend.last_probe = time.time()
+            return False
+        with self._lock:
+            backend.reachable = True
+            backend.available_models = {m.get("name") for m in tags.get("models", [])}
+            backend.loaded_models = {m.get("name") for m in ps.get("models", [])}
+            backend.last_probe = time.time()
+            if backend.state != CLOSED and time.monotonic() >= backend.open_until:
+                # A healthy probe after the cooldown closes the breaker
+                backend.state = CLOSED
+                backend.failures = 0
+        return True
+
+    def probe_all(self):
+        for backend in self.backends:
+            self.probe(backend)
+
+    def start(self):
+        """Probe all backends now and then every ``probe_interval`` seconds"""
+        if self._prober is not None:
+            return self
+        self.probe_all()
+
+        def loop():
+            while not self._stop.wait(self.probe_interval):
+                self.probe_all()
+
+        self._prober = threading.Thread(target=loop, name="ollama-prober", daemon=True)
+        self._prober.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # Balancing
+
+    def _affinity_rank(self, backend, model):
+        digest = hashlib.md5(f"{model}|{backend.base_url}".encode()).hexdigest()
+        return int(digest, 16)
+
+    def _usable(self, backend, now):
+        if backend.state == OPEN:
+            if now < backend.open_until:
+                return False
+            backend.state = HALF_OPEN
+        if backend.state == HALF_OPEN and backend.trial_in_flight:
+            return False
+        return True
+
+    def _choose(self, model, exclude):
+        """(backend, whether the call is its half-open trial) or (None, False)"""
+        # Caller holds self._lock
+        now = time.monotonic()
+        candidates = [
+            b for b in self.backends
+            if b not in exclude and self._usable(b, now) and b.ready_for(model)
+        ]
+        if not candidates:
+            return None, False
+        least = min(candidates, key=lambda b: b.outstanding)
+        affine = [b for b in candidates if model in b.loaded_models]
+        if not affine:
+            affine = [max(candidates, key=lambda b: self._affinity_rank(b, model))]
+        best = min(affine, key=lambda b: b.outstanding)
+        if best.outstanding - least.outstanding > AFFINITY_SPILL:
+            best = least
+        best.outstanding += 1
+        trial = best.state == HALF_OPEN
+        if trial:
+            best.trial_in_flight = True
+        return best, trial
+
+    def _finish(self, backend, ok, trial):
+        with self._lock:
+            backend.outstanding -= 1
+            if trial:
+                backend.trial_in_flight = False
+            if ok:
+                backend.served += 1
+                backend.failures = 0
+                # Calls that started before the breaker opened leave it as is,
+                # only the trial closes it
+                if trial:
+                    backend.state = CLOSED
+                return
+            backend.errors += 1
+            backend.failures += 1
+            if backend.state == HALF_OPEN or backend.failures >= self.failure_threshold:
+                backend.state = OPEN
+                backend.open_until = time.monotonic() + self.cooldown
+
+    def _client(self, backend, model_kwargs):
+        # One client per backend and per set of ChatOllama overrides
+        key = json.dumps(model_kwargs, sort_keys=True)
+        client = backend.clients.get(key)
+        if client is None:
+            client = self.client_factory(backend.base_url, self.config, model_kwargs)
+            backend.clients[key] = client
+        return client
+
+    def invoke(self, input, config=None, **kwargs):
+        """Run the chat model on the best backend, failing over on errors
+
+        ``model_kwargs`` are extra ``ChatOllama`` fields (``num_predict``,
+        ``stop``...) for this call; the other keyword arguments go to
+        ``ChatOllama.invoke``.
+        """
+        model_kwargs = kwargs.pop("model_kwargs", {})
+        tried = []
+        last_error = None
+        while len(tried) < len(self.backends):
+            with self._lock:
+                backend, trial = self._choose(self.model, tried)
+            if backend is None:
+                break
+            tried.append(backend)
+            try:
+                result = self._client(backend, model_kwargs).invoke(input, config, **kwargs)
+            except Exception as e:
+                # 4xx answers are the caller's fault, not the backend's
+                if 400 <= getattr(e, "status_code", 500) < 500:
+                    self._finish(backend, True, trial)
+                    raise
+                self._finish(backend, False, trial)
+                last_error = e
+                continue
+            self._finish(backend, True, trial)
+            return result
+        raise NoBackendAvailable(f"No Ollama backend could serve '{self.model}': {last_error}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model,
+                "backends": [
+                    {
+                        "base_url": b.base_url,
+                        "state": b.state,
+                        "reachable": b.reachable,
+                        "model_loaded": self.model in b.loaded_models,
+                        "outstanding": b.outstanding,
+                        "served": b.served,
+                        "errors": b.errors,
+                        "last_probe": b.last_probe,
+                    }
+                    for b in self.backends
+                ],
+            }
@@ -0,0 +1,424 @@
+"""Order placement with atomic stock reservation
+
+Checkouts are queued to a single writer thread (``OrderWriter``) that owns
+the only write connection to the database. It takes up to
+``ORDER_MAX_BATCH`` queued checkouts at a time and places them in one
+``BEGIN IMMEDIATE`` transaction, each inside its own savepoint: an order
+that cannot be filled (or fails for any other reason) rolls back alone and
+the others commit together. With
+one writer there is no lock contention between checkouts, and WAL keeps the
+readers of the catalog going while it writes.
+
+Stock is reserved with ``UPDATE ... SET stok = stok - ? WHERE stok >= ?``,
+so an item is never sold below zero. A line with a size also reserves the
+stock of that size (``barang_varian``, see variants.py). A checkout retried
+with the same idempotency key returns the order placed the first time.
+"""
+import re
+import sqlite3
+import threading
+import time
+
+import settings
+from catalog_names import matching, phrases, rp
+
+# Shipping rate used for cities missing from the ongkir table
+FALLBACK_CITY = "Luar Kota"
+
+
+class OrderError(Exception):
+    """Raised when a cart cannot be priced or ordered"""
+
+
+class OutOfStock(OrderError):
+    """Raised when an item has less stock than the ordered quantity"""
+
+
+class OrderTimeout(Exception):
+    """Raised when the writer did not place an order in time"""
+
+
+def init_order_tables(conn):
+    """Create the orders and order_items tables"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE,
+                    kota TEXT,
+                    subtotal INTEGER,
+                    diskon INTEGER,
+                    ongkir INTEGER,
+                    total INTEGER,
+                    status TEXT DEFAULT 'placed',
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS order_items (
+                    order_id INTEGER REFERENCES orders(id),
+                    barang_id INTEGER REFERENCES barang(id),
+                    nama TEXT,
+                    ukuran TEXT,
+                    qty INTEGER,
+                    harga INTEGER)''')
+    c.execute("CREATE INDEX IF NOT EXISTS order_items_order ON order_items (order_id)")
+
+
+def apply_discount(total, item_count):
+    """10% off carts of more than 3 items"""
+    if item_count > 3:
+        return round(total * 0.9)
+    return total
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _find_item(conn, item):
+    if not isinstance(item, dict):
+        raise OrderError(f"Invalid cart item: {item!r}")
+    if item.get("barang_id") is not None:
+        if not _is_int(item["barang_id"]):
+            raise OrderError(f"Invalid barang_id: {item['barang_id']!r}")
+        row = conn.execute(
+            "SELECT id, nama, harga, stok FROM barang WHERE id = ?", (item["barang_id"],)
+        ).fetchone()
+    else:
+        if not isinstance(item.get("nama"), str):
+            raise OrderError(f"Cart item needs a barang_id or a nama: {item!r}")
+        row = conn.execute(
+            "SELECT id, nama, harga, stok FROM barang WHERE lower(nama) = lower(?)", (item["nama"],)
+        ).fetchone()
+    if row is None:
+        raise OrderError(f"Unknown item: {item.get('barang_id') or item.get('nama')}")
+    return row
+
+
+def shipping_rate(conn, kota):
+    """(kota, biaya) of a city, or of FALLBACK_CITY for cities without a rate"""
+    row = conn.execute("SELECT kota, biaya FROM ongkir WHERE lower(kota) = lower(?)", (kota or "",)).fetchone()
+    if row is None:
+        row = conn.execute("SELECT kota, biaya FROM ongkir WHERE kota = ?", (FALLBACK_CITY,)).fetchone()
+    if row is None:
+        raise OrderError(f"No shipping rate for {kota}")
+    return row
+
+
+def quote_cart(conn, items, kota, discount=True):
+    """Price a cart: [{"barang_id" or "nama", "qty", "ukuran"}] shipped to kota
+
+    Each line says whether the stock (of the size, when given) covers it.
+    Without discount, apply_discount is left out (for shops that give none).
+    """
+    if not items:
+        raise OrderError("The cart is empty.")
+    if not isinstance(items, list):
+        raise OrderError("items must be a list of cart items.")
+    if kota is not None and not isinstance(kota, str):
+        raise OrderError(f"Invalid kota: {kota!r}")
+    lines = []
+    for item in items:
+        barang_id, nama, harga, stok = _find_item(conn, item)
+        qty = item.get("qty", 1)
+        if not _is_int(qty) or qty <= 0:
+            raise OrderError(f"Invalid quantity for {nama}: {qty!r}")
+        size = item.get("ukuran")
+        if size is not None and not isinstance(size, str):
+            raise OrderError(f"Invalid size for {nama}: {size!r}")
+        in_stock = (stok or 0) >= qty
+        if size:
+            row = conn.execute("SELECT varian, stok FROM barang_varian WHERE barang_id = ? AND varian = ?",
+                               (barang_id, size)).fetchone()
+            if row is None:
+                sizes = [r[0] for r in conn.execute(
+                    "SELECT varian FROM barang_varian WHERE barang_id = ? ORDER BY id", (barang_id,))]
+                raise OrderError(f"Size {size} is not available for {nama} ({', '.join(sizes)})")
+            size, in_stock = row[0], in_stock and row[1] >= qty
+        lines.append({"barang_id": barang_id, "nama": nama, "ukuran": size, "qty": qty, "harga": harga,
+                      "in_stock": in_stock})
+
+    row = shipping_rate(conn, kota)
+    subtotal = sum(line["qty"] * line["harga"] for line in lines)
+    discounted = apply_discount(subtotal, sum(line["qty"] for line in lines)) if discount else subtotal
+    return {
+        "items": lines,
+        "kota": row[0],
+        "subtotal": subtotal,
+        "diskon": subtotal - discounted,
+        "ongkir": row[1],
+        "total": discounted + row[1],
+    }
+
+
+def cart_from_question(conn, question):
+    """(items, kota) for quote_cart from the items, quantities, sizes and city a question names
+
+    "2 Baju Kemeja size M dan 1 Topi Kinz ke Bandung" gives two items and
+    "Bandung". Items are empty when the question names none, kota is None
+    when it names no city with a rate.
+    """
+    named = phrases(question)
+    names = matching(conn, "SELECT nama FROM barang WHERE lower(nama) IN ({marks})", named)
+    # "Baju Kemeja" also matches an item called "Baju"; keep the longest name
+    names = [n for n in names if not any(n.lower() != o.lower() and n.lower() in o.lower() for o in names)]
+    text = question.lower()
+    found = []
+    for name in names:
+        match = re.search(rf"(?<!\w){re.escape(name.lower())}(?!\w)", text)
+        if match:
+            found.append((match.start(), match.end(), name))
+    found.sort()
+
+    items = []
+    for n, (start, end, name) in enumerate(found):
+        item = {"nama": name}
+        quantity = _QTY.search(text[:start])
+        if quantity:
+            item["qty"] = int(quantity.group(1))
+        size = _size(conn, name, text[end:found[n + 1][0] if n + 1 < len(found) else len(text)])
+        if size:
+            item["ukuran"] = size
+        items.append(item)
+    cities = matching(conn, "SELECT kota FROM ongkir WHERE lower(kota) IN ({marks})", named)
+    if not cities:
+        # quote_cart charges the FALLBACK_CITY rate for it
+        cities = [m.group(1).title() for m in _CITY.finditer(text)]
+    return items, (cities[0] if cities else None)
+
+
+# A quantity right before an item name: "2 Baju", "2x Baju", "2 pcs Baju"
+_QTY = re.compile(r"(?<!\w)(\d+)\s*(?:x|pcs|buah)?\s*$")
+# What may come between an item name and its size: "Baju M", "Baju (size M)", "Baju ukuran M"
+_SIZE = re.compile(r"^\W*(?:(size|ukuran|uk)(?!\w)\W*)?")
+# A destination that has no rate of its own: "ke Medan", "to Medan"
+_CITY = re.compile(r"(?<!\w)(?:ke|to|kota|tujuan)\s+([^\W\d]\w+)")
+
+
+def _size(conn, name, following):
+    """The variant of an item named right after it ("M", "size M", "ukuran All Size"), if any"""
+    variants = [row[0] for row in conn.execute(
+        "SELECT v.varian FROM barang_varian v JOIN barang b ON b.id = v.barang_id "
+        "WHERE lower(b.nama) = lower(?) ORDER BY length(v.varian) DESC", (name,))]
+    prefix = _SIZE.match(following)
+    rest = following[prefix.end():]
+    for varian in variants:
+        if re.match(rf"{re.escape(varian.lower())}(?!\w)", rest):
+            return varian
+    # A size that is not offered is passed on, for quote_cart to list the ones that are
+    word = re.match(r"\w+", rest)
+    return word.group(0).upper() if prefix.group(1) and word else None
+
+
+def cart_answer(conn, question):
+    """The priced cart a question asks about, rendered; None when it names no cart
+
+    A cart is an item with a quantity or a destination ("2 Baju Kemeja",
+    "Topi Kinz ke Bandung"). Other questions about items are left to the
+    model.
+    """
+    items, kota = cart_from_question(conn, question)
+    if not items or (kota is None and not any("qty" in item for item in items)):
+        return None
+    try:
+        return render_quote(quote_cart(conn, items, kota), city=kota is not None)
+    except OrderError as e:
+        return str(e)
+
+
+def render_quote(quote, city=True):
+    """A quote as the lines the text templates ask for; without city, shipping is left out"""
+    lines = [
+        "- Details: " + ", ".join(
+            f"{line['nama']} ({line['qty']} x {rp(line['harga'])})" + (f" ({line['ukuran']})" if line["ukuran"] else "")
+            for line in quote["items"]),
+    ]
+    if city:
+        lines.append(f"- Shipping Cost: {rp(quote['ongkir'])} (destination: {quote['kota']})")
+    lines.append("- Stock Info: " + ", ".join(
+        f"{line['nama']}: {'In Stock' if line['in_stock'] else 'Out of Stock'}" for line in quote["items"]))
+    total = f"- Total Shopping: {rp(quote['subtotal'])}"
+    if quote["diskon"]:
+        total += f" - {rp(quote['diskon'])} (10% discount)"
+    if city:
+        total += f" + {rp(quote['ongkir'])} ({quote['kota']})"
+        lines.append(f"{total} = {rp(quote['total'])}")
+    else:
+        lines.append(f"{total} = {rp(quote['total'] - quote['ongkir'])} (plus shipping, name the destination city)")
+    return "\n".join(lines)
+
+
+def load_order(conn, order_id):
+    """An order with its items, or None"""
+    row = conn.execute(
+        "SELECT id, idempotency_key, kota, subtotal, diskon, ongkir, total, status, created_at "
+        "FROM orders WHERE id = ?", (order_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    items = conn.execute(
+        "SELECT barang_id, nama, ukuran, qty, harga FROM order_items WHERE order_id = ?", (order_id,)
+    ).fetchall()
+    return {
+        "id": row[0],
+        "idempotency_key": row[1],
+        "kota": row[2],
+        "subtotal": row[3],
+        "diskon": row[4],
+        "ongkir": row[5],
+        "total": row[6],
+        "status": row[7],
+        "created_at": row[8],
+        "items": [
+            {"barang_id": i[0], "nama": i[1], "ukuran": i[2], "qty": i[3], "harga": i[4]}
+            for i in items
+        ],
+    }
+
+
+def place_order(conn, items, kota, idempotency_key=None):
+    """Reserve stock and record an order inside the caller's transaction"""
+    if idempotency_key is not None and not isinstance(idempotency_key, str):
+        raise OrderError(f"Invalid idempotency key: {idempotency_key!r}")
+    if idempotency_key:
+        row = conn.execute("SELECT id FROM orders WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        if row is not None:
+            return dict(load_order(conn, row[0]), replayed=True)
+    quote = quote_cart(conn, items, kota)
+    for line in quote["items"]:
+        cur = conn.execute(
+            "UPDATE barang SET stok = stok - ? WHERE id = ? AND stok >= ?",
+            (line["qty"], line["barang_id"], line["qty"]),
+        )
+        if cur.rowcount == 0:
+            raise OutOfStock(f"Not enough stock for {line['nama']}")
+        if line["ukuran"]:
+            cur = conn.execute(
+                "UPDATE barang_varian SET stok = stok - ? WHERE barang_id = ? AND varian = ? AND stok >= ?",
+                (line["qty"], line["barang_id"], line["ukuran"], line["qty"]),
+            )
+            if cur.rowcount == 0:
+                raise OutOfStock(f"Not enough stock for {line['nama']} size {line['ukuran']}")
+    cur = conn.execute(
+        "INSERT INTO orders (idempotency_key, kota, subtotal, diskon, ongkir, total) VALUES (?, ?, ?, ?, ?, ?)",
+        (idempotency_key, quote["kota"], quote["subtotal"], quote["diskon"], quote["ongkir"], quote["total"]),
+    )
+    order_id = cur.lastrowid
+    conn.executemany(
+        "INSERT INTO order_items (order_id, barang_id, nama, ukuran, qty, harga) VALUES (?, ?, ?, ?, ?, ?)",
+        [(order_id, l["barang_id"], l["nama"], l["ukuran"], l["qty"], l["harga"]) for l in quote["items"]],
+    )
+    return dict(quote, id=order_id, idempotency_key=idempotency_key, status="placed", replayed=False)
+
+
+def connect(db_path):
+    """Connection set up for concurrent readers and one writer"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class _Checkout:
+    __slots__ = ("items", "kota", "key", "event", "order", "error")
+
+    def __init__(self, items, kota, key):
+        self.items = items
+        self.kota = kota
+        self.key = key
+        self.event = threading.Event()
+        self.order = None
+        self.error = None
+
+
+class OrderWriter:
+    """Single writer thread that places queued checkouts in batches"""
+
+    def __init__(self, db_path, max_batch=None, max_wait_ms=None, timeout=None):
+        self.db_path = db_path
+        self.max_batch = max_batch or settings.ORDER_MAX_BATCH
+        self.max_wait = (settings.ORDER_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.timeout = timeout or settings.ORDER_TIMEOUT
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self.placed = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.transactions = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="order-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def checkout(self, items, kota, idempotency_key=None):
+        """Place an order; raises OrderError, OutOfStock or OrderTimeout"""
+        request = _Checkout(items, kota, idempotency_key)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        if not request.event.wait(self.timeout):
+            # The writer may still place it; a retry with the same key is safe
+            raise OrderTimeout("Order was not confirmed in time, retry with the same idempotency key.")
+        if request.error is not None:
+            raise request.error
+        return request.order
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run_batch(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for request in batch:
+                conn.execute("SAVEPOINT checkout")
+                try:
+                    request.order = place_order(conn, request.items, request.kota, request.key)
+                except Exception as e:
+                    # Only this checkout fails, whatever went wrong with it
+                    conn.execute("ROLLBACK TO checkout")
+                    request.error = e
+                conn.execute("RELEASE checkout")
+            conn.execute("COMMIT")
+        except Exception as e:
+            # Nothing of this batch was written
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for request in batch:
+                if request.error is None:
+                    request.order, request.error = None, e
+        self.transactions += 1
+        for request in batch:
+            if request.order is None:
+                self.rejected += 1
+            elif request.order["replayed"]:
+                self.replayed += 1
+            else:
+                self.placed += 1
+            request.event.set()
+
+    def _worker(self):
+        conn = connect(self.db_path)
+        while True:
+            self._run_batch(conn, self._take_batch())
+
+    def stats(self):
+        return {
+            "queued": len(self._pending),
+            "placed": self.placed,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "transactions": self.transactions,
+            "mean_batch_size": round((self.placed + self.replayed + self.rejected) / self.transactions, 2)
+            if self.transactions else 0,
+        }
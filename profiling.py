@@ -0,0 +1,249 @@
+"""On-demand profiling of the assistant apps (enabled with PROFILING=1)
+
+Per request: a ``/`` or ``/ask`` request with an ``X-Profile`` header (and
+the admin token, when one is set) runs under cProfile. The pstats dump is
+stored in ``PROFILE_DIR`` and named in the ``X-Profile-Id`` response header;
+``X-Profile: text`` returns the top of the report instead of the page.
+Only one request is profiled at a time, others run normally.
+
+Whole process: ``/debug/profile?seconds=N`` samples the stacks of every
+thread each ``interval_ms`` and returns them collapsed ("frame;frame count"
+lines), the input of flamegraph.pl and speedscope.
+
+Memory: ``/debug/memory`` (always on, admin only) reports RSS and the size
+of every component, and ``/debug/memory/tracemalloc`` diffs allocations
+against a baseline (see memory_report.py).
+
+Rate limits: ``/debug/clients`` (always on, admin only) lists the allowed
+and rejected requests of every client per budget (see ratelimit.py).
+
+Audit log: ``/debug/audit/<query>`` (admin only) runs the queries of
+audit_log.py (top-questions, stages, slowest, cache) on ``AUDIT_DB``.
+"""
+import collections
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+from flask import Blueprint, Response, abort, jsonify, make_response, request, send_file
+
+import settings
+from admin import admin_required, is_admin
+from memory_report import allocation_diff, memory_report, start_tracing, stop_tracing, tracing_stats
+from audit_log import QUERIES as AUDIT_QUERIES, connect as audit_connect
+from ratelimit import get_limits
+
+PROFILE_HEADER = "X-Profile"
+
+# Report lines of X-Profile: text and /debug/profiles/<id>?format=text
+REPORT_LINES = 40
+
+_profile_lock = threading.Lock()
+
+debug_bp = Blueprint("debug", __name__, url_prefix="/debug")
+
+
+def _profile_path(profile_id):
+    return os.path.join(settings.PROFILE_DIR, f"{profile_id}.pstats")
+
+
+def _prune():
+    dumps = sorted(
+        (entry for entry in os.scandir(settings.PROFILE_DIR) if entry.name.endswith(".pstats")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in dumps[:max(0, len(dumps) - settings.PROFILE_KEEP)]:
+        os.remove(entry.path)
+
+
+def report(stats, sort="cumulative", lines=REPORT_LINES):
+    """pstats text report of the most expensive functions"""
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(lines)
+    return out.getvalue()
+
+
+def profiled(view):
+    """Run the view under cProfile when the request asks for it"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = request.headers.get(PROFILE_HEADER)
+        if not settings.PROFILING or not mode:
+            return view(*args, **kwargs)
+        if not is_admin():
+            return jsonify({"error": "Admin token required."}), 401
+        # cProfile hooks one thread; two profilers at once would mix up their stats
+        if not _profile_lock.acquire(blocking=False):
+            response = make_response(view(*args, **kwargs))
+            response.headers[PROFILE_HEADER] = "busy"
+            return response
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+        finally:
+            _profile_lock.release()
+
+        profile_id = f"{request.blueprint or 'app'}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(_profile_path(profile_id))
+        _prune()
+        if mode == "text":
+            response = Response(report(pstats.Stats(profiler)), mimetype="text/plain")
+        response.headers["X-Profile-Id"] = profile_id
+        response.headers["X-Profile-Ms"] = f"{elapsed * 1000:.1f}"
+        return response
+    return wrapper
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval):
+    """Sample every other thread's stack for a while; returns (collapsed stack counts, samples)"""
+    me = threading.get_ident()
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            counts[";".join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return counts, samples
+
+
+@debug_bp.route("/profile")
+@admin_required
+def sample_profile():
+    """Collapsed stacks of all threads sampled for ?seconds=N"""
+    if not settings.PROFILING:
+        abort(404)
+    seconds = min(max(request.args.get("seconds", 10.0, type=float), 0.1), settings.PROFILE_MAX_SECONDS)
+    interval_ms = max(request.args.get("interval_ms", settings.PROFILE_SAMPLE_INTERVAL_MS, type=float), 1.0)
+    counts, samples = sample_stacks(seconds, interval_ms / 1000)
+    body = "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    response = Response(body, mimetype="text/plain")
+    response.headers["X-Samples"] = str(samples)
+    return response
+
+
+@debug_bp.route("/profiles")
+@admin_required
+def list_profiles():
+    """Stored per-request profiles, newest first"""
+    if not settings.PROFILING:
+        abort(404)
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return jsonify([])
+    dumps = sorted(
+        (entry for entry in os.scandir(settings.PROFILE_DIR) if entry.name.endswith(".pstats")),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    return jsonify([{"id": entry.name[:-len(".pstats")], "bytes": entry.stat().st_size} for entry in dumps])
+
+
+@debug_bp.route("/profiles/<profile_id>")
+@admin_required
+def get_profile(profile_id):
+    """A stored profile: the pstats file, or ?format=text for the report"""
+    if not settings.PROFILING:
+        abort(404)
+    path = _profile_path(profile_id)
+    if os.path.basename(path) != f"{profile_id}.pstats" or not os.path.exists(path):
+        abort(404)
+    if request.args.get("format") == "text":
+        sort = request.args.get("sort", "cumulative")
+        if sort not in ("cumulative", "tottime", "calls"):
+            return jsonify({"error": "sort must be cumulative, tottime or calls."}), 400
+        return Response(report(pstats.Stats(path), sort), mimetype="text/plain")
+    return send_file(os.path.abspath(path), mimetype="application/octet-stream",
+                     as_attachment=True, download_name=f"{profile_id}.pstats")
+
+
+@debug_bp.route("/memory")
+@admin_required
+def memory():
+    """RSS, per-component sizes and entry counts; ?components=0 skips the object walk"""
+    return jsonify(memory_report(components=request.args.get("components", "1") != "0"))
+
+
+@debug_bp.route("/memory/tracemalloc/start", methods=["POST"])
+@admin_required
+def tracemalloc_start():
+    """Start tracing allocations and take the baseline snapshot"""
+    start_tracing(request.args.get("frames", type=int))
+    return jsonify(tracing_stats())
+
+
+@debug_bp.route("/memory/tracemalloc")
+@admin_required
+def tracemalloc_diff():
+    """Top allocation sites by growth since the baseline (?top=N&key=lineno&rebase=1)"""
+    key_type = request.args.get("key", "lineno")
+    if key_type not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "key must be lineno, filename or traceback."}), 400
+    top = min(request.args.get("top", 20, type=int), 500)
+    diff = allocation_diff(top, key_type, rebase=request.args.get("rebase") == "1")
+    if diff is None:
+        return jsonify({"error": "tracemalloc is not running, POST /debug/memory/tracemalloc/start first."}), 409
+    return jsonify({**tracing_stats(), **diff})
+
+
+@debug_bp.route("/memory/tracemalloc/stop", methods=["POST"])
+@admin_required
+def tracemalloc_stop():
+    stop_tracing()
+    return jsonify(tracing_stats())
+
+
+@debug_bp.route("/clients")
+@admin_required
+def clients():
+    """Allowed and limited requests per client and budget, most limited first (?top=N)"""
+    top = min(request.args.get("top", 100, type=int), 10000)
+    budgets = get_limits().budgets
+    return jsonify({name: {**budget.stats(), "clients": budget.clients(top)} for name, budget in budgets.items()})
+
+
+@debug_bp.route("/audit/<query>")
+@admin_required
+def audit(query):
+    """An audit log query (?tenant=&hours=&limit=)"""
+    if query not in AUDIT_QUERIES:
+        return jsonify({"error": f"query must be one of {', '.join(sorted(AUDIT_QUERIES))}."}), 404
+    if not settings.AUDIT_DB:
+        return jsonify({"error": "The audit log is off, set AUDIT_DB."}), 409
+    hours = request.args.get("hours", type=float)
+    kwargs = {}
+    if query in ("top-questions", "slowest"):
+        kwargs["limit"] = min(request.args.get("limit", 20, type=int), 1000)
+    conn = audit_connect(settings.AUDIT_DB)
+    try:
+        result = AUDIT_QUERIES[query](conn, request.args.get("tenant"),
+                                      time.time() - hours * 3600 if hours else None, **kwargs)
+    finally:
+        conn.close()
+    return jsonify(result)
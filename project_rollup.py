@@ -0,0 +1,188 @@
+"""Bill-of-materials rollups for the run5 inventory
+
+``project_rollup`` keeps one row per project with its number of item lines,
+pieces and Rp value. Triggers on ``project_barang`` and on item prices keep
+it current, so every change costs a few indexed row updates. Per-agency and
+per-status totals are computed from the rollup, and item→projects lookups
+use the index on ``project_barang(barang_id)``. A question reads the totals
+of the agencies and statuses it names only, through their indexes.
+
+``structured_context`` turns the projects, items, agencies and statuses
+named in a question into short factual lines for the prompt.
+"""
+from catalog_names import matching, phrases, rp
+
+
+def rebuild_rollups(conn):
+    """Recompute project_rollup from project_barang"""
+    conn.execute("DELETE FROM project_rollup")
+    conn.execute('''INSERT INTO project_rollup (project_id, item_lines, item_count, total_value)
+                    SELECT pb.project_id, COUNT(*), SUM(pb.jumlah), SUM(pb.jumlah * COALESCE(b.harga, 0))
+                    FROM project_barang pb LEFT JOIN barang b ON b.id = pb.barang_id
+                    GROUP BY pb.project_id''')
+
+
+def install_project_rollups(conn):
+    """Create the indexes, project_rollup and the triggers that maintain it"""
+    c = conn.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS project_barang_project ON project_barang (project_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS project_barang_barang ON project_barang (barang_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS project_instansi ON project (instansi)")
+    c.execute("CREATE INDEX IF NOT EXISTS project_status ON project (status)")
+    c.execute("CREATE INDEX IF NOT EXISTS project_nama_lower ON project (lower(nama))")
+    c.execute("CREATE INDEX IF NOT EXISTS project_instansi_lower ON project (lower(instansi))")
+    c.execute("CREATE INDEX IF NOT EXISTS project_status_lower ON project (lower(status))")
+    c.execute("CREATE INDEX IF NOT EXISTS barang_nama_lower ON barang (lower(nama))")
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'project_rollup'").fetchone()
+    c.execute('''CREATE TABLE IF NOT EXISTS project_rollup (
+                    project_id INTEGER PRIMARY KEY,
+                    item_lines INTEGER NOT NULL DEFAULT 0,
+                    item_count INTEGER NOT NULL DEFAULT 0,
+                    total_value INTEGER NOT NULL DEFAULT 0)''')
+
+    add = '''INSERT INTO project_rollup (project_id, item_lines, item_count, total_value)
+             VALUES (NEW.project_id, 1, NEW.jumlah,
+                     NEW.jumlah * COALESCE((SELECT harga FROM barang WHERE id = NEW.barang_id), 0))
+             ON CONFLICT (project_id) DO UPDATE SET
+                 item_lines = item_lines + 1,
+                 item_count = item_count + excluded.item_count,
+                 total_value = total_value + excluded.total_value;'''
+    remove = '''UPDATE project_rollup SET
+                    item_lines = item_lines - 1,
+                    item_count = item_count - OLD.jumlah,
+                    total_value = total_value
+                        - OLD.jumlah * COALESCE((SELECT harga FROM barang WHERE id = OLD.barang_id), 0)
+                WHERE project_id = OLD.project_id;
+             DELETE FROM project_rollup WHERE project_id = OLD.project_id AND item_lines = 0;'''
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS project_barang_rollup_insert AFTER INSERT ON project_barang BEGIN {add} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS project_barang_rollup_delete AFTER DELETE ON project_barang BEGIN {remove} END")
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS project_barang_rollup_update
+                  AFTER UPDATE OF project_id, barang_id, jumlah ON project_barang
+                  BEGIN {remove} {add} END''')
+    # A price change moves the value of every project using the item
+    c.execute('''CREATE TRIGGER IF NOT EXISTS barang_rollup_price
+                 AFTER UPDATE OF harga ON barang
+                 WHEN OLD.harga IS NOT NEW.harga
+                 BEGIN
+                     UPDATE project_rollup SET total_value = total_value
+                         + (COALESCE(NEW.harga, 0) - COALESCE(OLD.harga, 0)) * (
+                             SELECT SUM(jumlah) FROM project_barang
+                             WHERE barang_id = NEW.id AND project_id = project_rollup.project_id)
+                     WHERE project_id IN (SELECT project_id FROM project_barang WHERE barang_id = NEW.id);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS barang_rollup_delete
+                 AFTER DELETE ON barang
+                 BEGIN
+                     UPDATE project_rollup SET total_value = total_value - COALESCE(OLD.harga, 0) * (
+                             SELECT SUM(jumlah) FROM project_barang
+                             WHERE barang_id = OLD.id AND project_id = project_rollup.project_id)
+                     WHERE project_id IN (SELECT project_id FROM project_barang WHERE barang_id = OLD.id);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS project_rollup_delete
+                 AFTER DELETE ON project
+                 BEGIN DELETE FROM project_rollup WHERE project_id = OLD.id; END''')
+    if not exists:
+        rebuild_rollups(conn)
+
+
+_SUMMARY = '''SELECT p.id, p.nama, p.kota, p.instansi, p.status,
+                     COALESCE(r.item_lines, 0), COALESCE(r.item_count, 0), COALESCE(r.total_value, 0)
+              FROM project p LEFT JOIN project_rollup r ON r.project_id = p.id'''
+
+
+def _summary(row):
+    return {"id": row[0], "nama": row[1], "kota": row[2], "instansi": row[3], "status": row[4],
+            "item_lines": row[5], "item_count": row[6], "total_value": row[7]}
+
+
+def project_summaries(conn):
+    """Every project with its item lines, pieces and Rp value"""
+    return [_summary(row) for row in conn.execute(_SUMMARY + " ORDER BY p.id")]
+
+
+def project_detail(conn, project):
+    """A project (id or name) with its rollup and items, or None"""
+    if isinstance(project, int) or str(project).isdigit():
+        row = conn.execute(_SUMMARY + " WHERE p.id = ?", (int(project),)).fetchone()
+    else:
+        row = conn.execute(_SUMMARY + " WHERE lower(p.nama) = lower(?)", (project,)).fetchone()
+    if row is None:
+        return None
+    detail = _summary(row)
+    detail["items"] = [
+        {"barang_id": r[0], "nama": r[1], "jumlah": r[2], "harga": r[3], "nilai": r[2] * (r[3] or 0)}
+        for r in conn.execute('''SELECT b.id, b.nama, pb.jumlah, b.harga
+                                 FROM project_barang pb JOIN barang b ON b.id = pb.barang_id
+                                 WHERE pb.project_id = ? ORDER BY b.nama''', (detail["id"],))
+    ]
+    return detail
+
+
+def _group_rollup(conn, column, value=None):
+    # With a value, only its projects are read (through the index on the column)
+    where, params = (f"WHERE p.{column} = ?", (value,)) if value is not None else ("", ())
+    rows = conn.execute(f'''SELECT p.{column}, COUNT(*), group_concat(p.nama, ', '),
+                                   COALESCE(SUM(r.item_count), 0), COALESCE(SUM(r.total_value), 0)
+                            FROM project p LEFT JOIN project_rollup r ON r.project_id = p.id
+                            {where}
+                            GROUP BY p.{column} ORDER BY p.{column}''', params)
+    return [{column: r[0], "projects": r[1], "project_names": r[2].split(", ") if r[2] else [],
+             "item_count": r[3], "total_value": r[4]} for r in rows]
+
+
+def agency_rollup(conn):
+    """Projects, pieces and Rp value per agency (instansi)"""
+    return _group_rollup(conn, "instansi")
+
+
+def status_rollup(conn):
+    """Projects, pieces and Rp value per project status"""
+    return _group_rollup(conn, "status")
+
+
+def item_usage(conn, item):
+    """The projects using an item (id or name), or None for an unknown item"""
+    if isinstance(item, int) or str(item).isdigit():
+        row = conn.execute("SELECT id, nama, harga FROM barang WHERE id = ?", (int(item),)).fetchone()
+    else:
+        row = conn.execute("SELECT id, nama, harga FROM barang WHERE lower(nama) = lower(?)", (item,)).fetchone()
+    if row is None:
+        return None
+    projects = [
+        {"project_id": r[0], "nama": r[1], "status": r[2], "jumlah": r[3], "nilai": r[3] * (row[2] or 0)}
+        for r in conn.execute('''SELECT p.id, p.nama, p.status, pb.jumlah
+                                 FROM project_barang pb JOIN project p ON p.id = pb.project_id
+                                 WHERE pb.barang_id = ? ORDER BY p.nama''', (row[0],))
+    ]
+    return {"barang_id": row[0], "nama": row[1], "harga": row[2], "projects": projects,
+            "total_jumlah": sum(p["jumlah"] for p in projects)}
+
+
+def _mentioned(conn, table, named, column="nama"):
+    return matching(conn, f"SELECT DISTINCT {column} FROM {table} WHERE lower({column}) IN ({{marks}})", named)
+
+
+def structured_context(conn, question):
+    """Facts from the rollups about what the question names, one per line"""
+    named = phrases(question)
+    lines = []
+    for name in _mentioned(conn, "project", named):
+        p = project_detail(conn, name)
+        items = ", ".join(f"{i['nama']} ({i['jumlah']} pcs)" for i in p["items"]) or "-"
+        lines.append(f"{p['nama']} ({p['instansi']}, {p['kota']}, status {p['status']}): "
+                     f"{p['item_lines']} jenis barang, {p['item_count']} pcs, nilai {rp(p['total_value'])}. "
+                     f"Isi: {items}")
+    for name in _mentioned(conn, "barang", named):
+        usage = item_usage(conn, name)
+        used = ", ".join(f"{p['nama']} ({p['jumlah']} pcs)" for p in usage["projects"]) or "tidak ada project"
+        lines.append(f"{usage['nama']} dipakai di: {used}")
+    for agency in _mentioned(conn, "project", named, "instansi"):
+        for group in _group_rollup(conn, "instansi", agency):
+            lines.append(f"Instansi {group['instansi']}: {group['projects']} project "
+                         f"({', '.join(group['project_names'])}), {group['item_count']} pcs, "
+                         f"nilai {rp(group['total_value'])}")
+    for status in _mentioned(conn, "project", named, "status"):
+        for group in _group_rollup(conn, "status", status):
+            lines.append(f"Status {group['status']}: {group['projects']} project "
+                         f"({', '.join(group['project_names'])}), nilai {rp(group['total_value'])}")
+    return "\n".join(lines)
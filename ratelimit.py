@@ -0,0 +1,165 @@
+"""Per-client rate limits for the assistant endpoints
+
+Each client (its ``X-API-Key`` when that is one of
+``RATE_LIMIT_API_KEYS``, else its address) has two budgets:
+``page`` for the cheap endpoints (pages, search, suggestions, carts and
+orders) and ``llm`` for anything that generates an answer (``/ask``, a form
+question). A request over budget gets 429 with a ``Retry-After`` header
+before it reaches the view, so a looping integration cannot keep the LLM
+backends busy.
+
+The buckets use the generic cell rate algorithm, which is a token bucket
+stored as one float per client: the time at which the bucket would be full
+again. Clients are kept in an ``OrderedDict`` in the order they were last
+seen; a check is one read and a move to the end, so it needs no lock and
+costs the same with thousands of clients. Two concurrent requests of the
+same client may both pass on the last token; the limit is approximate by
+at most that. Past ``RATE_LIMIT_MAX_CLIENTS``, each new client evicts the
+least recently seen ones (at most ``EVICT_PER_CHECK``), so memory stays
+bounded at constant cost per check; an evicted client starts again with a
+full bucket, which the least recently seen one has almost always refilled.
+
+The limits hold per process: with several workers, a client gets each
+budget once per worker.
+"""
+import functools
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+from flask import jsonify, make_response, request
+
+import settings
+from admin import is_admin
+
+# Least recently seen clients evicted by one new client, at most
+EVICT_PER_CHECK = 2
+
+
+class RateLimiter:
+    """Token buckets of one budget, keyed by client"""
+
+    def __init__(self, name, rate, burst, max_clients=None):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_clients = max_clients or settings.RATE_LIMIT_MAX_CLIENTS
+        self.interval = 1.0 / rate
+        # Time a full bucket takes to drain, i.e. the most a client may be ahead of its rate
+        self.tolerance = self.burst * self.interval
+        # client: [time its bucket is full again, allowed, limited], least recently seen first
+        self._clients = OrderedDict()
+        self.evicted = 0
+
+    def check(self, client, cost=1):
+        """(allowed, seconds until allowed, tokens left) for one request of a client"""
+        now = time.monotonic()
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = [now, 0, 0]
+            self._evict()
+        else:
+            try:
+                self._clients.move_to_end(client)
+            except KeyError:
+                # Evicted by another thread meanwhile; this request still counts
+                pass
+        new_full_at = max(state[0], now) + cost * self.interval
+        ahead = new_full_at - now
+        if ahead > self.tolerance:
+            state[2] += 1
+            return False, ahead - self.tolerance, 0
+        state[0] = new_full_at
+        state[1] += 1
+        return True, 0.0, int((self.tolerance - ahead) / self.interval)
+
+    def _evict(self):
+        """Drop the least recently seen clients past max_clients, at most EVICT_PER_CHECK"""
+        for _ in range(EVICT_PER_CHECK):
+            if len(self._clients) <= self.max_clients:
+                return
+            try:
+                self._clients.popitem(last=False)
+            except KeyError:
+                return
+            self.evicted += 1
+
+    def clients(self, top=None):
+        """Per-client allowed and limited counts, most limited first"""
+        ranked = sorted(list(self._clients.items()), key=lambda item: (-item[1][2], -item[1][1]))
+        return [{"client": client, "allowed": c[1], "limited": c[2]} for client, c in ranked[:top]]
+
+    def stats(self):
+        states = list(self._clients.values())
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "tracked_clients": len(states),
+            "allowed": sum(c[1] for c in states),
+            "limited": sum(c[2] for c in states),
+            "evicted": self.evicted,
+            "top_limited": [c for c in self.clients(10) if c["limited"]],
+        }
+
+
+class RateLimits:
+    """The page and llm budgets of the process"""
+
+    def __init__(self):
+        self.budgets = {
+            "page": RateLimiter("page", settings.RATE_LIMIT_PAGE_RPS, settings.RATE_LIMIT_PAGE_BURST),
+            "llm": RateLimiter("llm", settings.RATE_LIMIT_LLM_RPS, settings.RATE_LIMIT_LLM_BURST),
+        }
+
+    def stats(self):
+        return {name: budget.stats() for name, budget in self.budgets.items()}
+
+
+def get_limits():
+    """The process-wide budgets (one set shared by the tenants of a server)"""
+    from tenants import shared
+
+    return shared("rate_limits", RateLimits)
+
+
+def client_id():
+    """Configured API key (hashed) of the request, else its address"""
+    api_key = request.headers.get("X-API-Key")
+    # An unknown key would give a fresh budget per request; it counts as the address
+    if api_key and api_key in settings.RATE_LIMIT_API_KEYS:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    address = request.remote_addr or "unknown"
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("X-Forwarded-For", "")
+        address = forwarded.split(",")[0].strip() or address
+    return "ip:" + address
+
+
+def rate_limited(endpoint):
+    """Charge a view's requests to the client's budget; endpoint is "ask", "form" or "page"
+
+    A form post with a question is charged to the llm budget, anything else
+    to the page budget. Requests with the admin token are not limited (when
+    one is set).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not settings.RATE_LIMIT or (settings.ADMIN_TOKEN and is_admin()):
+                return view(*args, **kwargs)
+            question = endpoint == "form" and request.method == "POST" and request.form.get("question")
+            budget = "llm" if endpoint == "ask" or question else "page"
+            limiter = get_limits().budgets[budget]
+            allowed, retry_after, remaining = limiter.check(client_id())
+            if not allowed:
+                response = jsonify({"error": f"Too many requests, retry in {retry_after:.1f} s.", "budget": budget})
+                response.status_code = 429
+                response.headers["Retry-After"] = str(math.ceil(retry_after))
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.headers["X-RateLimit-Budget"] = budget
+            response.headers["X-RateLimit-Remaining"] = str(remaining)
+            return response
+        return wrapper
+    return decorator
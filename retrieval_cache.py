@@ -0,0 +1,158 @@
+"""Cache between the embedder and the vector search
+
+Many different questions retrieve exactly the same documents ("barang yang
+tersedia", "ongkos kirim"). ``RetrievalCache`` remembers, per normalized
+question, the retrieved document ids and the context string built by
+``format_docs``. With ``lsh_bits`` set, a question that misses on its text is
+embedded and looked up again by a random-hyperplane hash of its vector, so
+near-identical phrasings share an entry and only skip the vector search.
+
+Entries live in a cache backend (cache_backends.make_cache: in-process,
+a SQLite file shared by the host's workers, or a Redis-protocol server
+shared by every node) under keys that carry the catalog version, so a new
+version is a clean miss everywhere at once. An in-process backend is also
+emptied on a version change; shared ones let old keys age out.
+"""
+import re
+import threading
+import time
+import unicodedata
+
+import settings
+from cache_backends import make_cache
+from traffic import note, stage
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Case-, accent-, punctuation- and whitespace-insensitive form of a question"""
+    text = unicodedata.normalize("NFKD", question)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def doc_id(doc):
+    return getattr(doc, "id", None) or doc.metadata.get("id") or doc.metadata.get("source")
+
+
+def format_docs(docs):
+    """Retrieved documents as one context string"""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+class RetrievalCache:
+    """Caches retrieved document ids and formatted context per question"""
+
+    def __init__(self, retriever, format_docs, version_fn, max_entries=None, lsh_bits=None, version_ttl=None,
+                 backend=None, namespace="retrieval"):
+        self.retriever = retriever
+        self.format_docs = format_docs
+        self.version_fn = version_fn
+        self.max_entries = max_entries or settings.RETRIEVAL_CACHE_SIZE
+        self.lsh_bits = settings.RETRIEVAL_CACHE_LSH_BITS if lsh_bits is None else lsh_bits
+        self.version_ttl = settings.CATALOG_VERSION_TTL if version_ttl is None else version_ttl
+        self.backend = backend if backend is not None else make_cache(namespace, max_entries=self.max_entries)
+        self._planes = None
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0.0
+        self.hits = 0
+        self.lsh_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_ms = 0.0
+        self._miss_ms = None
+
+    def _current_version(self):
+        now = time.monotonic()
+        if now - self._version_checked >= self.version_ttl:
+            version = self.version_fn()
+            self._version_checked = now
+            with self._lock:
+                if version != self._version:
+                    if self._version is not None:
+                        self.invalidations += 1
+                        if not self.backend.shared:
+                            self.backend.clear()
+                    self._version = version
+        return self._version
+
+    def _signature(self, vector):
+        # numpy is only needed (and imported) with LSH enabled
+        import numpy as np
+
+        vector = np.asarray(vector, dtype=np.float32)
+        if self._planes is None or self._planes.shape[1] != len(vector):
+            # Fixed seed: the same question hashes the same in every worker
+            self._planes = np.random.default_rng(0).standard_normal((self.lsh_bits, len(vector))).astype(np.float32)
+        return np.packbits(self._planes @ vector >= 0).tobytes().hex()
+
+    def _hit(self, counter):
+        setattr(self, counter, getattr(self, counter) + 1)
+        if self._miss_ms is not None:
+            self.saved_ms += self._miss_ms
+
+    def lookup(self, question):
+        """(document ids, formatted context) for a question"""
+        version = self._current_version()
+        key = f"q:{version}:{normalize_question(question)}"
+        entry = self.backend.get(key)
+        if entry is not None:
+            self._hit("hits")
+            note(retrieval_cache="hit")
+            return entry[0], entry[1]
+
+        start = time.perf_counter()
+        signature = None
+        store = getattr(self.retriever, "vectorstore", None)
+        if self.lsh_bits and store is not None:
+            vector = store.embeddings.embed_query(question)
+            signature = f"lsh:{version}:{self._signature(vector)}"
+            entry = self.backend.get(signature)
+            if entry is not None:
+                self._hit("lsh_hits")
+                note(retrieval_cache="lsh_hit")
+                self.backend.set(key, entry)
+                return entry[0], entry[1]
+            docs = store.similarity_search_by_vector(vector, **self.retriever.search_kwargs)
+        else:
+            docs = self.retriever.invoke(question)
+        entry = [[doc_id(doc) for doc in docs], self.format_docs(docs)]
+        self.backend.set(key, entry)
+        if signature is not None:
+            self.backend.set(signature, entry)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self._miss_ms = elapsed if self._miss_ms is None else 0.9 * self._miss_ms + 0.1 * elapsed
+        self.misses += 1
+        note(retrieval_cache="miss")
+        return entry[0], entry[1]
+
+    def clear(self):
+        """Drop every entry, e.g. after the vector store changed"""
+        self.backend.clear()
+
+    def context(self, question):
+        """Chain step: formatted context for a question"""
+        with stage("retrieval"):
+            ids, context = self.lookup(question)
+        note(doc_ids=ids)
+        return context
+
+    def stats(self):
+        lookups = self.hits + self.lsh_hits + self.misses
+        backend = self.backend.stats()
+        return {
+            "entries": backend.get("entries"),
+            "backend": backend,
+            "catalog_version": self._version,
+            "hits": self.hits,
+            "lsh_hits": self.lsh_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.lsh_hits) / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "saved_ms": round(self.saved_ms, 2),
+            "mean_miss_ms": round(self._miss_ms or 0.0, 3),
+        }
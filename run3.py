@@ -1,18 +1,16 @@
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from langchain_chroma import Chroma
 from uuid import uuid4
-from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_ollama import ChatOllama
 import os,sys
 import json
 import sqlite3
 
+from ollama_pool import OllamaPool
+from catalog_version import get_catalog_version, install_version_tracking
+from vector_backends import make_vector_store, sync_documents
+
 
 # File paths for persistent storage
 db_path = "store.db"
+snapshot_path = "store.hnsw"
 model_config_path = "./model.json"
 
 # Ensure the persistence directory exists
@@ -60,6 +58,9 @@ def init_db():
         ]
         c.executemany("INSERT INTO ongkir (kota, biaya) VALUES (?, ?)", ongkir)
 
+    # Bump the catalog version on every change to the catalog tables
+    install_version_tracking(conn, ["barang", "ongkir"])
+
     conn.commit()
     conn.close()
 
@@ -87,34 +88,37 @@ def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
 def main():
+    # LangChain and FastEmbed are only imported when a question is asked
+    from embedding_service import get_embeddings
+    from langchain_core.documents import Document
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnablePassthrough
+
     # Ensure database is initialized before anything else
     init_db()
     # Initialize or load the LLM
     if os.path.exists(model_config_path):
         with open(model_config_path, "r") as f:
             config = json.load(f)
-        llm = ChatOllama(**config)
+        llm = OllamaPool(config=config)
         print("Model initialized from configuration file.")
     else:
-        llm = ChatOllama(
-            model="hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest",
-            temperature=0,
-        )
         config = {"model": "hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest", "temperature": 0}
+        llm = OllamaPool(config=config)
         with open(model_config_path, "w") as f:
             json.dump(config, f)
         print("Model initialized and configuration saved.")
 
-    # Initialize the embeddings
-    embeddings = FastEmbedEmbeddings(
-        model_name="intfloat/multilingual-e5-large"
-    )
+    # Initialize the embeddings (shared with the other apps through the embedding service)
+    embeddings = get_embeddings("intfloat/multilingual-e5-large")
 
     # Initialize the vector store
-    vector_store = Chroma(
+    vector_store = make_vector_store(
+        embeddings,
         collection_name="example_collection",
-        embedding_function=embeddings,
         persist_directory=persist_directory,
+        snapshot_path=snapshot_path,
     )
     # print("Vector store initialized.")
 
@@ -144,10 +148,9 @@ def main():
         ),
     ]
 
-    # Tambahkan dokumen ke vector store jika belum ada data
-    if not os.listdir(persist_directory):
-        vector_store.add_documents(documents)
-        # print("Documents added to vector store and persisted.")
+    # Tambahkan dokumen ke vector store jika belum ada data (snapshot HNSW yang basi dibangun ulang di background)
+    sync_documents(vector_store, documents, get_catalog_version(db_path))
+    # print("Documents added to vector store and persisted.")
 
     # Set up retriever
     retriever = vector_store.as_retriever(
@@ -183,12 +186,10 @@ def main():
     rag_chain = (
         {"context": retriever | format_docs, "question": RunnablePassthrough() }
         | rag_prompt
-        | llm
+        | llm.invoke
         | StrOutputParser()
     )
     question = sys.argv[1]
-    retrieved_docs = retriever.invoke({"input": question})
-    formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
     answer = rag_chain.invoke(question)
     print(answer)
     # print({"question": question, "answer": answer})
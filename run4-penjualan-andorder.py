@@ -1,25 +1,44 @@
-from flask import Flask, request, jsonify, render_template_string
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from langchain_chroma import Chroma
+from flask import Blueprint, Flask, make_response, Response, request, jsonify, render_template_string, stream_with_context
 from uuid import uuid4
-from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_ollama import ChatOllama
-import os
-import json
+from operator import itemgetter
 import sqlite3
 
-app = Flask(__name__)
+import settings
+from startup import StartupTimer, run_cli
+from profiling import debug_bp, profiled
+from traffic import note, traced
+from ratelimit import rate_limited
+from memory_report import register_components
+from cache_backends import get_bus
+from catalog_version import CatalogWatcher, get_catalog_version, install_version_tracking
+from vector_backends import make_vector_store, sync_documents
+from llm_scheduler import SchedulerTimeout, use_priority
+from retrieval_cache import RetrievalCache, format_docs
+from faq_warmer import FAQWarmer
+from tenants import collection_name, data_path, get_scheduler, load_llm, load_prompt, vector_directory
+from conversation_memory import ConversationMemory, llm_summarizer
+from structured_output import STRUCTURED_TEMPLATE, StructuredOutputError, parse_cart, price_cart
+from structured_output import model_kwargs as structured_model_kwargs
+from suggest_index import SUGGEST_SCRIPT, SuggestIndex, install_suggest_log
+from stock_alerts import StockAlerts, install_low_stock_tracking, low_stock_items, set_threshold
+from variants import find_items, install_variants, item_filters, migrate_stock_flags, variant_context
+from admin import admin_required
+from catalog_import import CatalogImporter, CatalogImportError, detect_format, text_stream
+from embedding_queue import EmbeddingQueue, row_documents
+from orders import (OrderError, OrderTimeout, OrderWriter, OutOfStock, cart_answer, init_order_tables, load_order,
+                    quote_cart)
+
+# Routes live on a blueprint: at / when the app runs on its own, under /sales in server.py
+TENANT = "sales"
+bp = Blueprint(TENANT, __name__)
 
 # File paths for persistent storage
-db_path = "store.db"
+db_path = data_path(TENANT, "store.db")
+snapshot_path = data_path(TENANT, "store.hnsw")
 model_config_path = "./model.json"
 
 # Ensure the persistence directory exists
-persist_directory = "./chroma_langchain_db"
-os.makedirs(persist_directory, exist_ok=True)
+persist_directory = vector_directory("./chroma_langchain_db")
 
 def init_db():
     """Initialize SQLite database with initial data"""
@@ -41,15 +60,18 @@ def init_db():
                     kota TEXT,
                     biaya INTEGER)''')
     
+    barang = [
+        ("Baju Kemeja", 100000, "Pakaian", "S,M,L,XL", 50),
+        ("Celana Cino", 180000, "Pakaian", "M,L,XL", 30),
+        ("Topi Kinz", 50000, "Aksesoris", "All Size", 0)
+    ]
     # Check if barang table is empty and insert initial data
     c.execute("SELECT COUNT(*) FROM barang")
     if c.fetchone()[0] == 0:
-        barang = [
-            ("Baju Kemeja", 100000, "Pakaian", "S,M,L,XL", 1),
-            ("Celana Cino", 180000, "Pakaian", "M,L,XL", 1),
-            ("Topi Kinz", 50000, "Aksesoris", "All Size", 0)
-        ]
         c.executemany("INSERT INTO barang (nama, harga, kategori, ukuran, stok) VALUES (?, ?, ?, ?, ?)", barang)
+    # Databases from before /checkout used stok as an in-stock flag (1 or 0):
+    # the seeded items get the seed counts, once, before anything reads them
+    migrate_stock_flags(conn, "ukuran", {row[0]: row[4] for row in barang})
     
     # Check if ongkir table is empty and insert initial data
     c.execute("SELECT COUNT(*) FROM ongkir")
@@ -62,95 +84,43 @@ def init_db():
         ]
         c.executemany("INSERT INTO ongkir (kota, biaya) VALUES (?, ?)", ongkir)
     
+    # Per-item low-stock thresholds and the log of threshold crossings
+    install_low_stock_tracking(conn)
+
+    # Orders placed through /checkout
+    init_order_tables(conn)
+
+    # Log name changes for the type-ahead index
+    install_suggest_log(conn, ["barang", "kota"])
+
+    # Sizes as barang_varian rows with their own stock (migrated from barang.ukuran once)
+    install_variants(conn, "ukuran")
+
+    # Bump the catalog version on every change to the catalog tables (stock
+    # only when an item or size sells out or comes back)
+    install_version_tracking(conn, ["barang", "ongkir", "barang_varian"],
+                             stock_columns={"barang": "stok", "barang_varian": "stok"})
+
     conn.commit()
     conn.close()
 
-# Ensure database is initialized before anything else
-init_db()
-
-def get_barang():
-    """Retrieve products from the database"""
+def get_barang(**filters):
+    """Retrieve products from the database, filtered as in variants.find_items"""
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT id, nama, harga, kategori, ukuran, stok FROM barang")
-    data = [{"id": row[0], "nama": row[1], "harga": row[2], "kategori": row[3], "ukuran": row[4].split(','), "stok": bool(row[5])} for row in c.fetchall()]
-    conn.close()
-    return data
+    try:
+        return find_items(conn, "ukuran", **filters)
+    finally:
+        conn.close()
 
-def get_ongkir():
-    """Retrieve shipping rates from the database"""
+def get_ongkir(limit=None):
+    """Retrieve shipping rates from the database (the first limit of them, if given)"""
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    c.execute("SELECT kota, biaya FROM ongkir")
+    c.execute("SELECT kota, biaya FROM ongkir ORDER BY id LIMIT ?", (-1 if limit is None else limit,))
     data = {row[0]: row[1] for row in c.fetchall()}
     conn.close()
     return data
 
-# Initialize or load the LLM
-if os.path.exists(model_config_path):
-    with open(model_config_path, "r") as f:
-        config = json.load(f)
-    llm = ChatOllama(**config)
-    print("Model initialized from configuration file.")
-else:
-    llm = ChatOllama(
-        model="hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest",
-        temperature=0,
-    )
-    config = {"model": "hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest", "temperature": 0}
-    with open(model_config_path, "w") as f:
-        json.dump(config, f)
-    print("Model initialized and configuration saved.")
-
-# Initialize the embeddings
-embeddings = FastEmbedEmbeddings(
-    model_name="intfloat/multilingual-e5-large"
-)
-
-# Initialize the vector store
-vector_store = Chroma(
-    collection_name="example_collection",
-    embedding_function=embeddings,
-    persist_directory=persist_directory,
-)
-print("Vector store initialized.")
-
-# Retrieve current barang and ongkir data
-barang = get_barang()
-ongkir = get_ongkir()
-
-# Membuat string daftar barang untuk dokumen
-barang_text = "\n".join([f"{item['nama']} (Kategori: {item['kategori']}, Harga: Rp{item['harga']}, "
-    f"Ukuran: {', '.join(item['ukuran'])}, Stok: {'Tersedia' if item['stok'] else 'Habis'})"
-    for item in barang])
-ongkir_text = ", ".join([f"{k.lower()} (Rp{v})" for k, v in ongkir.items()])
-
-# Membuat dokumen
-documents = [
-    Document(
-        page_content=f"Barang yang tersedia:\n{barang_text}.",
-        metadata={"source": "product_info"},
-    ),
-    Document(
-        page_content=f"Ongkos kirim: {ongkir_text}.",
-        metadata={"source": "shipping_info"},
-    ),
-    Document(
-        page_content="Setelah memilih warna, ukuran, dan alamat, silakan lakukan transfer sesuai total biaya.",
-        metadata={"source": "cart"},
-    ),
-]
-
-# Tambahkan dokumen ke vector store jika belum ada data
-if not os.listdir(persist_directory):
-    vector_store.add_documents(documents)
-    print("Documents added to vector store and persisted.")
-
-# Set up retriever
-retriever = vector_store.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 3}
-)
 
 # Define prompt template for customer service toko 
 # template = """
@@ -177,6 +147,9 @@ template = """You are an assistant to calculate the total cost of items in the s
 Here is a list of available items, prices, categories, sizes, stock status, and shipping costs:
 {context}
 
+Conversation so far (empty for a new conversation):
+{history}
+
 The user has provided the following information:
 {question}
 
@@ -194,40 +167,213 @@ If you ask for the size and the size is available with the size per item, please
 
 If only item: Available, "item stock available" if not "item not available"""
 
-# Initialize the prompt template
-rag_prompt = PromptTemplate.from_template(template)
-
-# Function to format the documents into a string
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+def answer_question(question, session_id, answer_format):
+    """The answer text, and in structured mode the quote it was rendered from"""
+    history = memory.history(session_id)
+    inputs = {"question": question, "history": history}
+    cart = None
+    if answer_format == "structured":
+        cart, answer = priced_cart(structured_chain.invoke(inputs))
+    else:
+        answer = quoted_answer(question)
+        # Warm answers were made without a conversation, so only a first question can use one
+        if answer is None and not history:
+            answer = faq_warmer.lookup(question)
+        if answer is None:
+            answer = rag_chain.invoke(inputs)
+    memory.append(session_id, question, answer)
+    note(answer=answer)
+    return answer, cart
+
+# A cart in the question is priced by quote_cart, the same way /checkout charges it
+def quoted_answer(question):
+    conn = sqlite3.connect(db_path)
+    try:
+        return cart_answer(conn, question)
+    finally:
+        conn.close()
 
-# Create the RAG chain
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough() }
-    | rag_prompt
-    | llm
-    | StrOutputParser()
-)
+# The structured model only reads the cart; quote_cart prices it as /checkout will
+def priced_cart(cart):
+    conn = sqlite3.connect(db_path)
+    try:
+        return price_cart(conn, cart)
+    finally:
+        conn.close()
 
-# Function to calculate discount
-def apply_discount(total, item_count):
-    if item_count > 3:
-        return total * 0.9  # 10% discount for more than 3 items
-    return total
+# Sizes, prices and items named in the question, read through the variant indexes
+def build_context(question):
+    conn = sqlite3.connect(db_path)
+    try:
+        facts = variant_context(conn, question, "ukuran")
+    finally:
+        conn.close()
+    context = retrieval_cache.context(question)
+    return f"{facts}\n\n{context}" if facts else context
 
-# Function for product search
+# Function for product search (the name filter runs in SQLite)
 def search_product(query):
-    products = get_barang()
-    result = [p for p in products if query.lower() in p["nama"].lower()]
-    return result
+    return get_barang(search=query)
 
-# Function to notify admin for low stock
+# Items below their own threshold (barang.stok_min), read through the partial index
 def check_low_stock():
-    low_stock_items = []
-    for item in get_barang():
-        if item['stok'] < 2:  # threshold for low stock
-            low_stock_items.append(item)
-    return low_stock_items
+    conn = sqlite3.connect(db_path)
+    try:
+        return low_stock_items(conn)
+    finally:
+        conn.close()
+
+def build_documents():
+    """The catalog as the documents indexed in the vector store"""
+    from langchain_core.documents import Document
+
+    # Retrieve current barang and ongkir data; past CATALOG_DOC_ROWS rows are
+    # found through their own documents (embedding_queue.py)
+    barang = get_barang(limit=settings.CATALOG_DOC_ROWS)
+    ongkir = get_ongkir(limit=settings.CATALOG_DOC_ROWS)
+
+    # Membuat string daftar barang untuk dokumen
+    barang_text = "\n".join([f"{item['nama']} (Kategori: {item['kategori']}, Harga: Rp{item['harga']}, "
+        f"Ukuran: {', '.join(item['ukuran'])}, Stok: {'Tersedia' if item['stok'] else 'Habis'})"
+        for item in barang])
+    ongkir_text = ", ".join([f"{k.lower()} (Rp{v})" for k, v in ongkir.items()])
+
+    # Membuat dokumen
+    documents = [
+        Document(
+            page_content=f"Barang yang tersedia:\n{barang_text}.",
+            metadata={"source": "product_info"},
+        ),
+        Document(
+            page_content=f"Ongkos kirim: {ongkir_text}.",
+            metadata={"source": "shipping_info"},
+        ),
+        Document(
+            page_content="Setelah memilih warna, ukuran, dan alamat, silakan lakukan transfer sesuai total biaya.",
+            metadata={"source": "cart"},
+        ),
+    ]
+    return documents
+
+_ready = False
+
+def init():
+    """Open the database, load the models and build the chains, once
+
+    LangChain, Chroma and FastEmbed are imported here rather than at the
+    top, so importing the app stays cheap until it is served.
+    """
+    global _ready, llm, embeddings, catalog_watcher, retrieval_cache, faq_warmer, embedding_queue, suggest_index, scheduler, memory, rag_chain, structured_chain, order_writer, stock_alerts
+    if _ready:
+        return
+    from embedding_service import get_embeddings
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableLambda
+
+    timer = StartupTimer(TENANT)
+    init_db()
+    timer.lap("init_db")
+
+    # Initialize or load the LLM (one pool per model, shared by the tenants of a server)
+    llm = load_llm(model_config_path, {"model": "hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest", "temperature": 0})
+    timer.lap("llm")
+
+    # Initialize the embeddings (shared with the other apps through the embedding service)
+    embeddings = get_embeddings("intfloat/multilingual-e5-large")
+    timer.lap("embeddings")
+
+    # Initialize the vector store
+    vector_store = make_vector_store(
+        embeddings,
+        collection_name=collection_name(TENANT, "example_collection"),
+        persist_directory=persist_directory,
+        snapshot_path=snapshot_path,
+    )
+    print("Vector store initialized.")
+
+    documents_version = get_catalog_version(db_path)
+    documents = build_documents()
+
+    # Tambahkan dokumen ke vector store jika belum ada data (snapshot HNSW yang basi dibangun ulang di background)
+    if sync_documents(vector_store, documents, documents_version, rows_fn=lambda: row_documents(db_path)):
+        print("Documents added to vector store and persisted.")
+    timer.lap("vector_store")
+
+    # Set up retriever
+    retriever = vector_store.as_retriever(
+        search_type="similarity",
+        search_kwargs={"k": 3}
+    )
+
+    # Initialize the prompt template
+    rag_prompt = PromptTemplate.from_template(load_prompt(TENANT, template))
+
+    # Catalog changes made by any worker or node reach the cache within milliseconds
+    catalog_watcher = CatalogWatcher(db_path, f"catalog:{TENANT}", bus=get_bus()).start()
+
+    # Retrieved context is reused until the catalog changes (stored in CACHE_BACKEND)
+    retrieval_cache = RetrievalCache(retriever, format_docs, catalog_watcher.current, version_ttl=0,
+                                     namespace=f"retrieval:{TENANT}")
+
+    # Rows changed by catalog imports are embedded in the background, and the
+    # aggregate documents rebuilt once the catalog moved on from documents_version
+    embedding_queue = EmbeddingQueue(db_path, vector_store, on_batch=retrieval_cache.clear,
+                                     documents_fn=build_documents, documents_version=documents_version).start()
+
+    # Type-ahead index over catalog names, kept current from suggest_log
+    suggest_index = SuggestIndex(db_path, ["barang", "kota"])
+
+    # Every generation waits for a slot in the priority scheduler (one per process)
+    scheduler = get_scheduler()
+
+    # Conversations keep their recent turns, older ones are summarized at batch priority
+    memory = ConversationMemory(db_path, summarize=llm_summarizer(scheduler, llm))
+
+    # Chain input: {"question": ..., "history": memory.history(session_id)}
+    chain_inputs = {
+        "context": itemgetter("question") | RunnableLambda(build_context),
+        "question": itemgetter("question"),
+        "history": itemgetter("history"),
+    }
+
+    # Create the RAG chain
+    rag_chain = (
+        chain_inputs
+        | rag_prompt
+        | scheduler.wrap(llm)
+        | StrOutputParser()
+    )
+
+    # Structured mode: a compact JSON cart (constrained decoding, capped length), priced and rendered on the server
+    structured_chain = (
+        chain_inputs
+        | PromptTemplate.from_template(load_prompt(f"{TENANT}_structured", STRUCTURED_TEMPLATE))
+        | scheduler.wrap(llm, model_kwargs=structured_model_kwargs())
+        | StrOutputParser()
+        | parse_cart
+    )
+    timer.lap("chains")
+
+    # Answers to the frequent questions are generated ahead of time while the LLM is idle
+    faq_warmer = FAQWarmer(db_path, lambda q: rag_chain.invoke({"question": q, "history": ""}), build_context,
+                           catalog_watcher.current, scheduler, namespace=f"faq:{TENANT}")
+    if settings.FAQ_WARMING:
+        faq_warmer.start()
+
+    # Checkouts are placed by a single writer thread in batched transactions
+    order_writer = OrderWriter(db_path).start()
+
+    # Admins are notified when an item goes low or is restocked (SSE and webhooks)
+    stock_alerts = StockAlerts(db_path).start()
+    timer.lap("background")
+
+    # Sizes and entry counts in /debug/memory
+    register_components(TENANT, vector_store=vector_store, retrieval_cache=retrieval_cache, faq=faq_warmer,
+                        suggest_index=suggest_index, memory=memory,
+                        embedding_queue=embedding_queue, order_writer=order_writer)
+    _ready = True
+
 
 # HTML template (updated with a search bar)
 HTML_TEMPLATE = """
@@ -283,7 +429,7 @@ HTML_TEMPLATE = """
             <h2>Search Products</h2>
             <form method="POST" class="row g-3">
                 <div class="col-md-8">
-                    <input type="text" name="search_query" class="form-control" placeholder="Search by name" required>
+                    <input type="text" name="search_query" data-suggest="barang" class="form-control" placeholder="Search by name" required>
                 </div>
                 <div class="col-md-4">
                     <button type="submit" class="btn btn-primary w-100">Search</button>
@@ -296,7 +442,7 @@ HTML_TEMPLATE = """
             <p class="text-muted">Example: "What is the shipping cost to Jakarta for 2 Baju Kemeja size M?"</p>
             <form method="POST" class="row g-3">
                 <div class="col-md-8">
-                    <input type="text" name="question" class="form-control" placeholder="Enter your question here" required>
+                    <input type="text" name="question" data-suggest="barang,kota" class="form-control" placeholder="Enter your question here" required>
                 </div>
                 <div class="col-md-4">
                     <button type="submit" class="btn btn-success w-100">Ask</button>
@@ -324,13 +470,18 @@ HTML_TEMPLATE = """
     </div>
     
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js" integrity="sha384-YvpcrYf0tY3lHB60NNkmXc5s9fDVZLESaAA55NDzOxhy9GkcIdslK1eN7N6jIeHz" crossorigin="anonymous"></script>
+    {{ suggest_script | safe }}
 </body>
 </html>
 """
 
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
+@rate_limited("form")
+@profiled
+@traced("form")
 def home():
     answer = None
+    session_id = request.cookies.get("session_id") or uuid4().hex
     available_items = get_barang()
     shipping_rates = get_ongkir()
     search_results = []
@@ -342,42 +493,201 @@ def home():
         
         question = request.form.get("question")
         if question:
-            # Retrieve documents
-            retrieved_docs = retriever.invoke({"input": question})
-            formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
-            
             # Get the answer from the chain
-            answer = rag_chain.invoke(question)
+            with use_priority("interactive"):
+                answer, _ = answer_question(question, session_id, settings.ANSWER_FORMAT)
     
-    return render_template_string(
+    response = make_response(render_template_string(
         HTML_TEMPLATE,
         available_items=available_items,
         shipping_rates=shipping_rates,
         search_results=search_results,
-        answer=answer
-    )
+        answer=answer,
+        suggest_script=SUGGEST_SCRIPT
+    ))
+    response.set_cookie("session_id", session_id, httponly=True, samesite="Lax")
+    return response
 
 # Keep the favicon route
-@app.route('/favicon.ico')
+@bp.route('/favicon.ico')
 def favicon():
     return '', 204
 
 # Keep the /ask endpoint for API access
-@app.route("/ask", methods=["POST"])
+@bp.route("/ask", methods=["POST"])
+@rate_limited("ask")
+@profiled
+@traced("ask")
 def ask():
     try:
         data = request.get_json()
         question = data.get("question")
         if not question:
             return jsonify({"error": "Question field is required."}), 400
+        if not isinstance(question, str):
+            return jsonify({"error": "Question must be text."}), 400
+
+        answer_format = data.get("format", settings.ANSWER_FORMAT)
+        if answer_format not in ("text", "structured"):
+            return jsonify({"error": "format must be text or structured."}), 400
+
+        session_id = data.get("session_id") or uuid4().hex
+        with use_priority("api"):
+            answer, cart = answer_question(question, session_id, answer_format)
+        response = {"question": question, "answer": answer, "session_id": session_id}
+        if cart is not None:
+            response["cart"] = cart
+        return jsonify(response)
+
+    except SchedulerTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except StructuredOutputError as e:
+        return jsonify({"error": str(e)}), 502
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        retrieved_docs = retriever.invoke({"input": question})
-        formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
-        answer = rag_chain.invoke(question)
-        return jsonify({"question": question, "answer": answer})
-
+@bp.route("/items")
+@rate_limited("page")
+def items():
+    """Items by size, price range and stock: /items?ukuran=M&max_harga=200000&in_stock=1"""
+    return jsonify(get_barang(**item_filters(request.args, "ukuran")))
+
+@bp.route("/cart/quote", methods=["POST"])
+@rate_limited("page")
+def cart_quote():
+    """Price a cart the same way /checkout will charge it"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Send a JSON object with items and kota."}), 400
+    conn = sqlite3.connect(db_path)
+    try:
+        return jsonify(quote_cart(conn, data.get("items"), data.get("kota")))
+    except OrderError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+@bp.route("/checkout", methods=["POST"])
+@rate_limited("page")
+def checkout():
+    """Place an order; send an Idempotency-Key header to make retries safe"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Send a JSON object with items and kota."}), 400
+    key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+    try:
+        order = order_writer.checkout(data.get("items"), data.get("kota"), idempotency_key=key)
+    except OutOfStock as e:
+        return jsonify({"error": str(e)}), 409
+    except OrderError as e:
+        return jsonify({"error": str(e)}), 400
+    except OrderTimeout as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    return jsonify(order), 200 if order["replayed"] else 201
+
+@bp.route("/orders/<int:order_id>")
+@rate_limited("page")
+def get_order(order_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        order = load_order(conn, order_id)
+    finally:
+        conn.close()
+    if order is None:
+        return jsonify({"error": "Order not found."}), 404
+    return jsonify(order)
+
+@bp.route("/admin/low-stock")
+@admin_required
+def admin_low_stock():
+    return jsonify(check_low_stock())
+
+@bp.route("/admin/low-stock/stream")
+@admin_required
+def admin_low_stock_stream():
+    """Server-Sent Events with every item going low or being restocked"""
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    stream = stock_alerts.stream(int(last_event_id) if last_event_id.isdigit() else None)
+    return Response(stream_with_context(stream), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route("/admin/low-stock/<int:barang_id>/threshold", methods=["PUT"])
+@admin_required
+def admin_stock_threshold(barang_id):
+    stok_min = (request.get_json(silent=True) or {}).get("stok_min")
+    if not isinstance(stok_min, int) or stok_min < 0:
+        return jsonify({"error": "stok_min must be a non-negative integer."}), 400
+    conn = sqlite3.connect(db_path)
+    try:
+        found = set_threshold(conn, barang_id, stok_min)
+    finally:
+        conn.close()
+    if not found:
+        return jsonify({"error": "Item not found."}), 404
+    return jsonify({"id": barang_id, "stok_min": stok_min})
+
+@bp.route("/admin/import/<table>", methods=["POST"])
+@admin_required
+def admin_import(table):
+    """Upsert CSV or JSONL rows, sent as a "file" upload or as the request body"""
+    if table not in ("barang", "ongkir", "barang_varian"):
+        return jsonify({"error": f"Cannot import into {table}."}), 404
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, fmt = upload.stream, detect_format(upload.filename or "")
+    else:
+        stream, fmt = request.stream, "jsonl" if "json" in request.mimetype else "csv"
+    try:
+        report = CatalogImporter(db_path).import_stream(table, text_stream(stream), request.args.get("format") or fmt)
+    except CatalogImportError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report)
+
+@bp.route("/suggest")
+@rate_limited("page")
+def suggest():
+    """Catalog names starting with q, for the type-ahead of the input fields"""
+    kinds = [k for k in request.args.get("kinds", "").split(",") if k]
+    limit = min(request.args.get("limit", 8, type=int), 20)
+    return jsonify(suggest_index.suggest(request.args.get("q", ""), limit=limit, kinds=kinds))
+
+@bp.route("/metrics")
+def metrics():
+    return jsonify({
+        "scheduler": scheduler.stats(),
+        "llm_backends": llm.stats(),
+        "embeddings": embeddings.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "catalog_watcher": catalog_watcher.stats(),
+        "faq": faq_warmer.stats(),
+        "memory": memory.stats(),
+        "suggest_index": suggest_index.stats(),
+        "stock_alerts": stock_alerts.stats(),
+        "embedding_queue": embedding_queue.stats(),
+        "orders": order_writer.stats(),
+    })
+
+_app = None
+
+def create_app():
+    """The app on its own, blueprint at /"""
+    global _app
+    if _app is None:
+        init()
+        _app = Flask(__name__)
+        _app.register_blueprint(bp)
+        _app.register_blueprint(debug_bp)
+    return _app
+
+def __getattr__(name):
+    # "run4-penjualan-andorder:app" (gunicorn, flask run) builds the app on first access
+    if name == "app":
+        return create_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5998)
\ No newline at end of file
+    run_cli(__file__, create_app, "Sales and order assistant", debug=True, port=5998)
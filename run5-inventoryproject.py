@@ -1,25 +1,42 @@
-from flask import Flask, request, jsonify, render_template_string
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from langchain_chroma import Chroma
+from flask import Blueprint, Flask, make_response, Response, request, jsonify, render_template_string, stream_with_context
 from uuid import uuid4
-from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import PromptTemplate
-from langchain_ollama import ChatOllama
-import os
-import json
+from operator import itemgetter
 import sqlite3
 
-app = Flask(__name__)
+import settings
+from cache_backends import get_bus
+from catalog_version import CatalogWatcher, get_catalog_version, install_version_tracking
+from vector_backends import make_vector_store, sync_documents
+from llm_scheduler import SchedulerTimeout, use_priority
+from retrieval_cache import RetrievalCache, format_docs
+from faq_warmer import FAQWarmer
+from tenants import collection_name, data_path, get_scheduler, load_llm, load_prompt, vector_directory
+from conversation_memory import ConversationMemory, llm_summarizer
+from suggest_index import SUGGEST_SCRIPT, SuggestIndex, install_suggest_log
+from stock_alerts import StockAlerts, install_low_stock_tracking, low_stock_items, set_threshold
+from variants import find_items, install_variants, item_filters, variant_context
+from admin import admin_required
+from catalog_import import CatalogImporter, CatalogImportError, detect_format, text_stream
+from embedding_queue import EmbeddingQueue, row_documents
+from project_rollup import (agency_rollup, install_project_rollups, item_usage, project_detail,
+                            project_summaries, status_rollup, structured_context)
+from startup import StartupTimer, run_cli
+from profiling import debug_bp, profiled
+from traffic import note, traced
+from ratelimit import rate_limited
+from memory_report import register_components
+
+# Routes live on a blueprint: at / when the app runs on its own, under /inventory in server.py
+TENANT = "inventory"
+bp = Blueprint(TENANT, __name__)
 
 # File paths for persistent storage
-db_path = "inventory.db"
+db_path = data_path(TENANT, "inventory.db")
+snapshot_path = data_path(TENANT, "inventory.hnsw")
 model_config_path = "./model.json"
 
 # Ensure the persistence directory exists
-persist_directory = "./chroma-inventory"
-os.makedirs(persist_directory, exist_ok=True)
+persist_directory = vector_directory("./chroma-inventory")
 
 def init_db():
     """Initialize SQLite database with initial data"""
@@ -43,15 +60,21 @@ def init_db():
                     nama TEXT,
                     status TEXT)''')
     
+    barang = [
+        ("Baut", 100000, "Tools", "10", 500),
+        ("Vanbelt Mobil", 180000, "Tools", "Innova Zenix", 20),
+        ("Hp Samsung", 50000, "Electronic", "A06", 15)
+    ]
     # Check if barang table is empty and insert initial data
     c.execute("SELECT COUNT(*) FROM barang")
     if c.fetchone()[0] == 0:
-        barang = [
-            ("Baut", 100000, "Tools", "10", 1),
-            ("Vanbelt Mobil", 180000, "Tools", "Innova Zenix", 1),
-            ("Hp Samsung", 50000, "Electronic", "A06", 1)
-        ]
         c.executemany("INSERT INTO barang (nama, harga, kategori, merk, stok) VALUES (?, ?, ?, ?, ?)", barang)
+    elif "stok_min" not in [row[1] for row in c.execute("PRAGMA table_info(barang)")]:
+        # Databases from before low-stock tracking used stok as an in-stock flag
+        # (1 or 0): the seeded items get the seed counts, once, before the
+        # thresholds and brand stock are set up from them
+        c.executemany("UPDATE barang SET stok = ? WHERE nama = ? AND stok = 1",
+                      [(row[4], row[0]) for row in barang])
     
     # Check if project table is empty and insert initial data
     c.execute("SELECT COUNT(*) FROM project")
@@ -83,6 +106,21 @@ def init_db():
         ]
         c.executemany("INSERT INTO project_barang (project_id, barang_id, jumlah) VALUES (?, ?, ?)", project_barang)
 
+    # Per-item low-stock thresholds and the log of threshold crossings
+    install_low_stock_tracking(conn)
+
+    # Per-project item counts and values, kept current by triggers
+    install_project_rollups(conn)
+
+    # Log name changes for the type-ahead index
+    install_suggest_log(conn, ["barang", "project", "instansi"])
+
+    # Brands as barang_varian rows with their own stock (migrated from barang.merk once)
+    install_variants(conn, "merk")
+
+    # Bump the catalog version on every change to the catalog tables
+    install_version_tracking(conn, ["barang", "project", "project_barang", "barang_varian"])
+
     conn.commit()
     conn.close()
 
@@ -113,28 +151,23 @@ def init_mapping_db():
     conn.commit()
     conn.close()
 
-# Ensure database is initialized before anything else
-init_db()
-init_mapping_db()
-
-def get_barang():
-    """Retrieve products from the database"""
+def get_barang(**filters):
+    """Retrieve products from the database, filtered as in variants.find_items"""
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT id, nama, harga, kategori, merk, stok FROM barang")
-    data = [{"id": row[0], "nama": row[1], "harga": row[2], "kategori": row[3], "merk": row[4].split(','), "stok": bool(row[5])} for row in c.fetchall()]
-    conn.close()
-    return data
+    try:
+        return find_items(conn, "merk", **filters)
+    finally:
+        conn.close()
 
-def get_project():
+def get_project(limit=None):
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    c.execute("SELECT kota, instansi, nama,status FROM project")
+    c.execute("SELECT kota, instansi, nama,status FROM project ORDER BY id LIMIT ?", (-1 if limit is None else limit,))
     data = {row[2]: [row[0],row[1],row[3]] for row in c.fetchall()}
     conn.close()
     return data
 
-def get_project_barang():
+def get_project_barang(limit=None):
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
     c.execute("""
@@ -142,7 +175,8 @@ def get_project_barang():
         FROM project_barang pb
         JOIN project p ON pb.project_id = p.id
         JOIN barang b ON pb.barang_id = b.id
-    """)
+        ORDER BY pb.id LIMIT ?
+    """, (-1 if limit is None else limit,))
     data = {}
     for row in c.fetchall():
         project_name, barang_name, jumlah = row
@@ -153,76 +187,6 @@ def get_project_barang():
     return data
 
 
-# Initialize or load the LLM
-if os.path.exists(model_config_path):
-    with open(model_config_path, "r") as f:
-        config = json.load(f)
-    llm = ChatOllama(**config)
-    print("Model initialized from configuration file.")
-else:
-    llm = ChatOllama(
-        model="hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest",
-        temperature=0,
-    )
-    config = {"model": "hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest", "temperature": 0}
-    with open(model_config_path, "w") as f:
-        json.dump(config, f)
-    print("Model initialized and configuration saved.")
-
-# Initialize the embeddings
-embeddings = FastEmbedEmbeddings(
-    model_name="intfloat/multilingual-e5-large"
-)
-
-# Initialize the vector store
-vector_store = Chroma(
-    collection_name="example_collection",
-    embedding_function=embeddings,
-    # persist_directory=persist_directory,
-)
-print("Vector store initialized.")
-
-# Retrieve current barang and project data
-barang = get_barang()
-project = get_project()
-project_barang = get_project_barang()
-project_barang_text = "\n".join([f"{k}: {', '.join(v)}" for k, v in project_barang.items()])
-
-# Membuat string daftar barang untuk dokumen
-barang_text = "\n".join([f"{item['nama']} (Kategori: {item['kategori']}, Harga: Rp{item['harga']}, "
-    f"merk: {', '.join(item['merk'])}, Stok: {'Tersedia' if item['stok'] else 'Habis'})"
-    for item in barang])
-project_text = ", ".join([f"{k.lower()} ({v})" for k, v in project.items()])
-
-
-
-
-# Membuat dokumen
-documents = [
-    Document(
-        page_content=f"Barang yang tersedia:\n{barang_text}.",
-        metadata={"source": "product_info"},
-    ),
-    Document(
-        page_content=f"Project: {project_text}.",
-        metadata={"source": "project_info"},
-    ),
-    Document(
-        page_content=f"Mapping barang ke proyek:\n{project_barang_text}",
-        metadata={"source": "project_barang_mapping"},
-    )
-]
-
-# Tambahkan dokumen ke vector store jika belum ada data
-if not os.listdir(persist_directory):
-    vector_store.add_documents(documents)
-    print("Documents added to vector store and persisted.")
-
-# Set up retriever
-retriever = vector_store.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 3}
-)
 
 # template = """You act as an assistant to inform
 # list of available items, prices, categories, sizes, stock status and shipping costs:
@@ -265,6 +229,9 @@ template ="""You act as an assistant to provide information
 List of available items, prices, categories, stock status, and project mapping:
 {context}
 
+Conversation so far (empty for a new conversation):
+{history}
+
 The user has provided the following information:
 {question}
 
@@ -278,20 +245,26 @@ If an item is mentioned, return stock availability.
 If size availability is requested, return "Item size available" otherwise, "Item size not available".
 """
 
-# Initialize the prompt template
-rag_prompt = PromptTemplate.from_template(template)
-
-# Function to format the documents into a string
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
-
-# Create the RAG chain
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough() }
-    | rag_prompt
-    | llm
-    | StrOutputParser()
-)
+# Facts from the project rollups and the variant indexes go in front of the retrieved documents
+def build_context(question):
+    conn = sqlite3.connect(db_path)
+    try:
+        facts = "\n".join(f for f in (structured_context(conn, question), variant_context(conn, question, "merk")) if f)
+    finally:
+        conn.close()
+    context = retrieval_cache.context(question)
+    return f"{facts}\n\n{context}" if facts else context
+
+def answer_question(question, session_id):
+    """The answer to a question, precomputed when it is a warm FAQ asked first in its session"""
+    history = memory.history(session_id)
+    # Warm answers were made without a conversation, so only a first question can use one
+    answer = None if history else faq_warmer.lookup(question)
+    if answer is None:
+        answer = rag_chain.invoke({"question": question, "history": history})
+    memory.append(session_id, question, answer)
+    note(answer=answer)
+    return answer
 
 # Function to calculate discount
 def apply_discount(total, item_count):
@@ -299,19 +272,157 @@ def apply_discount(total, item_count):
         return total * 0.9  # 10% discount for more than 3 items
     return total
 
-# Function for product search
+# Function for product search (the name filter runs in SQLite)
 def search_product(query):
-    products = get_barang()
-    result = [p for p in products if query.lower() in p["nama"].lower()]
-    return result
+    return get_barang(search=query)
 
-# Function to notify admin for low stock
+# Items below their own threshold (barang.stok_min), read through the partial index
 def check_low_stock():
-    low_stock_items = []
-    for item in get_barang():
-        if item['stok'] < 2:  # threshold for low stock
-            low_stock_items.append(item)
-    return low_stock_items
+    conn = sqlite3.connect(db_path)
+    try:
+        return low_stock_items(conn)
+    finally:
+        conn.close()
+
+def build_documents():
+    """The catalog as the documents indexed in the vector store"""
+    from langchain_core.documents import Document
+
+    # Retrieve current barang and project data; past CATALOG_DOC_ROWS rows are
+    # found through their own documents (embedding_queue.py)
+    barang = get_barang(limit=settings.CATALOG_DOC_ROWS)
+    project = get_project(limit=settings.CATALOG_DOC_ROWS)
+    project_barang = get_project_barang(limit=settings.CATALOG_DOC_ROWS)
+    project_barang_text = "\n".join([f"{k}: {', '.join(v)}" for k, v in project_barang.items()])
+
+    # Membuat string daftar barang untuk dokumen
+    barang_text = "\n".join([f"{item['nama']} (Kategori: {item['kategori']}, Harga: Rp{item['harga']}, "
+        f"merk: {', '.join(item['merk'])}, Stok: {'Tersedia (%d)' % item['stok'] if item['stok'] else 'Habis'})"
+        for item in barang])
+    project_text = ", ".join([f"{k.lower()} ({v})" for k, v in project.items()])
+
+    # Membuat dokumen
+    documents = [
+        Document(
+            page_content=f"Barang yang tersedia:\n{barang_text}.",
+            metadata={"source": "product_info"},
+        ),
+        Document(
+            page_content=f"Project: {project_text}.",
+            metadata={"source": "project_info"},
+        ),
+        Document(
+            page_content=f"Mapping barang ke proyek:\n{project_barang_text}",
+            metadata={"source": "project_barang_mapping"},
+        )
+    ]
+    return documents
+
+_ready = False
+
+def init():
+    """Open the database, load the models and build the chains, once
+
+    LangChain, Chroma and FastEmbed are imported here rather than at the
+    top, so importing the app stays cheap until it is served.
+    """
+    global _ready, llm, embeddings, catalog_watcher, retrieval_cache, faq_warmer, embedding_queue, suggest_index, scheduler, memory, rag_chain, stock_alerts
+    if _ready:
+        return
+    from embedding_service import get_embeddings
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableLambda
+
+    timer = StartupTimer(TENANT)
+    init_db()
+    init_mapping_db()
+    timer.lap("init_db")
+
+    # Initialize or load the LLM (one pool per model, shared by the tenants of a server)
+    llm = load_llm(model_config_path, {"model": "hf.co/ojisetyawan/gemma2-9b-cpt-sahabatai-v1-instruct-Q4_K_M-GGUF:latest", "temperature": 0})
+    timer.lap("llm")
+
+    # Initialize the embeddings (shared with the other apps through the embedding service)
+    embeddings = get_embeddings("intfloat/multilingual-e5-large")
+    timer.lap("embeddings")
+
+    # Initialize the vector store
+    vector_store = make_vector_store(
+        embeddings,
+        collection_name=collection_name(TENANT, "example_collection"),
+        # persist_directory=persist_directory,
+        snapshot_path=snapshot_path,
+    )
+    print("Vector store initialized.")
+
+    documents_version = get_catalog_version(db_path)
+    documents = build_documents()
+
+    # Tambahkan dokumen ke vector store jika belum ada data (snapshot HNSW yang basi dibangun ulang di background)
+    if sync_documents(vector_store, documents, documents_version, rows_fn=lambda: row_documents(db_path)):
+        print("Documents added to vector store and persisted.")
+    timer.lap("vector_store")
+
+    # Set up retriever
+    retriever = vector_store.as_retriever(
+        search_type="similarity",
+        search_kwargs={"k": 3}
+    )
+
+    # Initialize the prompt template
+    rag_prompt = PromptTemplate.from_template(load_prompt(TENANT, template))
+
+    # Catalog changes made by any worker or node reach the cache within milliseconds
+    catalog_watcher = CatalogWatcher(db_path, f"catalog:{TENANT}", bus=get_bus()).start()
+
+    # Retrieved context is reused until the catalog changes (stored in CACHE_BACKEND)
+    retrieval_cache = RetrievalCache(retriever, format_docs, catalog_watcher.current, version_ttl=0,
+                                     namespace=f"retrieval:{TENANT}")
+
+    # Rows changed by catalog imports are embedded in the background, and the
+    # aggregate documents rebuilt once the catalog moved on from documents_version
+    embedding_queue = EmbeddingQueue(db_path, vector_store, on_batch=retrieval_cache.clear,
+                                     documents_fn=build_documents, documents_version=documents_version).start()
+
+    # Type-ahead index over catalog names, kept current from suggest_log
+    suggest_index = SuggestIndex(db_path, ["barang", "project", "instansi"])
+
+    # Every generation waits for a slot in the priority scheduler (one per process)
+    scheduler = get_scheduler()
+
+    # Conversations keep their recent turns, older ones are summarized at batch priority
+    memory = ConversationMemory(db_path, summarize=llm_summarizer(scheduler, llm))
+
+    # Create the RAG chain (input: {"question": ..., "history": memory.history(session_id)})
+    rag_chain = (
+        {
+            "context": itemgetter("question") | RunnableLambda(build_context),
+            "question": itemgetter("question"),
+            "history": itemgetter("history"),
+        }
+        | rag_prompt
+        | scheduler.wrap(llm)
+        | StrOutputParser()
+    )
+    timer.lap("chains")
+
+    # Answers to the frequent questions are generated ahead of time while the LLM is idle
+    faq_warmer = FAQWarmer(db_path, lambda q: rag_chain.invoke({"question": q, "history": ""}), build_context,
+                           catalog_watcher.current, scheduler, namespace=f"faq:{TENANT}")
+    if settings.FAQ_WARMING:
+        faq_warmer.start()
+
+    # Admins are notified when an item goes low or is restocked (SSE and webhooks)
+    stock_alerts = StockAlerts(db_path).start()
+    timer.lap("background")
+
+    # Sizes and entry counts in /debug/memory
+    register_components(TENANT, vector_store=vector_store, retrieval_cache=retrieval_cache, faq=faq_warmer,
+                        suggest_index=suggest_index, memory=memory,
+                        embedding_queue=embedding_queue)
+    _ready = True
+
 
 # HTML template (updated with a search bar)
 HTML_TEMPLATE = """
@@ -344,7 +455,7 @@ HTML_TEMPLATE = """
                         <td>{{ item.kategori }}</td>
                         <td>Rp{{ item.harga }}</td>
                         <td>{{ ", ".join(item.merk) }}</td>
-                        <td>{{ "Available" if item.stok else "Out of Stock" }}</td>
+                        <td>{{ "Available (%d)" % item.stok if item.stok else "Out of Stock" }}</td>
                     </tr>
                 {% endfor %}
                 </tbody>
@@ -370,6 +481,9 @@ HTML_TEMPLATE = """
                 {% for project, items in project_barang.items() %}
                     <li class="list-group-item">
                         <strong>{{ project }}</strong>: {{ ", ".join(items) }}
+                        {% if project in project_totals %}
+                        <span class="badge bg-secondary">{{ project_totals[project].item_count }} pcs, Rp{{ "{:,}".format(project_totals[project].total_value) }}</span>
+                        {% endif %}
                     </li>
                 {% endfor %}
             </ul>
@@ -379,7 +493,7 @@ HTML_TEMPLATE = """
             <h2>Search Products</h2>
             <form method="POST" class="row g-3">
                 <div class="col-md-8">
-                    <input type="text" name="search_query" class="form-control" placeholder="Search by name" required>
+                    <input type="text" name="search_query" data-suggest="barang" class="form-control" placeholder="Search by name" required>
                 </div>
                 <div class="col-md-4">
                     <button type="submit" class="btn btn-primary w-100">Search</button>
@@ -392,7 +506,7 @@ HTML_TEMPLATE = """
             <p class="text-muted">Example: "Project apa yang running saat ini yang blm selesai ?"</p>
             <form method="POST" class="row g-3">
                 <div class="col-md-8">
-                    <input type="text" name="question" class="form-control" placeholder="Enter your question here" required>
+                    <input type="text" name="question" data-suggest="barang,project,instansi" class="form-control" placeholder="Enter your question here" required>
                 </div>
                 <div class="col-md-4">
                     <button type="submit" class="btn btn-success w-100">Ask</button>
@@ -420,15 +534,25 @@ HTML_TEMPLATE = """
     </div>
     
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js" integrity="sha384-YvpcrYf0tY3lHB60NNkmXc5s9fDVZLESaAA55NDzOxhy9GkcIdslK1eN7N6jIeHz" crossorigin="anonymous"></script>
+    {{ suggest_script | safe }}
 </body>
 </html>
 """
 
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
+@rate_limited("form")
+@profiled
+@traced("form")
 def home():
     answer = None
+    session_id = request.cookies.get("session_id") or uuid4().hex
     available_items = get_barang()
     project_list = get_project()
+    conn = sqlite3.connect(db_path)
+    try:
+        project_totals = {p["nama"]: p for p in project_summaries(conn)}
+    finally:
+        conn.close()
     search_results = []
 
     if request.method == "POST":
@@ -438,43 +562,185 @@ def home():
         
         question = request.form.get("question")
         if question:
-            # Retrieve documents
-            retrieved_docs = retriever.invoke({"input": question})
-            formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
-            
             # Get the answer from the chain
-            answer = rag_chain.invoke(question)
+            with use_priority("interactive"):
+                answer = answer_question(question, session_id)
     
-    return render_template_string(
+    response = make_response(render_template_string(
         HTML_TEMPLATE,
         available_items=available_items,
         project_list=project_list,
-        project_barang=project_barang,  # Tambahkan ke render
+        project_barang=get_project_barang(),
+        project_totals=project_totals,
         search_results=search_results,
-        answer=answer
-    )
+        answer=answer,
+        suggest_script=SUGGEST_SCRIPT
+    ))
+    response.set_cookie("session_id", session_id, httponly=True, samesite="Lax")
+    return response
 
 # Keep the favicon route
-@app.route('/favicon.ico')
+@bp.route('/favicon.ico')
 def favicon():
     return '', 204
 
 # Keep the /ask endpoint for API access
-@app.route("/ask", methods=["POST"])
+@bp.route("/ask", methods=["POST"])
+@rate_limited("ask")
+@profiled
+@traced("ask")
 def ask():
     try:
         data = request.get_json()
         question = data.get("question")
         if not question:
             return jsonify({"error": "Question field is required."}), 400
+        if not isinstance(question, str):
+            return jsonify({"error": "Question must be text."}), 400
 
-        retrieved_docs = retriever.invoke({"input": question})
-        formatted_context = format_docs(retrieved_docs) if retrieved_docs else "No relevant information found."
-        answer = rag_chain.invoke(question)
-        return jsonify({"question": question, "answer": answer})
+        session_id = data.get("session_id") or uuid4().hex
+        with use_priority("api"):
+            answer = answer_question(question, session_id)
+        return jsonify({"question": question, "answer": answer, "session_id": session_id})
 
+    except SchedulerTimeout as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _query(fn, *args):
+    conn = sqlite3.connect(db_path)
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+@bp.route("/projects")
+@rate_limited("page")
+def projects():
+    """Every project with its item count and Rp value"""
+    return jsonify(_query(project_summaries))
+
+@bp.route("/projects/by-agency")
+@rate_limited("page")
+def projects_by_agency():
+    return jsonify(_query(agency_rollup))
+
+@bp.route("/projects/by-status")
+@rate_limited("page")
+def projects_by_status():
+    return jsonify(_query(status_rollup))
+
+@bp.route("/projects/<project>")
+@rate_limited("page")
+def project_items(project):
+    """A project (id or name) with its bill of materials"""
+    detail = _query(project_detail, project)
+    if detail is None:
+        return jsonify({"error": "Project not found."}), 404
+    return jsonify(detail)
+
+@bp.route("/items")
+@rate_limited("page")
+def items():
+    """Items by brand, price range and stock: /items?merk=Samsung&max_harga=200000&in_stock=1"""
+    return jsonify(get_barang(**item_filters(request.args, "merk")))
+
+@bp.route("/items/<item>/projects")
+@rate_limited("page")
+def item_projects(item):
+    """The projects using an item (id or name)"""
+    usage = _query(item_usage, item)
+    if usage is None:
+        return jsonify({"error": "Item not found."}), 404
+    return jsonify(usage)
+
+@bp.route("/admin/low-stock")
+@admin_required
+def admin_low_stock():
+    return jsonify(check_low_stock())
+
+@bp.route("/admin/low-stock/stream")
+@admin_required
+def admin_low_stock_stream():
+    """Server-Sent Events with every item going low or being restocked"""
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    stream = stock_alerts.stream(int(last_event_id) if last_event_id.isdigit() else None)
+    return Response(stream_with_context(stream), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route("/admin/low-stock/<int:barang_id>/threshold", methods=["PUT"])
+@admin_required
+def admin_stock_threshold(barang_id):
+    stok_min = (request.get_json(silent=True) or {}).get("stok_min")
+    if not isinstance(stok_min, int) or stok_min < 0:
+        return jsonify({"error": "stok_min must be a non-negative integer."}), 400
+    conn = sqlite3.connect(db_path)
+    try:
+        found = set_threshold(conn, barang_id, stok_min)
+    finally:
+        conn.close()
+    if not found:
+        return jsonify({"error": "Item not found."}), 404
+    return jsonify({"id": barang_id, "stok_min": stok_min})
+
+@bp.route("/admin/import/<table>", methods=["POST"])
+@admin_required
+def admin_import(table):
+    """Upsert CSV or JSONL rows, sent as a "file" upload or as the request body"""
+    if table not in ("barang", "project", "project_barang", "barang_varian"):
+        return jsonify({"error": f"Cannot import into {table}."}), 404
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, fmt = upload.stream, detect_format(upload.filename or "")
+    else:
+        stream, fmt = request.stream, "jsonl" if "json" in request.mimetype else "csv"
+    try:
+        report = CatalogImporter(db_path).import_stream(table, text_stream(stream), request.args.get("format") or fmt)
+    except CatalogImportError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report)
+
+@bp.route("/suggest")
+@rate_limited("page")
+def suggest():
+    """Catalog names starting with q, for the type-ahead of the input fields"""
+    kinds = [k for k in request.args.get("kinds", "").split(",") if k]
+    limit = min(request.args.get("limit", 8, type=int), 20)
+    return jsonify(suggest_index.suggest(request.args.get("q", ""), limit=limit, kinds=kinds))
+
+@bp.route("/metrics")
+def metrics():
+    return jsonify({
+        "scheduler": scheduler.stats(),
+        "llm_backends": llm.stats(),
+        "embeddings": embeddings.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "catalog_watcher": catalog_watcher.stats(),
+        "faq": faq_warmer.stats(),
+        "memory": memory.stats(),
+        "suggest_index": suggest_index.stats(),
+        "stock_alerts": stock_alerts.stats(),
+        "embedding_queue": embedding_queue.stats(),
+    })
+
+_app = None
+
+def create_app():
+    """The app on its own, blueprint at /"""
+    global _app
+    if _app is None:
+        init()
+        _app = Flask(__name__)
+        _app.register_blueprint(bp)
+        _app.register_blueprint(debug_bp)
+    return _app
+
+def __getattr__(name):
+    # "run5-inventoryproject:app" (gunicorn, flask run) builds the app on first access
+    if name == "app":
+        return create_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5999)
\ No newline at end of file
+    run_cli(__file__, create_app, "Inventory and project assistant", debug=True, port=5999)
@@ -0,0 +1,94 @@
+"""One process serving the store, sales and inventory assistants
+
+    python server.py
+
+mounts chatbot.py at /store/, run4-penjualan-andorder.py at /sales/ and
+run5-inventoryproject.py at /inventory/ (``SERVER_TENANTS`` picks a subset).
+Each tenant keeps its routes, prompt template, database and vector
+collection; files go to ``TENANT_DATA_DIR/<tenant>/`` (``tenants/`` unless
+set). The embedding model, the Chroma client, one LLM pool per model and the
+priority scheduler are created once and shared by the tenants, so the three
+assistants need about the memory of one.
+"""
+import importlib
+
+from flask import Flask, jsonify, render_template_string
+
+import settings
+from startup import run_cli
+from profiling import debug_bp
+from memory_report import rss_bytes
+from tenants import components
+
+# Tenants sharing a process never share files
+settings.TENANT_DATA_DIR = settings.TENANT_DATA_DIR or "tenants"
+
+# Tenant -> module holding its blueprint
+TENANT_MODULES = {
+    "store": "chatbot",
+    "sales": "run4-penjualan-andorder",
+    "inventory": "run5-inventoryproject",
+}
+
+INDEX_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head><title>Assistants</title></head>
+<body style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px;">
+    <h1>Assistants</h1>
+    <ul>
+    {% for tenant in tenants %}
+        <li><a href="/{{ tenant }}/">{{ tenant }}</a></li>
+    {% endfor %}
+    </ul>
+</body>
+</html>
+"""
+
+
+def create_app(tenants=None):
+    """Flask app with the blueprint of every tenant under /<tenant>"""
+    app = Flask(__name__)
+    modules = {}
+    for tenant in tenants or settings.SERVER_TENANTS:
+        if tenant not in TENANT_MODULES:
+            raise ValueError(f"Unknown tenant '{tenant}', use one of {', '.join(TENANT_MODULES)}")
+        modules[tenant] = importlib.import_module(TENANT_MODULES[tenant])
+        modules[tenant].init()
+        app.register_blueprint(modules[tenant].bp, url_prefix=f"/{tenant}")
+    # Profiling covers the whole process, so it is mounted once at /debug
+    app.register_blueprint(debug_bp)
+
+    @app.route("/")
+    def index():
+        return render_template_string(INDEX_TEMPLATE, tenants=list(modules))
+
+    @app.route("/metrics")
+    def metrics():
+        """Process memory and the shared components; per-tenant metrics are at /<tenant>/metrics"""
+        shared = {name: component.stats() for name, component in components().items()}
+        first = next(iter(modules.values()), None)
+        if first is not None:
+            shared["embeddings"] = first.embeddings.stats()
+        return jsonify({"rss_bytes": rss_bytes(), "tenants": list(modules), "shared": shared})
+
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # "server:app" (gunicorn, flask run) builds the app on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    # No reloader: it would load the models a second time
+    run_cli(__file__, create_app, "Store, sales and inventory assistants in one process",
+            host="0.0.0.0", port=5000, threaded=True)
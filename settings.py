@@ -0,0 +1,181 @@
+"""Runtime settings shared by the assistant apps, read from the environment"""
+import os
+
+
+def env_int(name, default):
+    """Read an integer environment variable"""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name, default):
+    """Read a float environment variable"""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_list(name, default=()):
+    """Read a comma separated environment variable"""
+    value = os.environ.get(name)
+    if not value:
+        return list(default)
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+# LLM scheduler: how many generations may run against Ollama at once
+# (match OLLAMA_NUM_PARALLEL) and how many of them batch jobs may hold
+LLM_MAX_CONCURRENCY = env_int("LLM_MAX_CONCURRENCY", 2)
+LLM_BATCH_LIMIT = env_int("LLM_BATCH_LIMIT", 1)
+LLM_QUEUE_TIMEOUT = env_float("LLM_QUEUE_TIMEOUT", 120.0)
+
+# Ollama backends generations are spread over (OLLAMA_API_BASE_URL is the
+# single-backend variable docker-compose already sets)
+OLLAMA_BASE_URLS = env_list(
+    "OLLAMA_BASE_URLS",
+    [os.environ.get("OLLAMA_API_BASE_URL", "http://localhost:11434")],
+)
+OLLAMA_PROBE_INTERVAL = env_float("OLLAMA_PROBE_INTERVAL", 10.0)
+OLLAMA_FAILURE_THRESHOLD = env_int("OLLAMA_FAILURE_THRESHOLD", 3)
+OLLAMA_COOLDOWN = env_float("OLLAMA_COOLDOWN", 30.0)
+
+# Embedding service: collect concurrent embed calls for up to MAX_WAIT_MS and
+# run them as one batch; with EMBEDDING_SOCKET set, every worker talks to the
+# sidecar started with `python embedding_service.py` instead of loading the model
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
+EMBEDDING_SOCKET = os.environ.get("EMBEDDING_SOCKET", "")
+EMBEDDING_MAX_BATCH = env_int("EMBEDDING_MAX_BATCH", 64)
+EMBEDDING_MAX_WAIT_MS = env_float("EMBEDDING_MAX_WAIT_MS", 5.0)
+
+# Vector store backend: "chroma" or "flat" (exact NumPy search, see flat_store.py)
+# stored as float32, float16 or int8; quantized stores re-score the best
+# VECTOR_RESCORE * k candidates in float32 (0 disables re-scoring)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+VECTOR_DTYPE = os.environ.get("VECTOR_DTYPE", "float32")
+VECTOR_RESCORE = env_int("VECTOR_RESCORE", 4)
+
+# VECTOR_BACKEND=hnsw: graph parameters of the snapshot index (hnsw_index.py)
+HNSW_M = env_int("HNSW_M", 16)
+HNSW_EF_CONSTRUCTION = env_int("HNSW_EF_CONSTRUCTION", 100)
+HNSW_EF_SEARCH = env_int("HNSW_EF_SEARCH", 64)
+
+# Retrieval cache: entries kept, optional locality-sensitive hash of the query
+# vector (number of hyperplane bits, 0 = match on the normalized text only)
+# and how long a catalog version read is trusted before re-checking
+RETRIEVAL_CACHE_SIZE = env_int("RETRIEVAL_CACHE_SIZE", 1024)
+RETRIEVAL_CACHE_LSH_BITS = env_int("RETRIEVAL_CACHE_LSH_BITS", 0)
+CATALOG_VERSION_TTL = env_float("CATALOG_VERSION_TTL", 0.5)
+
+# Orders (run4): checkouts are queued to one writer thread that commits up to
+# ORDER_MAX_BATCH of them per transaction, waiting ORDER_MAX_WAIT_MS for more
+ORDER_MAX_BATCH = env_int("ORDER_MAX_BATCH", 64)
+ORDER_MAX_WAIT_MS = env_float("ORDER_MAX_WAIT_MS", 2.0)
+ORDER_TIMEOUT = env_float("ORDER_TIMEOUT", 10.0)
+
+# Low-stock alerts: default per-item threshold (barang.stok_min), how often
+# the change log is polled and the webhooks new alerts are POSTed to
+LOW_STOCK_THRESHOLD = env_int("LOW_STOCK_THRESHOLD", 2)
+STOCK_ALERT_POLL_INTERVAL = env_float("STOCK_ALERT_POLL_INTERVAL", 1.0)
+STOCK_ALERT_WEBHOOKS = env_list("STOCK_ALERT_WEBHOOKS")
+
+# Token required by the /admin and /debug endpoints (Authorization: Bearer
+# <token>); empty allows only direct requests from localhost
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Catalog import: rows per executemany/transaction, and how the background
+# embedding queue drains rows changed by imports
+IMPORT_CHUNK_SIZE = env_int("IMPORT_CHUNK_SIZE", 10000)
+EMBED_QUEUE_BATCH = env_int("EMBED_QUEUE_BATCH", 256)
+EMBED_QUEUE_POLL_INTERVAL = env_float("EMBED_QUEUE_POLL_INTERVAL", 2.0)
+# Rows of each table listed in the aggregate catalog documents (product list,
+# shipping rates, projects); the rest are retrieved by their own documents
+CATALOG_DOC_ROWS = env_int("CATALOG_DOC_ROWS", 500)
+
+# Conversation memory: recent turns kept verbatim in the prompt (estimated
+# tokens), and the size older turns are summarized into
+MEMORY_WINDOW_TOKENS = env_int("MEMORY_WINDOW_TOKENS", 800)
+MEMORY_SUMMARY_TOKENS = env_int("MEMORY_SUMMARY_TOKENS", 200)
+
+# Multi-tenant server (server.py): tenants mounted, where each tenant keeps
+# its database and snapshot (TENANT_DATA_DIR/<tenant>/; empty keeps the
+# files next to the apps, as when they run on their own) and where per-tenant
+# prompt overrides (<tenant>.txt) are looked up
+SERVER_TENANTS = env_list("SERVER_TENANTS", ["store", "sales", "inventory"])
+TENANT_DATA_DIR = os.environ.get("TENANT_DATA_DIR", "")
+PROMPT_DIR = os.environ.get("PROMPT_DIR", "prompts")
+
+# Structured answers: default answer format of the cart assistants ("text" or
+# "structured", /ask may ask for either) and the generated-token cap of a
+# structured answer
+ANSWER_FORMAT = os.environ.get("ANSWER_FORMAT", "text")
+STRUCTURED_NUM_PREDICT = env_int("STRUCTURED_NUM_PREDICT", 256)
+
+# Profiling hooks (profiling.py), off unless PROFILING=1: where per-request
+# cProfile dumps are stored and how many are kept, and the limits of the
+# /debug/profile stack sampler
+PROFILING = env_int("PROFILING", 0)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_KEEP = env_int("PROFILE_KEEP", 50)
+PROFILE_MAX_SECONDS = env_float("PROFILE_MAX_SECONDS", 60.0)
+PROFILE_SAMPLE_INTERVAL_MS = env_float("PROFILE_SAMPLE_INTERVAL_MS", 5.0)
+
+# Memory report (/debug/memory): objects walked per component before its
+# size is reported as truncated, and the traceback depth tracemalloc records
+MEMORY_REPORT_MAX_OBJECTS = env_int("MEMORY_REPORT_MAX_OBJECTS", 2000000)
+MEMORY_TRACE_FRAMES = env_int("MEMORY_TRACE_FRAMES", 1)
+
+# Traffic recorder (traffic.py): JSONL file every /ask and form question is
+# appended to with its stage timings (empty = off) and the share recorded
+TRAFFIC_LOG = os.environ.get("TRAFFIC_LOG", "")
+TRAFFIC_SAMPLE = env_float("TRAFFIC_SAMPLE", 1.0)
+
+# Cache backends (cache_backends.py): "memory" (per worker), "sqlite" (a file
+# shared by the workers of a host, CACHE_PATH) or "resp" (a Redis-protocol
+# server shared by every node, CACHE_URL); seconds a shared entry lives
+# (0 = until evicted), bytes of the SQLite file mapped into memory, and the
+# socket timeout of the Redis-protocol client
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_PATH = os.environ.get("CACHE_PATH", "cache.db")
+CACHE_URL = os.environ.get("CACHE_URL", "redis://127.0.0.1:6379/0")
+CACHE_TTL = env_int("CACHE_TTL", 3600)
+CACHE_MMAP_BYTES = env_int("CACHE_MMAP_BYTES", 256 * 2**20)
+CACHE_TIMEOUT = env_float("CACHE_TIMEOUT", 0.5)
+
+# Catalog-version broadcast (catalog_version.CatalogWatcher): how often each
+# worker polls its database for commits, and the Redis-protocol server
+# version bumps are published on to the other nodes (empty = this host only)
+CATALOG_WATCH_INTERVAL_MS = env_float("CATALOG_WATCH_INTERVAL_MS", 20.0)
+CATALOG_BUS_URL = os.environ.get("CATALOG_BUS_URL", "")
+
+# Per-client rate limits (ratelimit.py), off unless RATE_LIMIT=1: requests per
+# second and burst of the cheap endpoints (pages, search, carts) and of the
+# ones that run the LLM, clients tracked before the least recently seen are
+# evicted, and whether the client address is read from X-Forwarded-For
+# (behind a proxy every client has the proxy's address without it)
+RATE_LIMIT = env_int("RATE_LIMIT", 0)
+RATE_LIMIT_PAGE_RPS = env_float("RATE_LIMIT_PAGE_RPS", 10.0)
+RATE_LIMIT_PAGE_BURST = env_int("RATE_LIMIT_PAGE_BURST", 40)
+RATE_LIMIT_LLM_RPS = env_float("RATE_LIMIT_LLM_RPS", 0.2)
+RATE_LIMIT_LLM_BURST = env_int("RATE_LIMIT_LLM_BURST", 5)
+RATE_LIMIT_MAX_CLIENTS = env_int("RATE_LIMIT_MAX_CLIENTS", 100000)
+RATE_LIMIT_TRUST_PROXY = env_int("RATE_LIMIT_TRUST_PROXY", 0)
+# API keys that get budgets of their own (comma separated). Any other
+# X-API-Key is ignored, so made-up keys cannot multiply a client's budget
+RATE_LIMIT_API_KEYS = env_list("RATE_LIMIT_API_KEYS")
+
+# FAQ warming (faq_warmer.py), on unless FAQ_WARMING=0: canonical questions
+# answered ahead of time (shipping per city, then project status, then item
+# stock), seconds between checks for a catalog change, and seconds between
+# checks for an idle LLM scheduler before each generation
+FAQ_WARMING = env_int("FAQ_WARMING", 1)
+FAQ_MAX_QUESTIONS = env_int("FAQ_MAX_QUESTIONS", 200)
+FAQ_POLL_INTERVAL = env_float("FAQ_POLL_INTERVAL", 1.0)
+FAQ_IDLE_POLL = env_float("FAQ_IDLE_POLL", 0.5)
+
+# Question audit log (audit_log.py): database every traced question is
+# written to with its answer and timings (empty = off), records waiting
+# before new ones are dropped, records per transaction, and the longest a
+# record waits for its batch
+AUDIT_DB = os.environ.get("AUDIT_DB", "audit.db")
+AUDIT_QUEUE_SIZE = env_int("AUDIT_QUEUE_SIZE", 20000)
+AUDIT_BATCH = env_int("AUDIT_BATCH", 500)
+AUDIT_FLUSH_INTERVAL_MS = env_float("AUDIT_FLUSH_INTERVAL_MS", 250.0)
@@ -0,0 +1,117 @@
+"""Startup timing for the assistant apps
+
+The apps import LangChain, Chroma and FastEmbed and load their models in
+``init()``, not at import time, so a plain import (``--help``, a test, a
+page-only worker) stays cheap. ``--startup-report`` shows where a real
+start goes:
+
+    python run4-penjualan-andorder.py --startup-report
+
+It re-runs the import and ``create_app()`` in a child started with
+``python -X importtime``, then prints the slowest top-level imports and the
+initialization phases each app recorded with ``StartupTimer``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Timers of the apps initialized in this process
+TIMERS = []
+
+REPORT_MARKER = "STARTUP-REPORT "
+
+
+class StartupTimer:
+    """Records how long each initialization phase of an app took"""
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = []
+        self._mark = time.perf_counter()
+        TIMERS.append(self)
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, round(now - self._mark, 4)))
+        self._mark = now
+
+
+def parse_importtime(stderr):
+    """(module, self seconds, cumulative seconds, depth) from -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return entries
+
+
+def top_imports(entries, top=15):
+    """Slowest imports at the top level of the import tree, grouped by package"""
+    packages = {}
+    for name, _, cumulative, depth in entries:
+        if depth == 0:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + cumulative
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def startup_report(module_name, top=15, cwd=None):
+    """Import module_name and run its create_app() under -X importtime in a child process"""
+    code = (
+        "import importlib, json, time\n"
+        "start = time.perf_counter()\n"
+        f"module = importlib.import_module({module_name!r})\n"
+        "imported = time.perf_counter() - start\n"
+        "module.create_app()\n"
+        "import startup\n"
+        "print(startup.REPORT_MARKER + json.dumps({'import_seconds': imported, "
+        "'total_seconds': time.perf_counter() - start, "
+        "'phases': {t.name: t.phases for t in startup.TIMERS}}))\n"
+    )
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, capture_output=True, text=True)
+    marker = [line for line in proc.stdout.splitlines() if line.startswith(REPORT_MARKER)]
+    if proc.returncode != 0 or not marker:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"{module_name} failed to start:\n" + "\n".join(errors[-20:]))
+    report = json.loads(marker[-1][len(REPORT_MARKER):])
+    entries = parse_importtime(proc.stderr)
+    report["import_total_seconds"] = round(sum(e[2] for e in entries if e[3] == 0), 4)
+    report["slowest_imports"] = top_imports(entries, top)
+    return report
+
+
+def print_report(module_name, report):
+    print(f"Startup of {module_name}: {report['total_seconds']:.2f} s "
+          f"(module import {report['import_seconds']:.3f} s, all imports {report['import_total_seconds']:.2f} s)")
+    print("\nSlowest imports (cumulative):")
+    for package, seconds in report["slowest_imports"]:
+        print(f"  {seconds:8.3f} s  {package}")
+    for name, phases in report["phases"].items():
+        print(f"\nInitialization of {name}:")
+        for phase, seconds in phases:
+            print(f"  {seconds:8.3f} s  {phase}")
+
+
+def run_cli(module_file, create_app, description, **run_kwargs):
+    """Command line of an app: serve it, or print its startup report"""
+    module_name = os.path.splitext(os.path.basename(module_file))[0]
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--startup-report", action="store_true",
+                        help="time imports (python -X importtime) and initialization, then exit")
+    parser.add_argument("--top", type=int, default=15, help="imports listed by --startup-report")
+    args = parser.parse_args()
+    if args.startup_report:
+        print_report(module_name, startup_report(module_name, args.top))
+        return
+    create_app().run(**run_kwargs)
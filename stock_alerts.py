@@ -0,0 +1,196 @@
+"""Incremental low-stock tracking with push notifications
+
+Each item has its own threshold (``barang.stok_min``). An item is low on
+stock while ``stok < stok_min``; a partial index over exactly those rows
+keeps the low-stock set readable without scanning the catalog. Triggers
+append a row to ``stock_events`` only when an item crosses its threshold
+(goes low or is restocked), so alerting costs one row per transition.
+
+``StockAlerts`` follows ``stock_events`` from a background thread, using
+``PRAGMA data_version`` to skip the query while nothing was committed, and
+fans new events out to Server-Sent Events subscribers and webhooks.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import urllib.request
+
+import settings
+
+# Seconds between SSE keep-alive comments
+KEEPALIVE = 15
+
+
+def install_low_stock_tracking(conn, default_threshold=None):
+    """Add barang.stok_min, the low-stock partial index, stock_events and its triggers"""
+    threshold = settings.LOW_STOCK_THRESHOLD if default_threshold is None else default_threshold
+    c = conn.cursor()
+    columns = [row[1] for row in c.execute("PRAGMA table_info(barang)")]
+    if "stok_min" not in columns:
+        c.execute(f"ALTER TABLE barang ADD COLUMN stok_min INTEGER NOT NULL DEFAULT {int(threshold)}")
+    c.execute("CREATE INDEX IF NOT EXISTS barang_low_stock ON barang (id) WHERE stok < stok_min")
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    barang_id INTEGER,
+                    nama TEXT,
+                    stok INTEGER,
+                    stok_min INTEGER,
+                    kind TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS barang_stock_crossing
+                 AFTER UPDATE OF stok, stok_min ON barang
+                 WHEN (OLD.stok < OLD.stok_min) != (NEW.stok < NEW.stok_min)
+                 BEGIN
+                     INSERT INTO stock_events (barang_id, nama, stok, stok_min, kind)
+                     VALUES (NEW.id, NEW.nama, NEW.stok, NEW.stok_min,
+                             CASE WHEN NEW.stok < NEW.stok_min THEN 'low' ELSE 'restocked' END);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS barang_stock_insert
+                 AFTER INSERT ON barang
+                 WHEN NEW.stok < NEW.stok_min
+                 BEGIN
+                     INSERT INTO stock_events (barang_id, nama, stok, stok_min, kind)
+                     VALUES (NEW.id, NEW.nama, NEW.stok, NEW.stok_min, 'low');
+                 END''')
+
+
+def low_stock_items(conn):
+    """Items below their threshold, read through the partial index"""
+    rows = conn.execute(
+        "SELECT id, nama, stok, stok_min FROM barang INDEXED BY barang_low_stock WHERE stok < stok_min"
+    ).fetchall()
+    return [{"id": r[0], "nama": r[1], "stok": r[2], "stok_min": r[3]} for r in rows]
+
+
+def set_threshold(conn, barang_id, stok_min):
+    """Change the threshold of one item; True when the item exists"""
+    cur = conn.execute("UPDATE barang SET stok_min = ? WHERE id = ?", (stok_min, barang_id))
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def _event(row):
+    return {"id": row[0], "barang_id": row[1], "nama": row[2], "stok": row[3],
+            "stok_min": row[4], "kind": row[5], "created_at": row[6]}
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: stock\ndata: {json.dumps(event)}\n\n"
+
+
+class StockAlerts:
+    """Follows stock_events and pushes new events to subscribers and webhooks"""
+
+    def __init__(self, db_path, poll_interval=None, webhooks=None):
+        self.db_path = db_path
+        self.poll_interval = poll_interval or settings.STOCK_ALERT_POLL_INTERVAL
+        self.webhooks = list(settings.STOCK_ALERT_WEBHOOKS if webhooks is None else webhooks)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_id = 0
+        self.events = 0
+        self.webhook_errors = 0
+
+    def _query(self, conn, after, limit=1000):
+        rows = conn.execute(
+            "SELECT id, barang_id, nama, stok, stok_min, kind, created_at FROM stock_events "
+            "WHERE id > ? ORDER BY id LIMIT ?", (after, limit)
+        ).fetchall()
+        return [_event(row) for row in rows]
+
+    def events_since(self, after):
+        """Stored events after an event id, for clients catching up"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return self._query(conn, after)
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._thread is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # Only events from now on are pushed; older ones stay queryable
+            self.last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_events").fetchone()[0]
+            self._thread = threading.Thread(target=self._follow, args=(conn,), name="stock-alerts", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _follow(self, conn):
+        data_version = None
+        while not self._stop.wait(self.poll_interval):
+            # data_version changes whenever another connection commits
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == data_version:
+                continue
+            data_version = version
+            events = self._query(conn, self.last_id)
+            while events:
+                self.last_id = events[-1]["id"]
+                self.publish(events)
+                events = self._query(conn, self.last_id)
+
+    def publish(self, events):
+        self.events += len(events)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            for event in events:
+                subscriber.put(event)
+        if self.webhooks:
+            threading.Thread(target=self._post, args=(events,), daemon=True).start()
+
+    def _post(self, events):
+        body = json.dumps({"events": events}).encode()
+        for url in self.webhooks:
+            request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError:
+                self.webhook_errors += 1
+
+    def subscribe(self):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self, last_event_id=None):
+        """Server-Sent Events: missed events after last_event_id, then live ones"""
+        subscriber = self.subscribe()
+        try:
+            sent = 0
+            if last_event_id:
+                for event in self.events_since(int(last_event_id)):
+                    sent = event["id"]
+                    yield format_sse(event)
+            while True:
+                try:
+                    event = subscriber.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["id"] > sent:
+                    yield format_sse(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            "last_event_id": self.last_id,
+            "events": self.events,
+            "subscribers": subscribers,
+            "webhooks": len(self.webhooks),
+            "webhook_errors": self.webhook_errors,
+        }
@@ -0,0 +1,132 @@
+"""Structured answers for the shopping-cart assistants
+
+In structured mode the model returns one compact JSON object (the items
+with their quantity and size, and the shipping city) instead of the
+multi-line text the prompt templates ask for. Ollama
+constrains decoding to JSON: to ``CART_SCHEMA`` when the installed
+langchain-ollama passes JSON schemas through (0.2.1+, Ollama 0.5+), to any
+JSON object otherwise, with the shape spelled out in the prompt. A
+``num_predict`` cap and stop sequences bound the generation.
+
+The model only says what the customer asked for. ``price_cart`` prices it
+with ``orders.quote_cart`` (prices, stock, shipping and discount from the
+database, the same way /checkout charges) and renders the quote as the
+usual human-readable lines.
+"""
+import json
+from functools import lru_cache
+
+import settings
+from catalog_names import rp
+from orders import OrderError, quote_cart, render_quote, shipping_rate
+
+CART_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "qty": {"type": "integer"},
+                    "size": {"type": "string"},
+                },
+                "required": ["name", "qty"],
+            },
+        },
+        "city": {"type": "string"},
+    },
+    "required": ["items", "city"],
+}
+
+# A finished object is followed by nothing; these end a run-on generation early
+STOP = ["\n\n\n", "```"]
+
+STRUCTURED_TEMPLATE = """You read shopping carts. Available items, sizes and shipping cities:
+{context}
+
+Conversation so far (empty for a new conversation):
+{history}
+
+Customer: {question}
+
+Reply with one JSON object and nothing else:
+{{"items": [{{"name": "...", "qty": 1, "size": "..."}}], "city": "..."}}
+Use the item names as listed. Use "size": "" when no size is given and "city": "" when no city is given.
+Prices, stock and shipping costs are filled in by the shop.
+"""
+
+
+class StructuredOutputError(ValueError):
+    """Raised when the model output is not a cart object"""
+
+
+@lru_cache(maxsize=1)
+def output_format():
+    """CART_SCHEMA when ChatOllama accepts JSON schemas, else plain JSON mode"""
+    from langchain_ollama import ChatOllama
+
+    try:
+        ChatOllama(model="probe", format=CART_SCHEMA)
+    except (TypeError, ValueError):
+        return "json"
+    return CART_SCHEMA
+
+
+def model_kwargs():
+    """ChatOllama fields for a structured generation"""
+    return {"format": output_format(), "num_predict": settings.STRUCTURED_NUM_PREDICT, "stop": STOP}
+
+
+def _int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise StructuredOutputError(f"expected a number, got {value!r}")
+    try:
+        return int(float(str(value).replace(",", "")))
+    except ValueError:
+        raise StructuredOutputError(f"expected a number, got {value!r}")
+
+
+def parse_cart(text):
+    """The cart the model read from the question, as quote_cart input: {"items", "kota"}
+
+    Anything but item names, quantities, sizes and the city is ignored.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise StructuredOutputError(f"The model did not return JSON ({e}), raise STRUCTURED_NUM_PREDICT if it was cut off")
+    if not isinstance(data, dict):
+        raise StructuredOutputError("The model did not return a JSON object")
+    items = []
+    for item in data.get("items") or []:
+        if not isinstance(item, dict) or not item.get("name"):
+            continue
+        line = {"nama": str(item["name"]), "qty": _int(item.get("qty", 1))}
+        if item.get("size"):
+            line["ukuran"] = str(item["size"])
+        items.append(line)
+    return {"items": items, "kota": str(data.get("city") or "") or None}
+
+
+def price_cart(conn, cart, discount=True):
+    """(quote, answer) for a parsed cart, priced by quote_cart
+
+    The quote is None when the cart names no items (the answer then gives
+    the shipping cost, if a city was named) or cannot be priced (the answer
+    says why).
+    """
+    if not cart["items"]:
+        if cart["kota"] is None:
+            return None, "No items or destination found in the question."
+        try:
+            kota, biaya = shipping_rate(conn, cart["kota"])
+        except OrderError as e:
+            return None, str(e)
+        return None, f"Shipping Cost: {rp(biaya)} (destination: {kota})"
+    try:
+        quote = quote_cart(conn, cart["items"], cart["kota"], discount=discount)
+    except OrderError as e:
+        return None, str(e)
+    return quote, render_quote(quote, city=cart["kota"] is not None)
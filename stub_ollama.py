@@ -0,0 +1,137 @@
+"""Stand-in Ollama server for local load, failover and replay testing
+
+Emulates the endpoints the apps use (``/api/chat``, ``/api/generate``,
+``/api/tags``, ``/api/ps``, ``/api/version``) without loading a model:
+answers are canned tokens emitted with a configurable per-token latency.
+
+    python stub_ollama.py --port 11501 --model modellexnew:latest --token-latency 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "Shipping Fee: Rp20000 (destination: Jakarta)"
+
+
+class StubOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, model, token_latency=0.0, first_token_latency=0.0,
+                 fail_rate=0.0, loaded=True, answer=DEFAULT_ANSWER):
+        super().__init__(address, StubHandler)
+        self.model = model
+        self.token_latency = token_latency
+        self.first_token_latency = first_token_latency
+        self.fail_rate = fail_rate
+        self.loaded = loaded
+        self.answer = answer
+        self.requests = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        model = {"name": self.server.model, "model": self.server.model}
+        if self.path == "/api/tags":
+            self._json({"models": [model]})
+        elif self.path == "/api/ps":
+            self._json({"models": [model] if self.server.loaded else []})
+        elif self.path == "/api/version":
+            self._json({"version": "0.0.0-stub"})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._json({"error": "not found"}, 404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests += 1
+        if random.random() < self.server.fail_rate:
+            self._json({"error": "stub failure"}, 500)
+            return
+        # Loading the model on the first request, like a real server
+        self.server.loaded = True
+        chat = self.path == "/api/chat"
+        tokens = self.server.answer.split(" ")
+        started = time.perf_counter_ns()
+        time.sleep(self.server.first_token_latency)
+
+        def chunk(text, done):
+            payload = {
+                "model": request.get("model", self.server.model),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": done,
+            }
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update({
+                    "done_reason": "stop",
+                    "total_duration": time.perf_counter_ns() - started,
+                    "prompt_eval_count": len(json.dumps(request)) // 4,
+                    "eval_count": len(tokens),
+                })
+            return payload
+
+        if not request.get("stream", True):
+            time.sleep(self.server.token_latency * len(tokens))
+            self._json(chunk(self.server.answer, True))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.server.token_latency)
+            text = token if i == 0 else " " + token
+            self.wfile.write(json.dumps(chunk(text, False)).encode() + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps(chunk("", True)).encode() + b"\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--model", default="modellexnew:latest")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between tokens")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    args = parser.parse_args()
+    server = StubOllama((args.host, args.port), args.model, args.token_latency,
+                        args.first_token_latency, args.fail_rate, answer=args.answer)
+    print(f"Stub Ollama serving {args.model} on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
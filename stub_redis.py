@@ -0,0 +1,177 @@
+"""Stand-in Redis server for local cache and invalidation testing
+
+Speaks enough of the Redis protocol (RESP2) for cache_backends.py: PING,
+GET, SET (EX/PX/NX), DEL, EXISTS, INCR, SCAN, DBSIZE, FLUSHDB, SELECT,
+AUTH, PUBLISH, SUBSCRIBE and QUIT. Everything is kept in memory; expired
+keys are dropped when they are read.
+
+    python stub_redis.py --port 6390
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class StubRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, StubRedisHandler)
+        self.data = {}
+        self.expires = {}
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+
+def encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class StubRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def send(self, value):
+        self.wfile.write(encode(value))
+
+    def handle(self):
+        server = self.server
+        while True:
+            args = self.read_command()
+            if not args:
+                return
+            name, args = args[0].decode().upper(), args[1:]
+            server.commands += 1
+            if name == "QUIT":
+                self.send("OK")
+                return
+            if name == "SUBSCRIBE":
+                self.subscribe(args)
+                return
+            try:
+                with server.lock:
+                    reply = self.execute(name, args)
+            except (ValueError, IndexError) as e:
+                reply = e
+            self.send(reply)
+
+    def execute(self, name, args):
+        server = self.server
+        if name == "PING":
+            return "PONG"
+        if name in ("SELECT", "AUTH"):
+            return "OK"
+        if name == "GET":
+            return server.data[args[0]] if server.alive(args[0]) else None
+        if name == "SET":
+            key, value, options = args[0], args[1], [a.decode().upper() for a in args[2:]]
+            if "NX" in options and server.alive(key):
+                return None
+            server.data[key] = value
+            server.expires.pop(key, None)
+            for unit, scale in (("EX", 1.0), ("PX", 0.001)):
+                if unit in options:
+                    server.expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+            return "OK"
+        if name == "INCR":
+            value = int(server.data[args[0]]) + 1 if server.alive(args[0]) else 1
+            server.data[args[0]] = str(value).encode()
+            return value
+        if name in ("DEL", "EXISTS"):
+            found = [key for key in args if server.alive(key)]
+            if name == "DEL":
+                for key in found:
+                    server.data.pop(key, None)
+                    server.expires.pop(key, None)
+            return len(found)
+        if name == "SCAN":
+            # The whole keyspace in one step: cursor 0 back right away
+            options = [a.decode() for a in args[1:]]
+            pattern = options[options.index("MATCH") + 1] if "MATCH" in options else "*"
+            keys = [key for key in list(server.data) if server.alive(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+            return [b"0", keys]
+        if name == "DBSIZE":
+            return sum(1 for key in list(server.data) if server.alive(key))
+        if name == "FLUSHDB":
+            server.data.clear()
+            server.expires.clear()
+            return "OK"
+        if name == "PUBLISH":
+            subscribers = list(server.subscribers.get(args[0], ()))
+            message = encode([b"message", args[0], args[1]])
+            for subscriber in subscribers:
+                try:
+                    subscriber.wfile.write(message)
+                except OSError:
+                    server.subscribers[args[0]].discard(subscriber)
+            return len(subscribers)
+        return ValueError(f"unknown command '{name}'")
+
+    def subscribe(self, channels):
+        server = self.server
+        with server.lock:
+            for i, channel in enumerate(channels, 1):
+                server.subscribers.setdefault(channel, set()).add(self)
+                self.send([b"subscribe", channel, i])
+        try:
+            # Only QUIT or a closed connection ends a subscription here
+            while self.read_command() not in (None, [b"QUIT"]):
+                pass
+        finally:
+            with server.lock:
+                for channel in channels:
+                    server.subscribers.get(channel, set()).discard(self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = StubRedis((args.host, args.port))
+    print(f"Stub Redis serving on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
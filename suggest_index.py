@@ -0,0 +1,226 @@
+"""Type-ahead suggestions for catalog names
+
+``SuggestIndex`` keeps every product name, city, project name and agency in
+one sorted array of accent- and case-folded keys. A prefix lookup is a
+binary search plus a short scan, a few microseconds; names also match on
+the start of any of their words ("sams" finds "Hp Samsung").
+
+Triggers append name changes to ``suggest_log``; the index applies new log
+rows when the database changed (``PRAGMA data_version``), so keeping it
+current costs O(changes). A process that fell behind a pruned log, or has a
+large backlog, rebuilds from the tables instead.
+"""
+import bisect
+import sqlite3
+import threading
+import time
+
+import settings
+from retrieval_cache import normalize_question as fold
+
+# Suggestion kind -> (table, column)
+SOURCES = {
+    "barang": ("barang", "nama"),
+    "kota": ("ongkir", "kota"),
+    "project": ("project", "nama"),
+    "instansi": ("project", "instansi"),
+}
+
+# Log rows applied one by one; a bigger backlog is cheaper to rebuild
+REBUILD_THRESHOLD = 50000
+
+# Log rows kept behind the newest one for processes that are catching up
+LOG_RETENTION = 100000
+
+SUGGEST_SCRIPT = """
+<script>
+// Suggest catalog names for the word being typed (inputs with data-suggest)
+document.querySelectorAll("input[data-suggest]").forEach(function (input) {
+    var list = document.createElement("datalist");
+    list.id = input.name + "-suggestions";
+    input.setAttribute("list", list.id);
+    input.setAttribute("autocomplete", "off");
+    input.after(list);
+    var timer = null;
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            var words = input.value.split(" ");
+            var term = words.pop();
+            var head = words.length ? words.join(" ") + " " : "";
+            if (term.length < 2) { list.innerHTML = ""; return; }
+            // Relative, so it reaches the tenant's /suggest when mounted under a prefix
+            var url = "suggest?q=" + encodeURIComponent(term) + "&kinds=" + input.dataset.suggest;
+            fetch(url).then(function (r) { return r.json(); }).then(function (items) {
+                list.innerHTML = "";
+                items.forEach(function (item) {
+                    var option = document.createElement("option");
+                    option.value = head + item.label;
+                    option.label = item.kind;
+                    list.appendChild(option);
+                });
+            });
+        }, 80);
+    });
+});
+</script>
+"""
+
+
+def install_suggest_log(conn, kinds):
+    """Create suggest_log and the triggers recording name changes for the given kinds"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS suggest_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT,
+                    old_label TEXT,
+                    new_label TEXT)''')
+    for kind in kinds:
+        table, column = SOURCES[kind]
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{column}_suggest_insert
+                      AFTER INSERT ON {table}
+                      BEGIN INSERT INTO suggest_log (kind, old_label, new_label)
+                            VALUES ('{kind}', NULL, NEW.{column}); END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{column}_suggest_delete
+                      AFTER DELETE ON {table}
+                      BEGIN INSERT INTO suggest_log (kind, old_label, new_label)
+                            VALUES ('{kind}', OLD.{column}, NULL); END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{column}_suggest_update
+                      AFTER UPDATE OF {column} ON {table}
+                      WHEN OLD.{column} IS NOT NEW.{column}
+                      BEGIN INSERT INTO suggest_log (kind, old_label, new_label)
+                            VALUES ('{kind}', OLD.{column}, NEW.{column}); END''')
+
+
+class SuggestIndex:
+    """Sorted-array prefix index over catalog names"""
+
+    def __init__(self, db_path, kinds, refresh_interval=None):
+        self.db_path = db_path
+        self.kinds = list(kinds)
+        self.refresh_interval = settings.CATALOG_VERSION_TTL if refresh_interval is None else refresh_interval
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Sorted (folded key, kind, label, word position) entries, one per word of a label
+        self._entries = []
+        # (kind, label) -> number of rows carrying it (agencies repeat)
+        self._counts = {}
+        self._last_id = 0
+        self._data_version = None
+        self._checked = 0.0
+        self.rebuilds = 0
+        self.applied = 0
+        self.rebuild()
+
+    @staticmethod
+    def _entries_for(kind, label):
+        words = fold(label).split()
+        return [(" ".join(words[i:]), kind, label, i) for i in range(len(words))]
+
+    def rebuild(self):
+        """Reload every label from the catalog tables"""
+        with self._lock:
+            self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM suggest_log").fetchone()[0]
+            counts = {}
+            for kind in self.kinds:
+                table, column = SOURCES[kind]
+                for (label,) in self._conn.execute(f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL"):
+                    counts[(kind, label)] = counts.get((kind, label), 0) + 1
+            self._entries = sorted(
+                entry for (kind, label) in counts for entry in self._entries_for(kind, label)
+            )
+            self._counts = counts
+            self.rebuilds += 1
+        self.prune_log()
+
+    def _add(self, kind, label):
+        count = self._counts.get((kind, label), 0)
+        self._counts[(kind, label)] = count + 1
+        if count == 0:
+            for entry in self._entries_for(kind, label):
+                bisect.insort(self._entries, entry)
+
+    def _remove(self, kind, label):
+        count = self._counts.get((kind, label), 0)
+        if count > 1:
+            self._counts[(kind, label)] = count - 1
+            return
+        self._counts.pop((kind, label), None)
+        for entry in self._entries_for(kind, label):
+            i = bisect.bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def refresh(self):
+        """Apply catalog changes logged since the last refresh"""
+        # One refresh at a time; concurrent callers keep using the current entries
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        first, last = self._conn.execute("SELECT MIN(id), MAX(id) FROM suggest_log").fetchone()
+        if last is None or last <= self._last_id:
+            return
+        if (first is not None and first > self._last_id + 1) or last - self._last_id > REBUILD_THRESHOLD:
+            self.rebuild()
+            return
+        rows = self._conn.execute(
+            "SELECT id, kind, old_label, new_label FROM suggest_log WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        with self._lock:
+            for _, kind, old, new in rows:
+                if kind not in self.kinds:
+                    continue
+                if old is not None:
+                    self._remove(kind, old)
+                if new is not None:
+                    self._add(kind, new)
+            self._last_id = rows[-1][0]
+            self.applied += len(rows)
+
+    def prune_log(self):
+        """Drop log rows far behind the newest one"""
+        self._conn.execute("DELETE FROM suggest_log WHERE id <= (SELECT MAX(id) FROM suggest_log) - ?", (LOG_RETENTION,))
+        self._conn.commit()
+
+    def suggest(self, query, limit=8, kinds=None):
+        """Labels with a word starting with the query, shortest first"""
+        now = time.monotonic()
+        if now - self._checked >= self.refresh_interval:
+            self._checked = now
+            self.refresh()
+        prefix = fold(query)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        with self._lock:
+            i = bisect.bisect_left(self._entries, (prefix,))
+            # Scan a bounded window; exact kinds filtering may skip some entries
+            for key, kind, label, position in self._entries[i:i + limit * 8]:
+                if not key.startswith(prefix):
+                    break
+                if (kinds and kind not in kinds) or (kind, label) in seen:
+                    continue
+                seen.add((kind, label))
+                results.append((position, len(label), label, kind))
+        # Matches on the first word first, then shorter names
+        results.sort()
+        return [{"label": label, "kind": kind} for _, _, label, kind in results[:limit]]
+
+    def stats(self):
+        return {
+            "labels": len(self._counts),
+            "entries": len(self._entries),
+            "rebuilds": self.rebuilds,
+            "applied_changes": self.applied,
+            "last_log_id": self._last_id,
+        }
@@ -0,0 +1,88 @@
+"""Components shared by the assistant apps running in one process
+
+``server.py`` mounts chatbot.py, run4 and run5 as tenants of one Flask
+process. Each app asks this module for its LLM pool and scheduler, so the
+tenants share one ``OllamaPool`` per model and one ``LLMScheduler`` (the
+embedding model is already shared through ``get_embeddings`` and Chroma
+shares one client per directory). Files and collections are namespaced
+per tenant when ``TENANT_DATA_DIR`` is set; on their own the apps keep
+their usual paths.
+"""
+import json
+import os
+import threading
+
+import settings
+from llm_scheduler import LLMScheduler
+from ollama_pool import OllamaPool
+
+_components = {}
+_lock = threading.Lock()
+
+
+def shared(name, factory):
+    """The process-wide component registered under name, created on first use"""
+    with _lock:
+        if name not in _components:
+            _components[name] = factory()
+        return _components[name]
+
+
+def components():
+    with _lock:
+        return dict(_components)
+
+
+def load_llm(config_path, default_config):
+    """The OllamaPool for a model config file, one per distinct config"""
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        print("Model initialized from configuration file.")
+    else:
+        config = dict(default_config)
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        print("Model initialized and configuration saved.")
+    key = "llm:" + json.dumps(config, sort_keys=True)
+    return shared(key, lambda: OllamaPool(config=config).start())
+
+
+def get_scheduler():
+    """The LLMScheduler every tenant's generations queue in"""
+    return shared("scheduler", LLMScheduler)
+
+
+def data_path(tenant, filename):
+    """Where a tenant keeps a database or snapshot file"""
+    if not settings.TENANT_DATA_DIR:
+        return filename
+    directory = os.path.join(settings.TENANT_DATA_DIR, tenant)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(filename))
+
+
+def vector_directory(default):
+    """Chroma directory; the tenants share one (and one client) under TENANT_DATA_DIR"""
+    directory = os.path.join(settings.TENANT_DATA_DIR, "chroma") if settings.TENANT_DATA_DIR else default
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def collection_name(tenant, name):
+    """Vector collection of a tenant, prefixed when the tenants share a directory"""
+    return f"{tenant}_{name}" if settings.TENANT_DATA_DIR else name
+
+
+def load_prompt(tenant, default):
+    """The tenant's prompt template: PROMPT_DIR/<tenant>.txt when present, else default"""
+    path = os.path.join(settings.PROMPT_DIR, f"{tenant}.txt")
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        template = f.read()
+    missing = [name for name in ("{context}", "{question}") if name not in template]
+    if missing:
+        raise ValueError(f"{path} must contain {' and '.join(missing)}")
+    return template
+
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orders import init_order_tables  # noqa: E402
+from stock_alerts import install_low_stock_tracking  # noqa: E402
+from variants import install_variants  # noqa: E402
+
+BARANG = [
+    ("Baju Kemeja", 100000, "Pakaian", "S,M,L,XL", 50),
+    ("Celana Cino", 180000, "Pakaian", "M,L,XL", 30),
+    ("Topi Kinz", 50000, "Aksesoris", "All Size", 0),
+]
+ONGKIR = [("Jakarta", 20000), ("Bandung", 15000), ("Surabaya", 25000), ("Luar Kota", 45000)]
+
+
+@pytest.fixture
+def store_db(tmp_path):
+    """A store.db with the run4 schema and seed data; the path"""
+    path = str(tmp_path / "store.db")
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE barang (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        nama TEXT, harga INTEGER, kategori TEXT, ukuran TEXT, stok INTEGER)''')
+    conn.execute("CREATE TABLE ongkir (id INTEGER PRIMARY KEY AUTOINCREMENT, kota TEXT, biaya INTEGER)")
+    conn.executemany("INSERT INTO barang (nama, harga, kategori, ukuran, stok) VALUES (?, ?, ?, ?, ?)", BARANG)
+    conn.executemany("INSERT INTO ongkir (kota, biaya) VALUES (?, ?)", ONGKIR)
+    install_low_stock_tracking(conn, default_threshold=5)
+    init_order_tables(conn)
+    install_variants(conn, "ukuran")
+    conn.commit()
+    conn.close()
+    return path
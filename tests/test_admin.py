@@ -0,0 +1,19 @@
+from flask import Flask
+
+import settings
+from admin import is_admin
+
+app = Flask(__name__)
+
+
+def check(monkeypatch, token, **request):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", token)
+    with app.test_request_context("/", **request):
+        return is_admin()
+
+
+def test_tokens_are_compared_as_bytes(monkeypatch):
+    assert check(monkeypatch, "rahasia", query_string={"token": "rahasia"})
+    assert not check(monkeypatch, "rahasia", query_string={"token": "rahasiä"})
+    assert check(monkeypatch, "kunci-é", query_string={"token": "kunci-é"})
+    assert not check(monkeypatch, "kunci-é", headers={"Authorization": "Bearer kunci-e"})
@@ -0,0 +1,20 @@
+import time
+
+from audit_log import AuditLog
+
+
+def wait_for(log, written):
+    deadline = time.time() + 5
+    while log.written < written and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_invalid_records_do_not_stop_the_writer(tmp_path):
+    log = AuditLog(str(tmp_path / "audit.db"), batch_size=10, flush_interval_ms=10)
+    log.record({"tenant": "sales", "endpoint": "ask", "body": {"question": 123}})
+    log.record({"tenant": "sales", "endpoint": "ask", "body": {"question": "Harga baju?"}}, "Rp100,000")
+    wait_for(log, 1)
+    log.record({"tenant": "sales", "endpoint": "ask", "body": {"question": "Ongkir Bandung?"}}, "Rp15,000")
+    wait_for(log, 2)
+    stats = log.stats()
+    assert (stats["written"], stats["invalid"], stats["dropped"]) == (2, 1, 1)
@@ -0,0 +1,25 @@
+import io
+import sqlite3
+
+from catalog_import import CatalogImporter
+
+
+def test_names_must_be_text(store_db):
+    lines = ['{"barang": ["Baju Kemeja"], "varian": "XXL", "stok": 1}',
+             '{"barang": "", "varian": "XXL", "stok": 1}',
+             '{"barang": " Baju Kemeja ", "varian": "XXL", "stok": 4}']
+    report = CatalogImporter(store_db).import_stream("barang_varian", io.StringIO("\n".join(lines)), "jsonl")
+    assert (report["changed"], report["invalid"]) == (1, 2)
+    assert [error["line"] for error in report["errors"]] == [1, 2]
+    assert "must be a name" in report["errors"][0]["error"]
+
+
+def test_empty_csv_fields_are_null_unless_required(store_db):
+    csv = "nama,harga,kategori,ukuran,stok\nKaos,60000,,M,7\n,10000,Pakaian,M,1\nJaket,,Pakaian,,\n"
+    report = CatalogImporter(store_db).import_stream("barang", io.StringIO(csv), "csv")
+    assert (report["changed"], report["invalid"]) == (2, 1)
+    assert report["errors"] == [{"line": 3, "error": "empty value"}]
+    conn = sqlite3.connect(store_db)
+    rows = conn.execute("SELECT nama, harga, kategori, stok FROM barang WHERE id > 3 ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [("Kaos", 60000, None, 7), ("Jaket", None, "Pakaian", None)]
@@ -0,0 +1,63 @@
+import sqlite3
+import zlib
+
+import numpy as np
+from langchain_core.documents import Document
+
+from catalog_version import get_catalog_version, install_version_tracking
+from embedding_queue import EmbeddingQueue, init_embedding_queue, row_documents
+from hnsw_index import HNSWVectorStore
+from vector_backends import sync_documents
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(zlib.crc32(text.encode())).standard_normal(8).tolist()
+
+
+def catalog_documents():
+    return [Document(page_content="Barang yang tersedia: ...", metadata={"source": "product_info"}),
+            Document(page_content="Ongkos kirim: ...", metadata={"source": "shipping_info"})]
+
+
+def stored_ids(store):
+    return sorted(doc.id for doc in store.similarity_search("barang", k=20))
+
+
+def open_store(db, snapshot):
+    store = HNSWVectorStore(FakeEmbeddings(), snapshot)
+    sync_documents(store, catalog_documents(), get_catalog_version(db), rows_fn=lambda: row_documents(db))
+    if store.rebuilding:
+        store._rebuilding.join()
+    return store
+
+
+def test_queued_rows_survive_a_restart(store_db, tmp_path):
+    conn = sqlite3.connect(store_db)
+    install_version_tracking(conn, ["barang", "ongkir"])
+    init_embedding_queue(conn)
+    conn.executemany("INSERT INTO embedding_queue VALUES ('barang', ?, 0)", [(1,), (2,), (3,)])
+    conn.commit()
+    snapshot = str(tmp_path / "store.hnsw")
+
+    store = open_store(store_db, snapshot)
+    queue = EmbeddingQueue(store_db, store, documents_fn=catalog_documents,
+                           documents_version=get_catalog_version(store_db))
+    assert queue.drain_once(conn) == 3
+    store.delete(["barang:3"])
+    assert queue.save_once() and not queue.save_once()
+    expected = ["barang:1", "barang:2", "catalog:product_info", "catalog:shipping_info"]
+    assert stored_ids(store) == expected
+
+    # Same catalog version: the snapshot is loaded as saved
+    assert stored_ids(open_store(store_db, snapshot)) == expected
+
+    # A newer catalog: rebuilt from the catalog documents and every embedded row
+    conn.execute("UPDATE barang SET harga = harga + 1 WHERE id = 1")
+    conn.execute("DELETE FROM barang WHERE id = 3")
+    conn.commit()
+    conn.close()
+    assert stored_ids(open_store(store_db, snapshot)) == expected
@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+
+import pytest
+
+import orders
+from orders import OrderError, OrderWriter, _Checkout, cart_answer, cart_from_question, quote_cart
+
+
+def stock(path, nama):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT stok FROM barang WHERE nama = ?", (nama,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_quote_applies_shipping_and_discount(store_db):
+    conn = sqlite3.connect(store_db)
+    quote = quote_cart(conn, [{"nama": "baju kemeja", "qty": 4, "ukuran": "m"}], "jakarta")
+    conn.close()
+    assert quote["items"][0]["ukuran"] == "M"
+    assert (quote["kota"], quote["subtotal"], quote["diskon"], quote["ongkir"]) == ("Jakarta", 400000, 40000, 20000)
+    assert quote["total"] == 380000
+
+
+@pytest.mark.parametrize("items, kota", [
+    ([{"nama": "Baju Kemeja", "qty": 1}], ["Jakarta"]),
+    ([{"barang_id": "1", "qty": 1}], "Jakarta"),
+    ([{"nama": ["Baju Kemeja"], "qty": 1}], "Jakarta"),
+    ([{"nama": "Baju Kemeja", "qty": True}], "Jakarta"),
+    ([{"nama": "Baju Kemeja", "qty": 1, "ukuran": {"M": 1}}], "Jakarta"),
+    ({"nama": "Baju Kemeja"}, "Jakarta"),
+])
+def test_quote_rejects_malformed_input(store_db, items, kota):
+    conn = sqlite3.connect(store_db)
+    with pytest.raises(OrderError):
+        quote_cart(conn, items, kota)
+    conn.close()
+
+
+def test_failing_checkout_does_not_fail_its_batch(store_db):
+    writer = OrderWriter(store_db, max_batch=3)
+    conn = sqlite3.connect(store_db, isolation_level=None)
+    batch = [
+        _Checkout([{"nama": "Baju Kemeja", "qty": 2}], "Jakarta", "good-1"),
+        _Checkout([{"nama": "Baju Kemeja", "qty": 1}], ["Jakarta"], "bad"),
+        _Checkout([{"nama": "Celana Cino", "qty": 1}], "Bandung", "good-2"),
+    ]
+    writer._run_batch(conn, batch)
+    conn.close()
+
+    assert batch[0].order["status"] == "placed" and batch[2].order["status"] == "placed"
+    assert batch[1].order is None and isinstance(batch[1].error, OrderError)
+    assert stock(store_db, "Baju Kemeja") == 48
+    assert stock(store_db, "Celana Cino") == 29
+    assert writer.stats()["placed"] == 2 and writer.stats()["rejected"] == 1
+
+
+def test_unexpected_error_fails_only_its_checkout(store_db, monkeypatch):
+    place_order = orders.place_order
+
+    def flaky(conn, items, kota, idempotency_key=None):
+        if idempotency_key == "broken":
+            conn.execute("UPDATE barang SET stok = stok - 1")
+            raise sqlite3.ProgrammingError("unsupported type")
+        return place_order(conn, items, kota, idempotency_key)
+
+    monkeypatch.setattr(orders, "place_order", flaky)
+    writer = OrderWriter(store_db)
+    conn = sqlite3.connect(store_db, isolation_level=None)
+    batch = [
+        _Checkout([{"nama": "Baju Kemeja", "qty": 1}], "Jakarta", "broken"),
+        _Checkout([{"nama": "Baju Kemeja", "qty": 1}], "Jakarta", "fine"),
+    ]
+    writer._run_batch(conn, batch)
+    conn.close()
+
+    assert isinstance(batch[0].error, sqlite3.ProgrammingError)
+    assert batch[1].error is None and batch[1].order["total"] == 120000
+    # The broken checkout's write was rolled back with its savepoint
+    assert stock(store_db, "Baju Kemeja") == 49
+
+
+def test_concurrent_checkouts_never_oversell(store_db):
+    conn = sqlite3.connect(store_db)
+    conn.execute("UPDATE barang_varian SET stok = 30 WHERE barang_id = 2 AND varian = 'L'")
+    conn.commit()
+    conn.close()
+    writer = OrderWriter(store_db, max_batch=16, max_wait_ms=2).start()
+    placed, out_of_stock = [], []
+
+    def buy():
+        try:
+            placed.append(writer.checkout([{"nama": "Celana Cino", "qty": 2, "ukuran": "L"}], "Surabaya"))
+        except orders.OutOfStock:
+            out_of_stock.append(1)
+
+    threads = [threading.Thread(target=buy) for _ in range(40)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 30 in stock and 40 x 2 ordered
+    assert len(placed) == 15 and len(out_of_stock) == 25
+    assert stock(store_db, "Celana Cino") == 0
+    conn = sqlite3.connect(store_db)
+    sold = conn.execute("SELECT SUM(qty) FROM order_items WHERE nama = 'Celana Cino'").fetchone()[0]
+    conn.close()
+    assert sold == 30
+
+
+def test_idempotency_key_replays_the_first_order(store_db):
+    writer = OrderWriter(store_db, max_wait_ms=0).start()
+    cart = [{"nama": "Baju Kemeja", "qty": 3, "ukuran": "S"}]
+    first = writer.checkout(cart, "Bandung", idempotency_key="order-42")
+    again = writer.checkout(cart, "Bandung", idempotency_key="order-42")
+
+    assert first["replayed"] is False and again["replayed"] is True
+    assert again["id"] == first["id"] and again["total"] == first["total"]
+    assert stock(store_db, "Baju Kemeja") == 47
+    conn = sqlite3.connect(store_db)
+    assert conn.execute("SELECT COUNT(*) FROM orders WHERE idempotency_key = 'order-42'").fetchone()[0] == 1
+    conn.close()
+
+
+def test_cart_from_question(store_db):
+    conn = sqlite3.connect(store_db)
+    items, kota = cart_from_question(conn, "3 baju kemeja ukuran xl dan 2x Celana Cino (L) ke bandung?")
+    assert items == [{"nama": "Baju Kemeja", "qty": 3, "ukuran": "XL"}, {"nama": "Celana Cino", "qty": 2, "ukuran": "L"}]
+    assert kota == "Bandung"
+    assert cart_from_question(conn, "Topi Kinz ke Medan") == ([{"nama": "Topi Kinz"}], "Medan")
+    conn.close()
+
+
+def test_cart_answer_uses_checkout_prices(store_db):
+    conn = sqlite3.connect(store_db)
+    answer = cart_answer(conn, "Berapa total 4 Baju Kemeja size M ke Jakarta?")
+    assert answer.splitlines()[-1] == "- Total Shopping: Rp400,000 - Rp40,000 (10% discount) + Rp20,000 (Jakarta) = Rp380,000"
+    assert cart_answer(conn, "1 Celana Cino size XXL") == "Size XXL is not available for Celana Cino (M, L, XL)"
+    # Questions about an item without a quantity or destination go to the model
+    assert cart_answer(conn, "Apa warna Baju Kemeja?") is None
+    conn.close()
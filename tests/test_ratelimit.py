@@ -0,0 +1,25 @@
+from ratelimit import RateLimiter
+
+
+def test_budget_and_retry_after():
+    limiter = RateLimiter("llm", rate=1.0, burst=2)
+    assert [limiter.check("ip:a")[0] for _ in range(3)] == [True, True, False]
+    allowed, retry_after, remaining = limiter.check("ip:a")
+    assert not allowed and 0 < retry_after <= 1 and remaining == 0
+    assert limiter.check("ip:b")[0]
+
+
+def test_least_recently_seen_clients_are_evicted():
+    limiter = RateLimiter("page", rate=1.0, burst=1, max_clients=3)
+    for client in ("ip:a", "ip:b", "ip:c"):
+        limiter.check(client)
+    # a is seen again (even when limited), so b is the least recently seen
+    assert not limiter.check("ip:a")[0]
+    limiter.check("ip:d")
+    assert [c["client"] for c in limiter.clients()] == ["ip:a", "ip:c", "ip:d"]
+    assert limiter.stats()["tracked_clients"] == 3 and limiter.evicted == 1
+    # A limited client stays limited: it is never the one evicted
+    for i in range(100):
+        limiter.check(f"ip:new{i}")
+        assert not limiter.check("ip:a")[0]
+    assert len(limiter._clients) == 3
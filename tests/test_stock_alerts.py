@@ -0,0 +1,42 @@
+import sqlite3
+
+from stock_alerts import low_stock_items, set_threshold
+
+
+def events(conn):
+    return [row for row in conn.execute("SELECT barang_id, stok, stok_min, kind FROM stock_events ORDER BY id")]
+
+
+def test_seeded_items_below_threshold_are_low(store_db):
+    conn = sqlite3.connect(store_db)
+    # Thresholds of 5: only Topi Kinz (0 in stock) is low
+    assert [item["nama"] for item in low_stock_items(conn)] == ["Topi Kinz"]
+    # Rows that were there before tracking was installed log no event
+    assert events(conn) == []
+    conn.execute("INSERT INTO barang (nama, harga, stok) VALUES ('Kaos Polos', 60000, 2)")
+    assert events(conn) == [(4, 2, 5, "low")]
+    conn.close()
+
+
+def test_crossing_the_threshold_logs_one_event_each_way(store_db):
+    conn = sqlite3.connect(store_db)
+    conn.execute("UPDATE barang SET stok = 10 WHERE id = 2")
+    conn.execute("UPDATE barang SET stok = 4 WHERE id = 2")
+    # Staying low logs nothing
+    conn.execute("UPDATE barang SET stok = 3 WHERE id = 2")
+    conn.execute("UPDATE barang SET stok = 20 WHERE id = 2")
+    conn.commit()
+
+    assert events(conn) == [(2, 4, 5, "low"), (2, 20, 5, "restocked")]
+    assert [item["id"] for item in low_stock_items(conn)] == [3]
+    conn.close()
+
+
+def test_threshold_change_moves_items_in_and_out(store_db):
+    conn = sqlite3.connect(store_db)
+    assert set_threshold(conn, 2, 40)
+    assert [item["id"] for item in low_stock_items(conn)] == [2, 3]
+    assert set_threshold(conn, 2, 0)
+    assert not set_threshold(conn, 99, 1)
+    assert events(conn) == [(2, 30, 40, "low"), (2, 30, 0, "restocked")]
+    conn.close()
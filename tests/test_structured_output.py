@@ -0,0 +1,27 @@
+import json
+import sqlite3
+
+from structured_output import parse_cart, price_cart
+
+
+def test_model_prices_and_totals_are_ignored(store_db):
+    text = json.dumps({"items": [{"name": "Baju Kemeja", "qty": 4, "size": "M", "price": 1, "in_stock": True}],
+                       "city": "Jakarta", "shipping": 0, "total": 5})
+    cart = parse_cart(text)
+    assert cart == {"items": [{"nama": "Baju Kemeja", "qty": 4, "ukuran": "M"}], "kota": "Jakarta"}
+    conn = sqlite3.connect(store_db)
+    quote, answer = price_cart(conn, cart)
+    conn.close()
+    assert (quote["items"][0]["harga"], quote["ongkir"], quote["total"]) == (100000, 20000, 380000)
+    assert answer.endswith("= Rp380,000")
+
+
+def test_unpriceable_and_empty_carts(store_db):
+    conn = sqlite3.connect(store_db)
+    assert price_cart(conn, parse_cart('{"items": [{"name": "Jaket", "qty": 1}], "city": ""}'))[0] is None
+    quote, answer = price_cart(conn, parse_cart('{"items": [], "city": "Bandung"}'))
+    assert quote is None and answer == "Shipping Cost: Rp15,000 (destination: Bandung)"
+    quote, _ = price_cart(conn, parse_cart('{"items": [{"name": "Baju Kemeja", "qty": 4}], "city": ""}'),
+                          discount=False)
+    conn.close()
+    assert quote["diskon"] == 0 and quote["total"] - quote["ongkir"] == 400000
@@ -0,0 +1,62 @@
+import sqlite3
+
+from variants import install_variants, migrate_stock_flags
+
+SEEDS = {"Baju Kemeja": 50, "Celana Cino": 30, "Topi Kinz": 0}
+
+
+def variants(conn, barang_id):
+    return conn.execute("SELECT varian, stok FROM barang_varian WHERE barang_id = ? ORDER BY id", (barang_id,)).fetchall()
+
+
+def test_migration_splits_stock_over_variants(store_db):
+    conn = sqlite3.connect(store_db)
+    assert variants(conn, 1) == [("S", 13), ("M", 13), ("L", 12), ("XL", 12)]
+    assert variants(conn, 2) == [("M", 10), ("L", 10), ("XL", 10)]
+    assert variants(conn, 3) == [("All Size", 0)]
+    conn.close()
+
+
+def test_new_items_are_split_and_added_variants_start_empty(store_db):
+    conn = sqlite3.connect(store_db)
+    conn.execute("INSERT INTO barang (nama, harga, kategori, ukuran, stok) VALUES ('Kaos', 60000, 'Pakaian', 'M,L', 7)")
+    assert variants(conn, 4) == [("M", 4), ("L", 3)]
+    conn.execute("UPDATE barang SET ukuran = 'M,L,XL' WHERE id = 4")
+    assert variants(conn, 4) == [("M", 4), ("L", 3), ("XL", 0)]
+    conn.close()
+
+
+def flag_db(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "store.db"))
+    conn.execute("""CREATE TABLE barang (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        nama TEXT, harga INTEGER, kategori TEXT, ukuran TEXT, stok INTEGER)""")
+    conn.executemany("INSERT INTO barang (nama, harga, kategori, ukuran, stok) VALUES (?, 1, 'Pakaian', ?, ?)",
+                     [("Baju Kemeja", "S,M,L,XL", 1), ("Celana Cino", "M,L,XL", 1), ("Topi Kinz", "All Size", 0)])
+    return conn
+
+
+def test_stock_flags_become_counts_before_the_split(tmp_path):
+    conn = flag_db(tmp_path)
+    migrate_stock_flags(conn, "ukuran", SEEDS)
+    install_variants(conn, "ukuran")
+    assert variants(conn, 1) == [("S", 13), ("M", 13), ("L", 12), ("XL", 12)]
+    # Once per database: a later start (or the other app) leaves real counts of 1 alone
+    conn.execute("UPDATE barang SET stok = 1 WHERE id = 2")
+    migrate_stock_flags(conn, "ukuran", SEEDS)
+    assert conn.execute("SELECT stok FROM barang WHERE id = 2").fetchone() == (1,)
+    conn.close()
+
+
+def test_variants_split_from_a_flag_are_split_again(tmp_path):
+    # Variants installed from the flags, then the items migrated by an earlier sales app
+    conn = flag_db(tmp_path)
+    install_variants(conn, "ukuran")
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY)")
+    conn.execute("UPDATE barang SET stok = 50 WHERE id = 1")
+    conn.execute("UPDATE barang SET stok = 30 WHERE id = 2")
+    migrate_stock_flags(conn, "ukuran", SEEDS)
+    assert variants(conn, 1) == [("S", 13), ("M", 13), ("L", 12), ("XL", 12)]
+    assert variants(conn, 2) == [("M", 10), ("L", 10), ("XL", 10)]
+    assert variants(conn, 3) == [("All Size", 0)]
+    conn.close()
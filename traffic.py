@@ -0,0 +1,189 @@
+"""Per-request stage timings and the opt-in traffic recorder
+
+Every ``/ask`` and form question runs in a trace: retrieval, the wait for
+an LLM slot, generation and the first generated token (TTFT) are timed, and
+the ids of the retrieved documents are noted. The timings go back to the
+caller in a ``Server-Timing`` header.
+
+With ``TRAFFIC_LOG`` set, traces are also appended to that JSONL file (one
+JSON object per line with a ``request_id``, like the repo's requests.jsonl)
+by a background thread. ``benchmarks/bench_replay.py`` replays such a file.
+With ``AUDIT_DB`` set, they also go to the audit log with their answer
+(audit_log.py).
+"""
+import functools
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from flask import make_response, request
+
+import settings
+from audit_log import get_audit_log
+
+# Trace of the request being served in the current thread/context
+current_trace = ContextVar("traffic_trace", default=None)
+
+# Traces written per file write
+WRITE_BATCH = 256
+
+
+def note(**fields):
+    """Add fields to the current trace, if any"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+class stage:
+    """Context manager adding the enclosed block's milliseconds to a stage of the current trace"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        trace = current_trace.get()
+        if trace is not None:
+            stages = trace["stages"]
+            stages[self.name] = round(stages.get(self.name, 0.0) + (time.perf_counter() - self.start) * 1000, 3)
+
+
+def token_timer(config):
+    """config with a callback that records the current trace's time to first token"""
+    trace = current_trace.get()
+    if trace is None:
+        return config
+    from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+
+    class FirstToken(BaseCallbackHandler):
+        def on_llm_new_token(self, token, **kwargs):
+            trace["stages"].setdefault("ttft", round((time.perf_counter() - trace["_start"]) * 1000, 3))
+
+    handler = FirstToken()
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
+    else:
+        callbacks = list(callbacks or []) + [handler]
+    config["callbacks"] = callbacks
+    return config
+
+
+class TrafficRecorder:
+    """Appends finished traces to a JSONL file from a background thread"""
+
+    def __init__(self, path, sample=None):
+        self.path = path
+        self.sample = settings.TRAFFIC_SAMPLE if sample is None else sample
+        self._queue = queue.Queue(maxsize=10000)
+        self.recorded = 0
+        self.dropped = 0
+        threading.Thread(target=self._write, name="traffic-recorder", daemon=True).start()
+
+    def record(self, trace):
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            # Recording must never slow requests down
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(trace, ensure_ascii=False) + "\n" for trace in batch))
+            self.recorded += len(batch)
+
+    def stats(self):
+        return {"path": self.path, "recorded": self.recorded, "pending": self._queue.qsize(), "dropped": self.dropped}
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """The process-wide recorder, None unless TRAFFIC_LOG is set"""
+    global _recorder
+    if not settings.TRAFFIC_LOG:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            from tenants import shared
+
+            _recorder = shared("traffic", lambda: TrafficRecorder(settings.TRAFFIC_LOG))
+        return _recorder
+
+
+def _server_timing(stages):
+    return ", ".join(f"{name};dur={ms}" for name, ms in stages.items())
+
+
+def traced(endpoint):
+    """Trace (and record) the questions a view answers; endpoint is "ask" or "form"
+
+    Requests without a question (the plain page, a product search) are served
+    untraced.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if endpoint == "ask":
+                body = request.get_json(silent=True)
+                body = body if isinstance(body, dict) else {}
+                # Only text is traced; the view rejects or answers anything else untraced
+                body = {k: body[k] for k in ("question", "format", "session_id") if isinstance(body.get(k), str)}
+            else:
+                body = {"question": request.form.get("question")} if request.method == "POST" else {}
+            if not body.get("question"):
+                return view(*args, **kwargs)
+            if endpoint == "form" and request.cookies.get("session_id"):
+                body["session_id"] = request.cookies["session_id"]
+
+            trace = {
+                "request_id": uuid.uuid4().hex,
+                "ts": time.time(),
+                "tenant": request.blueprint,
+                "endpoint": endpoint,
+                "route": "/ask" if endpoint == "ask" else "/",
+                "body": body,
+                "doc_ids": [],
+                "stages": {},
+                "_start": time.perf_counter(),
+            }
+            token = current_trace.set(trace)
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                current_trace.reset(token)
+            trace["stages"]["total"] = round((time.perf_counter() - trace.pop("_start")) * 1000, 3)
+            trace["status"] = response.status_code
+            response.headers["Server-Timing"] = _server_timing(trace["stages"])
+            # The answer goes to the audit log only, not to replay files
+            answer = trace.pop("answer", None)
+            recorder = get_recorder()
+            if recorder is not None:
+                recorder.record(trace)
+            audit = get_audit_log()
+            if audit is not None:
+                audit.record(trace, answer)
+            return response
+        return wrapper
+    return decorator
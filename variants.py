@@ -0,0 +1,285 @@
+"""Product variants (sizes or brands) with their own stock
+
+``barang.ukuran`` (store and sales) and ``barang.merk`` (inventory) list an
+item's variants as comma-separated text. ``install_variants`` moves them
+into ``barang_varian``, one row per item and variant with its own stock
+count, and migrates the existing rows on first start. The item's stock is
+split evenly over its variants (the first ones get the remainder), so the
+variants add up to the item and nothing is counted twice; the real counts
+per variant come from the catalog import (``catalog_import.py
+barang_varian``). Items inserted with variants are split the same way, and
+a variant added to an existing item starts at 0.
+
+The text column stays writable, since imports and admins edit it. Triggers
+keep the two in step: changing the text adds or removes variant rows, and
+inserting or deleting a variant row edits the text. The triggers split
+the text with ``json_each`` (SQLite 3.38+, or an older build with JSON1)
+and share out stock with window functions, so nothing splits it in Python
+any more.
+
+Composite indexes serve the filtered lookups: ``(varian, stok, barang_id)``
+finds the items of one variant in stock, ``(harga, stok)`` a price range.
+``find_items`` answers "items in size M under Rp200.000 in stock" for the
+pages, and ``variant_context`` turns the variants, prices and items named in
+a question into short factual lines for the prompt.
+"""
+import re
+
+from catalog_names import matching, phrases, rp
+
+# Items listed in one line of variant_context
+MAX_CONTEXT_ITEMS = 20
+
+# "di bawah Rp200.000", "max 150rb", "lebih dari 1,5 juta", "under 200k"
+_PRICE = re.compile(
+    r"(?<!\w)(?P<op>di ?bawah|kurang dari|maks(?:imal)?|max(?:imal)?|under|below|<=?|"
+    r"di ?atas|lebih dari|min(?:imal)?|above|over|>=?)\s*(?:rp\.?\s*)?"
+    r"(?P<amount>\d+(?:[.,]\d+)*)\s*(?P<unit>rb|ribu|k|jt|juta)?\b"
+)
+_UNITS = {"rb": 1000, "ribu": 1000, "k": 1000, "jt": 1000000, "juta": 1000000}
+
+
+def _split(text):
+    """SQL table-valued expression with one row per comma-separated value of text
+
+    The text is turned into a JSON array for json_each; text that still is
+    not valid JSON (control characters) yields no rows.
+    """
+    escaped = rf"""replace(replace(replace(replace(replace({text}, '\', '\\'), '"', '\"'),
+                   char(9), ' '), char(10), ' '), char(13), ' ')"""
+    array = f"""'["' || replace({escaped}, ',', '","') || '"]'"""
+    return f"json_each(CASE WHEN json_valid({array}) THEN {array} ELSE '[]' END)"
+
+
+def _shares(rows):
+    """SELECT (barang_id, varian, stok) splitting each item's stock evenly over its variants
+
+    rows selects barang_id, varian, pos (order in the text) and stok; a
+    variant listed twice gets one share.
+    """
+    return f'''SELECT barang_id, varian, stok / n + (i < stok % n) FROM (
+                   SELECT barang_id, varian, stok,
+                          row_number() OVER (PARTITION BY barang_id ORDER BY min(pos)) - 1 AS i,
+                          count(*) OVER (PARTITION BY barang_id) AS n
+                   FROM ({rows}) GROUP BY barang_id, varian COLLATE NOCASE)
+               ORDER BY barang_id, i'''
+
+
+def install_variants(conn, column):
+    """Create barang_varian, its indexes and sync triggers; migrate barang.<column> once"""
+    c = conn.cursor()
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'barang_varian'").fetchone()
+    c.execute('''CREATE TABLE IF NOT EXISTS barang_varian (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    barang_id INTEGER NOT NULL REFERENCES barang(id),
+                    varian TEXT NOT NULL COLLATE NOCASE,
+                    stok INTEGER NOT NULL DEFAULT 0)''')
+    # Named like catalog_import's natural key indexes, so the import reuses it
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS barang_varian_natural_key ON barang_varian (barang_id, varian)")
+    c.execute("CREATE INDEX IF NOT EXISTS barang_varian_filter ON barang_varian (varian, stok, barang_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS barang_harga ON barang (harga, stok)")
+    c.execute("CREATE INDEX IF NOT EXISTS barang_nama_lower ON barang (lower(nama))")
+
+    shares = _shares(f"""SELECT NEW.id AS barang_id, trim(value) AS varian, key AS pos, COALESCE(NEW.stok, 0) AS stok
+                          FROM {_split(f'NEW.{column}')} WHERE trim(value) != ''""")
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS barang_varian_from_insert
+                  AFTER INSERT ON barang
+                  BEGIN INSERT OR IGNORE INTO barang_varian (barang_id, varian, stok) {shares}; END''')
+    # New variants start at 0 (their stock is already counted in the item's), dropped ones are deleted
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS barang_varian_from_update
+                  AFTER UPDATE OF {column} ON barang
+                  WHEN OLD.{column} IS NOT NEW.{column}
+                  BEGIN
+                      DELETE FROM barang_varian WHERE barang_id = NEW.id
+                          AND varian NOT IN (SELECT trim(value) FROM {_split(f'NEW.{column}')});
+                      INSERT OR IGNORE INTO barang_varian (barang_id, varian, stok)
+                          SELECT NEW.id, trim(value), 0 FROM {_split(f'NEW.{column}')} WHERE trim(value) != '';
+                  END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS barang_varian_from_delete
+                 AFTER DELETE ON barang
+                 BEGIN DELETE FROM barang_varian WHERE barang_id = OLD.id; END''')
+    # Variant rows written directly (imports) show up in the text column
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS barang_varian_to_text_insert
+                  AFTER INSERT ON barang_varian
+                  BEGIN
+                      UPDATE barang SET {column} = CASE WHEN trim(COALESCE({column}, '')) = '' THEN NEW.varian
+                                                        ELSE {column} || ',' || NEW.varian END
+                      WHERE id = NEW.barang_id
+                          AND NEW.varian COLLATE NOCASE NOT IN (SELECT trim(value) FROM {_split(column)});
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS barang_varian_to_text_delete
+                  AFTER DELETE ON barang_varian
+                  BEGIN
+                      UPDATE barang SET {column} = COALESCE((
+                          SELECT group_concat(varian, ',') FROM (
+                              SELECT varian FROM barang_varian WHERE barang_id = OLD.barang_id ORDER BY id)), '')
+                      WHERE id = OLD.barang_id
+                          AND OLD.varian COLLATE NOCASE IN (SELECT trim(value) FROM {_split(column)});
+                  END''')
+    if not exists:
+        migrate_variants(conn, column)
+
+
+def migrate_variants(conn, column):
+    """Add the variant rows of every item from its text column, sharing out its stock; existing rows are kept"""
+    conn.execute(f'''INSERT OR IGNORE INTO barang_varian (barang_id, varian, stok) {_shares(f"""
+                         SELECT b.id AS barang_id, trim(s.value) AS varian, s.key AS pos,
+                                COALESCE(b.stok, 0) AS stok
+                         FROM barang b, {_split(f'b.{column}')} s WHERE trim(s.value) != ''""")}''')
+
+
+
+def migrate_stock_flags(conn, column, seeds):
+    """Turn the in-stock flags (1 or 0) of older databases into the seed counts, once
+
+    ``seeds`` maps each seeded item name to its seed count; call this before
+    ``install_variants`` so the variants are split from the counts. Done is
+    recorded in ``catalog_meta`` ('stock_counts'), so the apps sharing one
+    database migrate it once, whichever starts first. A database with an
+    orders table had its items migrated by an earlier sales app; there and
+    anywhere else, variants split from a flag (an item with stock whose
+    variants add up to at most 1) are split again from the item's count.
+    """
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS catalog_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER)''')
+    if c.execute("SELECT 1 FROM catalog_meta WHERE key = 'stock_counts'").fetchone():
+        return
+    tables = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "orders" not in tables:
+        c.executemany("UPDATE barang SET stok = ? WHERE nama = ? AND stok = 1",
+                      [(count, nama) for nama, count in seeds.items()])
+    if "barang_varian" in tables and seeds:
+        shares = _shares(f"""SELECT b.id AS barang_id, trim(s.value) AS varian, s.key AS pos,
+                                    COALESCE(b.stok, 0) AS stok
+                             FROM barang b, {_split(f'b.{column}')} s WHERE trim(s.value) != ''""")
+        c.execute(f'''WITH share(barang_id, varian, stok) AS ({shares})
+                      UPDATE barang_varian SET stok = COALESCE((
+                          SELECT share.stok FROM share
+                          WHERE share.barang_id = barang_varian.barang_id AND barang_varian.varian = share.varian), 0)
+                      WHERE barang_id IN (
+                          SELECT b.id FROM barang b
+                          WHERE b.nama IN ({','.join('?' * len(seeds))}) AND b.stok > 1
+                              AND (SELECT sum(v.stok) FROM barang_varian v WHERE v.barang_id = b.id) <= 1)''',
+                  list(seeds))
+    c.execute("INSERT INTO catalog_meta (key, value) VALUES ('stock_counts', 1)")
+
+def find_items(conn, column, varian=None, min_harga=None, max_harga=None, in_stock=False, kategori=None,
+               nama=None, search=None, limit=None):
+    """Items matching every filter given, in catalog order, with their variants
+
+    ``varian`` matches one variant (case-insensitive); with ``in_stock`` that
+    variant and the item must both have stock. ``nama`` is a list of item
+    names (case-insensitive), ``search`` a part of a name. Each item lists
+    its variants under ``column`` and their counts under ``stok_varian``.
+    """
+    clauses, params = [], []
+    if varian:
+        clauses.append("b.id IN (SELECT barang_id FROM barang_varian WHERE varian = ?"
+                       + (" AND stok > 0)" if in_stock else ")"))
+        params.append(varian)
+    if min_harga is not None:
+        clauses.append("b.harga >= ?")
+        params.append(min_harga)
+    if max_harga is not None:
+        clauses.append("b.harga <= ?")
+        params.append(max_harga)
+    if in_stock:
+        clauses.append("b.stok > 0")
+    if kategori:
+        clauses.append("b.kategori = ?")
+        params.append(kategori)
+    if nama:
+        clauses.append(f"lower(b.nama) IN ({','.join('?' * len(nama))})")
+        params += [n.lower() for n in nama]
+    if search:
+        clauses.append("instr(lower(b.nama), ?) > 0")
+        params.append(search.lower())
+    selected = "FROM barang b" + ((" WHERE " + " AND ".join(clauses)) if clauses else "") + " ORDER BY b.id"
+    if limit:
+        selected += " LIMIT ?"
+        params.append(limit)
+    # Items first, then their variants in insertion order: a join returns one
+    # row per variant, which costs more to read than the second query
+    items = {row[0]: {"id": row[0], "nama": row[1], "harga": row[2], "kategori": row[3], column: [],
+                      "stok": row[4], "stok_varian": {}}
+             for row in conn.execute(f"SELECT b.id, b.nama, b.harga, b.kategori, b.stok {selected}", params)}
+    if not items:
+        return []
+    if clauses or limit:
+        variants = conn.execute("SELECT barang_id, varian, stok FROM barang_varian "
+                                f"WHERE barang_id IN (SELECT b.id {selected}) ORDER BY id", params)
+    else:
+        variants = conn.execute("SELECT barang_id, varian, stok FROM barang_varian ORDER BY id")
+    for barang_id, varian, stok in variants:
+        item = items.get(barang_id)
+        if item is not None:
+            item[column].append(varian)
+            item["stok_varian"][varian] = stok
+    return list(items.values())
+
+
+def parse_price_range(question):
+    """(min, max) Rp named in a question ("di bawah Rp200.000", "lebih dari 1,5 juta"); None when absent"""
+    low = high = None
+    for match in _PRICE.finditer(question.lower()):
+        amount, unit = match.group("amount"), match.group("unit")
+        if unit:
+            # "1,5 juta": the separator is a decimal point when a unit follows
+            whole, _, fraction = amount.replace(".", ",").partition(",")
+            value = int(float(f"{whole}.{fraction.replace(',', '') or 0}") * _UNITS[unit])
+        else:
+            value = int(re.sub(r"[.,]", "", amount))
+        op = match.group("op")
+        if op.startswith(("di bawah", "dibawah", "kurang", "maks", "max", "under", "below", "<")):
+            high = value
+        else:
+            low = value
+    return low, high
+
+
+def _availability(item, column):
+    if not item["stok"]:
+        return "habis"
+    return ", ".join(f"{v} {'tersedia' if item['stok_varian'][v] > 0 else 'habis'}" for v in item[column]) or "tersedia"
+
+
+def variant_context(conn, question, column):
+    """Facts about the items, variants and price range a question names, one per line"""
+    named = phrases(question)
+    if not named:
+        return ""
+    variants = matching(conn, "SELECT DISTINCT varian FROM barang_varian WHERE varian IN ({marks})", named)
+    names = matching(conn, "SELECT nama FROM barang WHERE lower(nama) IN ({marks})", named)
+    low, high = parse_price_range(question)
+
+    lines = []
+    if names:
+        for item in find_items(conn, column, nama=names):
+            lines.append(f"{item['nama']} ({rp(item['harga'])}), {column}: {_availability(item, column)}")
+        return "\n".join(lines)
+    if not variants and low is None and high is None:
+        return ""
+    price = " ".join(part for part in (low is not None and f"di atas {rp(low)}",
+                                       high is not None and f"di bawah {rp(high)}") if part)
+    for varian in variants or [None]:
+        items = find_items(conn, column, varian=varian, min_harga=low, max_harga=high, in_stock=True,
+                           limit=MAX_CONTEXT_ITEMS + 1)
+        label = " ".join(part for part in ("Barang", varian and f"{column} {varian}", price) if part)
+        listed = ", ".join(f"{i['nama']} ({rp(i['harga'])})" for i in items[:MAX_CONTEXT_ITEMS]) or "tidak ada"
+        more = " dan lainnya" if len(items) > MAX_CONTEXT_ITEMS else ""
+        lines.append(f"{label} yang tersedia: {listed}{more}")
+    return "\n".join(lines)
+
+
+def item_filters(args, column):
+    """find_items keyword arguments from query parameters (?<column>=M&max_harga=200000&in_stock=1)"""
+    return {
+        "varian": args.get(column) or args.get("varian"),
+        "min_harga": args.get("min_harga", type=int),
+        "max_harga": args.get("max_harga", type=int),
+        "in_stock": args.get("in_stock", "").lower() in ("1", "true", "yes"),
+        "kategori": args.get("kategori"),
+        "limit": min(args.get("limit", 100, type=int), 1000),
+    }
@@ -0,0 +1,121 @@
+"""Vector store selection for the assistant apps
+
+``VECTOR_BACKEND=chroma`` (default) keeps the Chroma collections the apps
+always used; ``VECTOR_BACKEND=flat`` swaps in ``FlatVectorStore`` with
+``VECTOR_DTYPE`` storage and ``VECTOR_RESCORE`` re-scoring;
+``VECTOR_BACKEND=hnsw`` serves an ``HNSWVectorStore`` snapshot file.
+
+The catalog documents built by the apps get the stable id
+``catalog:<source>``, so ``refresh_documents`` can replace them in place when
+the catalog changes while the app runs.
+"""
+import settings
+from memory_report import measure_load
+
+
+def make_vector_store(embeddings, collection_name, persist_directory=None, backend=None, snapshot_path=None):
+    """Open the configured vector store; without persist_directory it lives in memory"""
+    # The RSS growth while opening shows up in /debug/memory
+    return measure_load(
+        f"vector_store:{collection_name}",
+        lambda: _open_vector_store(embeddings, collection_name, persist_directory, backend, snapshot_path),
+    )
+
+
+def _open_vector_store(embeddings, collection_name, persist_directory, backend, snapshot_path):
+    backend = backend or settings.VECTOR_BACKEND
+    if backend == "flat":
+        from flat_store import FlatVectorStore
+
+        return FlatVectorStore(
+            embeddings,
+            collection_name=collection_name,
+            persist_directory=persist_directory,
+            dtype=settings.VECTOR_DTYPE,
+            rescore=settings.VECTOR_RESCORE,
+        )
+    if backend == "hnsw":
+        from hnsw_index import HNSWVectorStore
+
+        return HNSWVectorStore(
+            embeddings,
+            snapshot_path or f"{collection_name}.hnsw",
+            M=settings.HNSW_M,
+            ef_construction=settings.HNSW_EF_CONSTRUCTION,
+            ef_search=settings.HNSW_EF_SEARCH,
+        )
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+        )
+    raise ValueError(f"Unknown vector backend '{backend}'")
+
+
+def document_count(vector_store):
+    """Number of documents in the store"""
+    collection = getattr(vector_store, "_collection", None)
+    if collection is not None:
+        return collection.count()
+    return len(vector_store)
+
+
+def is_empty(vector_store):
+    """True when the store holds no documents yet"""
+    return document_count(vector_store) == 0
+
+
+def _with_ids(documents):
+    for doc in documents:
+        if not doc.id:
+            doc.id = f"catalog:{doc.metadata['source']}"
+    return documents
+
+
+def sync_documents(vector_store, documents, catalog_version, rows_fn=None):
+    """Fill an empty store; returns True when documents were added right away
+
+    A snapshot store built from an older catalog keeps serving while the new
+    snapshot is built in the background. rows_fn() gives the documents of
+    the rows embedded one by one (embedding_queue.row_documents); it is only
+    called when the store is built.
+    """
+    documents = _with_ids(documents)
+
+    def all_documents():
+        return documents + (rows_fn() if rows_fn is not None else [])
+
+    if is_empty(vector_store):
+        if hasattr(vector_store, "build"):
+            vector_store.build(all_documents(), catalog_version)
+        else:
+            vector_store.add_documents(all_documents())
+        return True
+    if hasattr(vector_store, "is_stale") and vector_store.is_stale(catalog_version):
+        vector_store.rebuild_in_background(all_documents, catalog_version)
+    return False
+
+
+def refresh_documents(vector_store, documents):
+    """Replace the catalog documents with documents, re-embedding only those
+
+    Documents of the same sources stored under other ids (added before the
+    ids were stable) are deleted.
+    """
+    documents = _with_ids(documents)
+    ids = [doc.id for doc in documents]
+    sources = sorted({doc.metadata["source"] for doc in documents})
+    if hasattr(vector_store, "ids_with_sources"):
+        stored = vector_store.ids_with_sources(sources)
+    else:
+        stored = vector_store.get(where={"source": {"$in": sources}}, include=[])["ids"]
+    vector_store.add_texts(
+        [doc.page_content for doc in documents], metadatas=[doc.metadata for doc in documents], ids=ids
+    )
+    stale = [doc_id for doc_id in stored if doc_id not in set(ids)]
+    if stale:
+        vector_store.delete(stale)
+    return len(documents)